@@ -0,0 +1,392 @@
+try:
+    import xml.etree.cElementTree as XML
+except ImportError:
+    import xml.etree.ElementTree as XML
+
+from xml.sax.saxutils import escape
+
+
+ENDPOINTS = {
+    'AVTransport': '/MediaRenderer/AVTransport/Control',
+    'RenderingControl': '/MediaRenderer/RenderingControl/Control',
+    'GroupRenderingControl': '/MediaRenderer/GroupRenderingControl/Control',
+    'DeviceProperties': '/DeviceProperties/Control',
+    'ContentDirectory': '/MediaServer/ContentDirectory/Control',
+    'ZoneGroupTopology': '/ZoneGroupTopology/Control',
+}
+
+ENVELOPE_START = b'<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"><s:Body>'
+ENVELOPE_END = b'</s:Body></s:Envelope>'
+
+BODY_TAG = '{http://schemas.xmlsoap.org/soap/envelope/}Body'
+FAULT_TAG = '{http://schemas.xmlsoap.org/soap/envelope/}Fault'
+UPNP_ERROR_PATH = 'detail/{urn:schemas-upnp-org:control-1-0}UPnPError/{urn:schemas-upnp-org:control-1-0}'
+
+# Marks an argument that has to be passed on every call.
+REQUIRED = object()
+
+
+class SoCoError(Exception):
+    """Base class for errors talking to a Sonos speaker."""
+
+
+class ResponseError(SoCoError):
+    """The speaker sent something that is neither a result nor a UPnP fault.
+
+    The raw response is kept in the response attribute.
+
+    """
+
+    def __init__(self, message, response=b''):
+        SoCoError.__init__(self, message)
+        self.response = response
+
+
+class UPnPError(SoCoError):
+    """A UPnP fault returned by the speaker.
+
+    Attributes:
+    code -- The UPnP error code, e.g. 402.
+    description -- The errorDescription, if the speaker sent one.
+    action -- The name of the action that failed.
+
+    """
+
+    def __init__(self, code, description='', action=''):
+        message = (action or 'Action') + ' failed with UPnP error ' + str(code)
+        if description:
+            message += ' (' + description + ')'
+
+        SoCoError.__init__(self, message)
+        self.code = code
+        self.description = description
+        self.action = action
+
+    def __reduce__(self):
+        # So the error survives pickling, e.g. from a shards worker process.
+        return (self.__class__, (self.code, self.description, self.action))
+
+
+class InvalidActionError(UPnPError):
+    """401: The speaker doesn't know the action."""
+
+
+class InvalidArgsError(UPnPError):
+    """402: An argument was missing, or had the wrong value or type."""
+
+
+class ActionFailedError(UPnPError):
+    """501: The action failed on the speaker."""
+
+
+class TransitionNotAvailableError(UPnPError):
+    """AVTransport 701: e.g. next or previous on a stream that can't skip."""
+
+
+class NoContentsError(UPnPError):
+    """AVTransport 702: There is nothing to play."""
+
+
+class IllegalSeekTargetError(UPnPError):
+    """AVTransport 711: The seek target is out of range."""
+
+
+class PlayModeNotSupportedError(UPnPError):
+    """AVTransport 712: The play mode isn't supported by the current source."""
+
+
+class IllegalMimeTypeError(UPnPError):
+    """AVTransport 714: The URI's content type can't be played."""
+
+
+class NoSuchObjectError(UPnPError):
+    """ContentDirectory 701: The object ID doesn't exist."""
+
+
+# Error codes 6xx and up mean different things in different services.
+UPNP_ERRORS = {
+    401: InvalidActionError,
+    402: InvalidArgsError,
+    501: ActionFailedError,
+    ('AVTransport', 701): TransitionNotAvailableError,
+    ('AVTransport', 702): NoContentsError,
+    ('AVTransport', 711): IllegalSeekTargetError,
+    ('AVTransport', 712): PlayModeNotSupportedError,
+    ('AVTransport', 714): IllegalMimeTypeError,
+    ('ContentDirectory', 701): NoSuchObjectError,
+}
+
+
+class Action(object):
+    """A UPnP action with a precompiled SOAP envelope template.
+
+    The static parts of the envelope are encoded to bytes once, when the
+    action is registered, so sending it only costs escaping the arguments
+    and joining a handful of byte strings.
+
+    Public functions:
+    envelope -- Build the SOAP envelope for a call.
+    succeeded -- Check whether a response acknowledges the action.
+    decode -- Get the out-arguments of a response, raising UPnP faults.
+    fault -- Turn a fault response into a UPnPError.
+
+    """
+
+    __slots__ = ('service', 'name', 'endpoint', 'arguments', 'headers', 'idempotent',
+                 '_fragments', '_defaults', '_response_tag', '_response_element')
+
+    def __init__(self, service, name, arguments=(), idempotent=None):
+        """ Arguments:
+        service -- The UPnP service name, e.g. 'AVTransport'.
+        name -- The action name, e.g. 'Play'.
+        arguments -- A sequence of (argument name, default) pairs, in the
+                     order the service expects them. Use REQUIRED as the
+                     default for arguments without one.
+        idempotent -- True if sending the action twice has the same effect as
+                      sending it once, so it's safe to retry. Defaults to
+                      True for getters (Get* and Browse).
+
+        """
+        urn = 'urn:schemas-upnp-org:service:' + service + ':1'
+
+        self.service = service
+        self.name = name
+        self.endpoint = ENDPOINTS[service]
+        self.arguments = tuple(arg for arg, default in arguments)
+        self.idempotent = idempotent if idempotent is not None else (name.startswith('Get') or name == 'Browse')
+        self.headers = {
+            'Content-Type': 'text/xml',
+            'SOAPACTION': '"' + urn + '#' + name + '"',
+        }
+
+        # fragments[i] goes before argument i's value; the last one closes
+        # the envelope.
+        fragments = []
+        current = ENVELOPE_START + ('<u:' + name + ' xmlns:u="' + urn + '">').encode('utf-8')
+        for arg in self.arguments:
+            fragments.append(current + ('<' + arg + '>').encode('utf-8'))
+            current = ('</' + arg + '>').encode('utf-8')
+        fragments.append(current + ('</u:' + name + '>').encode('utf-8') + ENVELOPE_END)
+
+        self._fragments = tuple(fragments)
+        self._defaults = tuple(default if default is REQUIRED else encode_argument(default)
+                               for arg, default in arguments)
+        self._response_tag = ('<u:' + name + 'Response').encode('utf-8')
+        self._response_element = '{' + urn + '}' + name + 'Response'
+
+    def envelope(self, arguments):
+        """ Build the SOAP envelope for a call.
+
+        Arguments:
+        arguments -- A dictionary of argument values. Values are XML escaped;
+                     booleans are sent as 1 or 0.
+
+        Returns:
+        The envelope, as UTF-8 encoded bytes.
+
+        """
+        parts = []
+        for fragment, arg, default in zip(self._fragments, self.arguments, self._defaults):
+            parts.append(fragment)
+            if arg in arguments:
+                parts.append(encode_argument(arguments[arg]))
+            elif default is REQUIRED:
+                raise TypeError(self.name + ' requires the ' + arg + ' argument')
+            else:
+                parts.append(default)
+        parts.append(self._fragments[-1])
+
+        return b''.join(parts)
+
+    def succeeded(self, response):
+        """ Check whether a raw response acknowledges this action.
+
+        Only looks for the <u:ActionResponse> tag near the start of the
+        response, rather than parsing or comparing the whole document. Faults
+        never contain it.
+
+        """
+        return response.find(self._response_tag, 0, 512) != -1
+
+    def decode(self, response):
+        """ Get the out-arguments of a response in a single pass.
+
+        The response is parsed once, and the out-arguments are read straight
+        from the children of the <u:ActionResponse> element instead of being
+        searched for across the whole document.
+
+        Faults are recognised by the same tag check as succeeded(), and their
+        error code is read without building the tree at all.
+
+        Returns:
+        A dictionary mapping out-argument names to their (string) values.
+        Empty elements are empty strings.
+
+        Raises:
+        UPnPError (or one of its subclasses) if the response is a fault.
+        ResponseError if the response can't be understood.
+
+        """
+        if response.find(self._response_tag, 0, 512) == -1:
+            error = self._scan_fault(response)
+            if error is not None:
+                raise error
+
+        result = self._body_element(response)
+
+        if result.tag == self._response_element:
+            return dict((child.tag, child.text or '') for child in result)
+        elif result.tag == FAULT_TAG:
+            raise self._fault(result)
+        else:
+            raise ResponseError('Unexpected ' + result.tag + ' in ' + self.name + ' response', response)
+
+    def fault(self, response):
+        """ Turn a fault response into a UPnPError (without raising it).
+
+        Returns:
+        The UPnPError, or None if the response isn't a UPnP fault.
+
+        """
+        error = self._scan_fault(response)
+        if error is not None:
+            return error
+
+        try:
+            result = self._body_element(response)
+        except ResponseError:
+            return None
+
+        if result.tag == FAULT_TAG:
+            return self._fault(result)
+
+    def _body_element(self, response):
+        """ Parse a response and return the first element in its Body. """
+        try:
+            envelope = XML.fromstring(response)
+        except XML.ParseError as e:
+            raise ResponseError('Invalid ' + self.name + ' response: ' + str(e), response)
+
+        for element in envelope:
+            if element.tag == BODY_TAG and len(element):
+                return element[0]
+
+        raise ResponseError('Empty ' + self.name + ' response', response)
+
+    def _scan_fault(self, response):
+        """ Read a UPnP fault straight from the raw response.
+
+        Handles the faults Sonos speakers send, with an unprefixed <errorCode>
+        element and no entities in the description. Anything else is left to
+        _fault, which parses the response.
+
+        Returns:
+        The UPnPError, or None if the response isn't such a fault.
+
+        """
+        if response.find(b'Fault>', 0, 512) == -1:
+            return None
+
+        code = _element_text(response, b'errorCode')
+        if code is None or not code.isdigit():
+            return None
+
+        description = _element_text(response, b'errorDescription') or b''
+        if b'&' in description:
+            return None
+
+        return self._error(int(code), description.decode('utf-8'))
+
+    def _fault(self, fault):
+        code = fault.findtext(UPNP_ERROR_PATH + 'errorCode')
+        description = fault.findtext(UPNP_ERROR_PATH + 'errorDescription') or ''
+
+        try:
+            code = int(code)
+        except (TypeError, ValueError):
+            return UPnPError(code, fault.findtext('faultstring') or description, self.name)
+
+        return self._error(code, description)
+
+    def _error(self, code, description):
+        error = UPNP_ERRORS.get((self.service, code)) or UPNP_ERRORS.get(code, UPnPError)
+
+        return error(code, description, self.name)
+
+
+def _element_text(document, tag):
+    """ Get the raw text of the first <tag> element in a document, or None. """
+    start = document.find(b'<' + tag + b'>')
+    if start == -1:
+        return None
+
+    start += len(tag) + 2
+    end = document.find(b'</' + tag + b'>', start)
+
+    return document[start:end] if end != -1 else None
+
+
+def encode_argument(value):
+    """ Convert an argument value to escaped UTF-8 bytes. """
+    if value is True:
+        value = '1'
+    elif value is False:
+        value = '0'
+    elif not isinstance(value, str):
+        value = str(value)
+
+    return escape(value).encode('utf-8')
+
+
+ACTIONS = {}
+
+
+def register(service, name, arguments=(), idempotent=None):
+    """ Register an action so it can be looked up in ACTIONS by name. See Action. """
+    action = Action(service, name, arguments, idempotent)
+    ACTIONS[name] = action
+    return action
+
+
+register('AVTransport', 'SetAVTransportURI', [('InstanceID', 0), ('CurrentURI', REQUIRED), ('CurrentURIMetaData', '')])
+register('AVTransport', 'Play', [('InstanceID', 0), ('Speed', 1)])
+register('AVTransport', 'Pause', [('InstanceID', 0), ('Speed', 1)], idempotent=True)
+register('AVTransport', 'Stop', [('InstanceID', 0), ('Speed', 1)], idempotent=True)
+register('AVTransport', 'Next', [('InstanceID', 0), ('Speed', 1)])
+register('AVTransport', 'Previous', [('InstanceID', 0), ('Speed', 1)])
+register('AVTransport', 'SetPlayMode', [('InstanceID', 0), ('NewPlayMode', REQUIRED)], idempotent=True)
+register('AVTransport', 'StartAutoplay', [('InstanceID', 0), ('ProgramURI', REQUIRED), ('ProgramMetaData', ''), ('Volume', REQUIRED), ('IncludeLinkedZones', 0), ('ResetVolumeAfter', 1)])
+register('AVTransport', 'GetPositionInfo', [('InstanceID', 0), ('Channel', 'Master')])
+register('AVTransport', 'GetMediaInfo', [('InstanceID', 0)])
+register('AVTransport', 'GetTransportInfo', [('InstanceID', 0)])
+register('AVTransport', 'Seek', [('InstanceID', 0), ('Unit', 'REL_TIME'), ('Target', REQUIRED)], idempotent=True)
+register('AVTransport', 'AddMultipleURIsToQueue', [('InstanceID', 0), ('UpdateID', 0), ('NumberOfURIs', REQUIRED), ('EnqueuedURIs', REQUIRED), ('EnqueuedURIsMetaData', ''), ('ContainerURI', ''), ('ContainerMetaData', ''), ('DesiredFirstTrackNumberEnqueued', 0), ('EnqueueAsNext', 0)])
+register('AVTransport', 'RemoveTrackRangeFromQueue', [('InstanceID', 0), ('UpdateID', 0), ('StartingIndex', REQUIRED), ('NumberOfTracks', REQUIRED)])
+register('AVTransport', 'ReorderTracksInQueue', [('InstanceID', 0), ('StartingIndex', REQUIRED), ('NumberOfTracks', REQUIRED), ('InsertBefore', REQUIRED), ('UpdateID', 0)])
+register('AVTransport', 'RemoveAllTracksFromQueue', [('InstanceID', 0)], idempotent=True)
+register('AVTransport', 'SaveQueue', [('InstanceID', 0), ('Title', REQUIRED), ('ObjectID', '')])
+register('AVTransport', 'BecomeCoordinatorOfStandaloneGroup', [('InstanceID', 0)], idempotent=True)
+
+register('RenderingControl', 'SetMute', [('InstanceID', 0), ('Channel', 'Master'), ('DesiredMute', REQUIRED)], idempotent=True)
+register('RenderingControl', 'SetVolume', [('InstanceID', 0), ('Channel', 'Master'), ('DesiredVolume', REQUIRED)], idempotent=True)
+register('RenderingControl', 'SetRelativeVolume', [('InstanceID', 0), ('Channel', 'Master'), ('Adjustment', REQUIRED)])
+register('RenderingControl', 'GetMute', [('InstanceID', 0), ('Channel', 'Master')])
+register('RenderingControl', 'GetVolume', [('InstanceID', 0), ('Channel', 'Master')])
+register('RenderingControl', 'SetBass', [('InstanceID', 0), ('DesiredBass', REQUIRED)], idempotent=True)
+register('RenderingControl', 'GetBass', [('InstanceID', 0), ('Channel', 'Master')])
+register('RenderingControl', 'SetTreble', [('InstanceID', 0), ('DesiredTreble', REQUIRED)], idempotent=True)
+register('RenderingControl', 'GetTreble', [('InstanceID', 0), ('Channel', 'Master')])
+register('RenderingControl', 'SetLoudness', [('InstanceID', 0), ('Channel', 'Master'), ('DesiredLoudness', REQUIRED)], idempotent=True)
+register('RenderingControl', 'GetLoudness', [('InstanceID', 0), ('Channel', 'Master')])
+
+register('GroupRenderingControl', 'GetGroupVolume', [('InstanceID', 0)])
+register('GroupRenderingControl', 'SetGroupVolume', [('InstanceID', 0), ('DesiredVolume', REQUIRED)])
+register('GroupRenderingControl', 'SetRelativeGroupVolume', [('InstanceID', 0), ('Adjustment', REQUIRED)])
+register('GroupRenderingControl', 'SnapshotGroupVolume', [('InstanceID', 0)])
+
+register('DeviceProperties', 'SetLEDState', [('DesiredLEDState', REQUIRED)], idempotent=True)
+
+register('ZoneGroupTopology', 'GetZoneGroupState')
+
+register('ContentDirectory', 'GetSystemUpdateID')
+register('ContentDirectory', 'Browse', [('ObjectID', REQUIRED), ('BrowseFlag', 'BrowseDirectChildren'), ('Filter', '*'), ('StartingIndex', 0), ('RequestedCount', 100), ('SortCriteria', '')])
@@ -0,0 +1,425 @@
+import collections
+import hashlib
+import io
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    from urllib.parse import parse_qs, quote, urlparse
+except ImportError:
+    from urllib import quote
+    from urlparse import parse_qs, urlparse
+
+import requests
+
+try:
+    from PIL import Image
+except ImportError:
+    # Thumbnails need Pillow. Without it, the full-size image is served.
+    Image = None
+
+from soco import SoCo
+
+
+DEFAULT_ART_PATH = os.path.join(os.path.expanduser('~'), '.sonoshell', 'art')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS art (
+    url TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    content_type TEXT,
+    etag TEXT,
+    last_modified TEXT,
+    fetched REAL NOT NULL
+);
+"""
+
+Artwork = collections.namedtuple('Artwork', ['data', 'content_type', 'digest'])
+Artwork.__doc__ = """An album art image.
+
+data -- The image, as bytes.
+content_type -- Its MIME type, e.g. 'image/jpeg'.
+digest -- SHA-256 of data, which names it in the store and serves as its ETag.
+
+"""
+
+
+class ArtNotAllowed(ValueError):
+    """The URL is not on a known speaker, and external art is not allowed."""
+
+
+class AlbumArtCache(object):
+    """A local cache of album art, so clients don't fetch it from the speakers.
+
+    Images are stored on disk under their SHA-256 (so a cover shared by
+    every track of an album, or reached through several URLs, is kept once),
+    and the most recently used ones are also kept in memory, up to
+    memory_bytes. A URL fetched less than max_age seconds ago is served
+    without contacting the speaker; after that it's revalidated with a
+    conditional request, which costs the speaker a 304 when nothing changed.
+    If the speaker can't be reached, the stale copy is served.
+
+    Art is only fetched from the speakers given, so that the proxy can't be
+    used to reach other hosts on the network.
+
+    serve() starts a small HTTP proxy serving /art?url=<album art URL>
+    (and &size=<pixels> for a thumbnail, when Pillow is installed), and
+    proxy_url() rewrites a Track's album_art to point at it.
+
+    Public functions:
+    get -- Get an image, from the cache if possible.
+    proxy_url -- Get the URL the proxy serves an image on.
+    serve -- Start the HTTP proxy.
+    stop -- Stop the HTTP proxy.
+    close -- Stop the proxy and close the index.
+
+    """
+
+    def __init__(self, path=DEFAULT_ART_PATH, memory_bytes=32 * 1024 * 1024, max_age=24 * 3600,
+                 allow_external=False, speakers=None):
+        """ Arguments:
+        path -- Directory to store the images and their index in.
+        memory_bytes -- Maximum size of the images kept in memory.
+        max_age -- Seconds during which a fetched URL isn't revalidated.
+        allow_external -- Also fetch art that isn't on a known speaker, e.g.
+                          a streaming service's CDN. Off by default, so the
+                          proxy can't be used to reach arbitrary hosts.
+        speakers -- The IP addresses of the speakers art may be fetched from
+                    (on port 1400), or a function returning them, so that
+                    they can follow the speakers as they're found.
+
+        """
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        self.path = path
+        self.memory_bytes = memory_bytes
+        self.max_age = max_age
+        self.allow_external = allow_external
+        self.speakers = speakers if speakers is not None else ()
+
+        # Requests served from memory or disk, fetched in full, and
+        # revalidated with a 304.
+        self.hits = 0
+        self.fetched = 0
+        self.revalidated = 0
+
+        self._memory = collections.OrderedDict()
+        self._memory_size = 0
+        self._fetching = {}
+        self._lock = threading.Lock()
+        self._session = None
+        self._server = None
+
+        self._db = sqlite3.connect(os.path.join(path, 'index.db'), check_same_thread=False)
+        with self._db:
+            self._db.executescript(SCHEMA)
+
+    def get(self, url, size=None):
+        """ Get an album art image, from the cache if possible.
+
+        Arguments:
+        url -- The image's URL, e.g. a Track's album_art.
+        size -- Scale the image down to fit size x size pixels. Ignored
+                without Pillow.
+
+        Returns:
+        An Artwork.
+
+        Raises:
+        ArtNotAllowed if url isn't allowed (see speakers and allow_external).
+        requests.RequestException if it has to be fetched and can't be.
+
+        """
+        # Concurrent requests for the same URL wait for one fetch. The lock
+        # is dropped once nobody needs it, so _fetching doesn't grow with
+        # every URL ever requested.
+        with self._lock:
+            fetching = self._fetching.get(url)
+            if fetching is None:
+                fetching = self._fetching[url] = [threading.Lock(), 0]
+            fetching[1] += 1
+
+        try:
+            with fetching[0]:
+                artwork = self._get(url)
+        finally:
+            with self._lock:
+                fetching[1] -= 1
+                if not fetching[1]:
+                    del self._fetching[url]
+
+        if size and Image is not None:
+            artwork = self._thumbnail(artwork, int(size))
+
+        return artwork
+
+    def proxy_url(self, url, size=None):
+        """ Get the URL the running proxy serves an image on.
+
+        When the proxy listens on every interface, the URL uses the address
+        of the interface facing the image's host (i.e. the speakers' network).
+
+        """
+        if self._server is None:
+            raise RuntimeError('The album art proxy is not running')
+
+        host, port = self._server.server_address[:2]
+        if host in ('', '0.0.0.0'):
+            host = local_address(urlparse(url).hostname)
+        proxied = 'http://%s:%d/art?url=%s' % (host, port, quote(url, safe=''))
+
+        return proxied + '&size=%d' % size if size else proxied
+
+    def serve(self, host='127.0.0.1', port=0):
+        """ Serve the cache on http://host:port/art?url=...[&size=...] from a
+        background thread. Returns the port.
+        """
+        cache = self
+
+        class Handler(_ArtHandler):
+            source = cache
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        return self._server.server_address[1]
+
+    def stop(self):
+        """ Stop the HTTP proxy. """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def close(self):
+        """ Stop the proxy and close the index. """
+        self.stop()
+        with self._lock:
+            self._db.close()
+
+    def _get(self, url):
+        entry = self._entry(url)
+
+        if entry is not None and time.time() - entry['fetched'] < self.max_age:
+            data = self._read(entry['digest'])
+            if data is not None:
+                self.hits += 1
+                return Artwork(data, entry['content_type'], entry['digest'])
+            # The file is gone, so fetch it again in full.
+            entry = None
+
+        headers = {}
+        if entry is not None:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        try:
+            response = self._fetch(url, headers)
+        except requests.RequestException:
+            stale = self._read(entry['digest']) if entry is not None else None
+            if stale is None:
+                raise
+            return Artwork(stale, entry['content_type'], entry['digest'])
+
+        if response.status_code == 304 and entry is not None:
+            data = self._read(entry['digest'])
+            if data is not None:
+                self.revalidated += 1
+                self._touch(url)
+                return Artwork(data, entry['content_type'], entry['digest'])
+            response = self._fetch(url, {})
+
+        response.raise_for_status()
+        self.fetched += 1
+
+        data = response.content
+        content_type = response.headers.get('Content-Type', 'image/jpeg')
+        digest = self._write(data)
+        self._remember(digest, data)
+
+        with self._lock:
+            with self._db:
+                self._db.execute('INSERT OR REPLACE INTO art VALUES (?, ?, ?, ?, ?, ?)',
+                                 (url, digest, content_type, response.headers.get('ETag'),
+                                  response.headers.get('Last-Modified'), time.time()))
+
+        return Artwork(data, content_type, digest)
+
+    def _fetch(self, url, headers):
+        """ GET url, through SoCo's keep-alive pool when it's on a speaker. """
+        parsed = urlparse(url)
+        path = (parsed.path or '/') + ('?' + parsed.query if parsed.query else '')
+
+        speakers = self.speakers() if callable(self.speakers) else self.speakers
+        if parsed.scheme == 'http' and parsed.port == 1400 and parsed.hostname in speakers:
+            return SoCo.pool.get(parsed.hostname, path, headers=headers)
+
+        if not self.allow_external or parsed.scheme not in ('http', 'https'):
+            raise ArtNotAllowed('Not the album art of a known speaker: ' + url)
+
+        if self._session is None:
+            self._session = requests.Session()
+
+        return self._session.get(url, headers=headers, timeout=SoCo.pool._timeout())
+
+    def _entry(self, url):
+        with self._lock:
+            row = self._db.execute('SELECT digest, content_type, etag, last_modified, fetched FROM art WHERE url = ?',
+                                   (url,)).fetchone()
+
+        if row is None:
+            return None
+
+        return dict(zip(('digest', 'content_type', 'etag', 'last_modified', 'fetched'), row))
+
+    def _touch(self, url):
+        with self._lock:
+            with self._db:
+                self._db.execute('UPDATE art SET fetched = ? WHERE url = ?', (time.time(), url))
+
+    def _file(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def _read(self, key):
+        """ Get an image from memory, or from disk (keeping it in memory). """
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                return data
+
+        try:
+            with open(self._file(key), 'rb') as f:
+                data = f.read()
+        except IOError:
+            return None
+
+        self._remember(key, data)
+
+        return data
+
+    def _write(self, data, key=None):
+        """ Store an image under its digest (or key). Returns the key. """
+        if key is None:
+            key = hashlib.sha256(data).hexdigest()
+
+        path = self._file(key)
+        if not os.path.exists(path):
+            directory = os.path.dirname(path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+            # Write then rename, so a reader never sees half an image.
+            temporary = '%s.%d.%d' % (path, os.getpid(), threading.current_thread().ident)
+            with open(temporary, 'wb') as f:
+                f.write(data)
+            os.rename(temporary, path)
+
+        return key
+
+    def _remember(self, key, data):
+        """ Keep an image in memory, evicting the least recently used ones. """
+        if len(data) > self.memory_bytes:
+            return
+
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return
+
+            self._memory[key] = data
+            self._memory_size += len(data)
+
+            while self._memory_size > self.memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_size -= len(evicted)
+
+    def _thumbnail(self, artwork, size):
+        """ Get an image scaled down to fit size x size, made once and stored. """
+        key = '%s-%d' % (artwork.digest, size)
+
+        data = self._read(key)
+        if data is None:
+            image = Image.open(io.BytesIO(artwork.data))
+            image.thumbnail((size, size))
+
+            output = io.BytesIO()
+            image.convert('RGB').save(output, 'JPEG', quality=85)
+            data = output.getvalue()
+
+            self._write(data, key)
+            self._remember(key, data)
+
+        return Artwork(data, 'image/jpeg', key)
+
+
+def local_address(remote_host):
+    """ Get the address of the local interface that remote_host is reached through. """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        # Connecting a UDP socket sends nothing, it only picks the route.
+        sock.connect((remote_host or '127.0.0.1', 1400))
+        return sock.getsockname()[0]
+    except (socket.error, UnicodeError):
+        return '127.0.0.1'
+    finally:
+        sock.close()
+
+
+class _ArtHandler(BaseHTTPRequestHandler):
+    """Serves an AlbumArtCache on /art?url=...[&size=...]."""
+
+    source = None
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+
+        if parsed.path != '/art' or 'url' not in query:
+            return self._respond(404)
+
+        size = query.get('size', [None])[0]
+        if size is not None and not (size.isdigit() and int(size) > 0):
+            return self._respond(400)
+
+        try:
+            artwork = self.source.get(query['url'][0], int(size) if size else None)
+        except ArtNotAllowed:
+            return self._respond(403)
+        except Exception:
+            # The speaker couldn't be reached, or sent something that isn't
+            # an image.
+            return self._respond(502)
+
+        etag = '"' + artwork.digest + '"'
+        if self.headers.get('If-None-Match') == etag:
+            return self._respond(304, headers={'ETag': etag})
+
+        self._respond(200, artwork.data, {
+            'Content-Type': artwork.content_type,
+            'ETag': etag,
+            'Cache-Control': 'max-age=%d' % self.source.max_age,
+        })
+
+    def _respond(self, status, body=b'', headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,353 @@
+import asyncio
+import socket
+
+from actions import ACTIONS
+from models import Track, parse_speaker_info
+
+
+class AsyncConnectionPool(object):
+    """A pool of keep-alive asyncio connections to Sonos speakers.
+
+    Idle connections are kept per speaker and reused for the next request.
+    The number of requests in flight across all speakers is bounded by
+    max_concurrency so that one event loop can drive hundreds of speakers
+    without opening hundreds of sockets at once.
+
+    Public functions:
+    request -- Send an HTTP request to a speaker.
+    close -- Close every idle connection in the pool.
+
+    """
+
+    def __init__(self, max_concurrency=64, pool_size=4, connect_timeout=3.05,
+                 read_timeout=10):
+        """ Arguments:
+        max_concurrency -- Maximum number of requests in flight at once.
+        pool_size -- Maximum number of idle connections kept per speaker.
+        connect_timeout -- Seconds to wait for a connection to be established.
+        read_timeout -- Seconds to wait for the speaker to send a response.
+
+        """
+        self.max_concurrency = max_concurrency
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+        self._idle = {}
+        self._loop = None
+        self._semaphore = None
+
+    async def request(self, method, speaker_ip, path, body=b'', headers=None):
+        """ Send an HTTP request to http://speaker_ip:1400/path.
+
+        Returns:
+        A (status, body) tuple, where body is the raw response bytes.
+
+        """
+        self._bind_loop()
+
+        async with self._semaphore:
+            reused, conn = await self._acquire(speaker_ip)
+
+            try:
+                status, keep_alive, content = await self._exchange(conn, method, speaker_ip, path, body, headers)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                conn[1].close()
+                if not reused:
+                    raise
+                # The speaker closed the idle keep-alive connection under us,
+                # so retry once on a fresh one.
+                conn = await self._connect(speaker_ip)
+                try:
+                    status, keep_alive, content = await self._exchange(conn, method, speaker_ip, path, body, headers)
+                except BaseException:
+                    conn[1].close()
+                    raise
+            except BaseException:
+                conn[1].close()
+                raise
+
+            if keep_alive:
+                self._release(speaker_ip, conn)
+            else:
+                conn[1].close()
+
+            return status, content
+
+    def close(self):
+        """ Close every idle connection in the pool. """
+        for conns in self._idle.values():
+            for reader, writer in conns:
+                self._close(writer)
+
+        self._idle.clear()
+
+    def _bind_loop(self):
+        """ Close connections that belong to a previous event loop. """
+        loop = asyncio.get_running_loop()
+
+        if loop is not self._loop:
+            self.close()
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    @staticmethod
+    def _close(writer):
+        """ Close a connection, even if its event loop isn't running any more. """
+        # A transport only closes its socket from its own loop, which is
+        # usually closed by now (e.g. by asyncio.run), so shut the socket down
+        # directly to release the speaker's end.
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+        try:
+            writer.close()
+        except RuntimeError:
+            # The loop is closed; the socket is closed when the transport is
+            # garbage collected.
+            pass
+
+    async def _acquire(self, speaker_ip):
+        conns = self._idle.get(speaker_ip)
+
+        while conns:
+            reader, writer = conns.pop()
+            if not reader.at_eof() and not writer.is_closing():
+                return True, (reader, writer)
+            writer.close()
+
+        return False, await self._connect(speaker_ip)
+
+    async def _connect(self, speaker_ip):
+        return await asyncio.wait_for(asyncio.open_connection(speaker_ip, 1400), self.connect_timeout)
+
+    def _release(self, speaker_ip, conn):
+        conns = self._idle.setdefault(speaker_ip, [])
+
+        if len(conns) < self.pool_size:
+            conns.append(conn)
+        else:
+            conn[1].close()
+
+    async def _exchange(self, conn, method, speaker_ip, path, body, headers):
+        reader, writer = conn
+
+        lines = [method + ' ' + path + ' HTTP/1.1',
+                 'Host: ' + speaker_ip + ':1400',
+                 'Content-Length: ' + str(len(body))]
+        for name, value in (headers or {}).items():
+            lines.append(name + ': ' + value)
+
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+        return await asyncio.wait_for(self._read_response(reader), self.read_timeout)
+
+    async def _read_response(self, reader):
+        status_line = await reader.readuntil(b'\r\n')
+        version, status = status_line.split(None, 2)[:2]
+
+        response_headers = {}
+        while True:
+            line = await reader.readuntil(b'\r\n')
+            if line == b'\r\n':
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                if size == 0:
+                    # Skip any trailers.
+                    while await reader.readuntil(b'\r\n') != b'\r\n':
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            content = b''.join(chunks)
+        elif 'content-length' in response_headers:
+            content = await reader.readexactly(int(response_headers['content-length']))
+        else:
+            content = await reader.read()
+            response_headers['connection'] = 'close'
+
+        connection = response_headers.get('connection', '').lower()
+        if version == b'HTTP/1.0':
+            keep_alive = connection == 'keep-alive'
+        else:
+            keep_alive = connection != 'close'
+
+        return int(status), keep_alive, content
+
+
+class AsyncSoCo(object):
+    """An asyncio version of SoCo for controlling a Sonos speaker.
+
+    Every public function is a coroutine with the same arguments and return
+    values as its SoCo counterpart. All AsyncSoCo instances share one
+    AsyncConnectionPool, so gathering calls across many speakers runs them
+    concurrently with bounded parallelism.
+
+    Public functions:
+    play -- Plays the currently selected track or a music stream.
+    pause -- Pause the currently playing track.
+    stop -- Stop the currently playing track.
+    next -- Go to the next track.
+    previous -- Go back to the previous track.
+    mute -- Mute (or unmute) the speaker.
+    volume -- Get or set the volume of the speaker.
+    set_relative_volume -- Turn the volume of the speaker up or down.
+    bass -- Get or set the speaker's bass EQ.
+    treble -- Get or set the speaker's treble EQ.
+    set_loudness -- Turn on (or off) the speaker's loudness compensation.
+    status_light -- Turn on (or off) the Sonos status light.
+    get_current_track_info -- Get information about the currently playing track.
+    get_speaker_info -- Get information about the Sonos speaker.
+
+    """
+
+    pool = AsyncConnectionPool()
+
+    def __init__(self, speaker_ip):
+        self.speaker_ip = speaker_ip
+        self.speaker_info = None
+
+    async def play(self, uri=''):
+        """ Play the currently selected track or play a stream. See SoCo.play. """
+        if uri != '':
+            result = await self._call('SetAVTransportURI', CurrentURI=uri)
+
+            if result is not True:
+                return result
+
+        return await self._call('Play')
+
+    async def pause(self):
+        """ Pause the currently playing track. See SoCo.pause. """
+        return await self._call('Pause')
+
+    async def stop(self):
+        """ Stop the currently playing track. See SoCo.stop. """
+        return await self._call('Stop')
+
+    async def next(self):
+        """ Go to the next track. See SoCo.next. """
+        return await self._call('Next')
+
+    async def previous(self):
+        """ Go back to the previously played track. See SoCo.previous. """
+        return await self._call('Previous')
+
+    async def mute(self, mute):
+        """ Mute or unmute the Sonos speaker. See SoCo.mute. """
+        return await self._call('SetMute', DesiredMute=mute is True)
+
+    async def volume(self, volume=False):
+        """ Get or set the Sonos speaker volume. See SoCo.volume. """
+        if volume is not False:
+            return await self._call('SetVolume', DesiredVolume=volume)
+        else:
+            return int((await self._query('GetVolume'))['CurrentVolume'])
+
+    async def set_relative_volume(self, adjustment):
+        """ Turn the volume up or down. See SoCo.set_relative_volume. """
+        return int((await self._query('SetRelativeVolume', Adjustment=adjustment))['NewVolume'])
+
+    async def bass(self, bass=''):
+        """ Get or set the Sonos speaker's bass EQ. See SoCo.bass. """
+        if bass != '':
+            return await self._call('SetBass', DesiredBass=bass)
+        else:
+            return int((await self._query('GetBass'))['CurrentBass'])
+
+    async def treble(self, treble=False):
+        """ Get or set the Sonos speaker's treble EQ. See SoCo.treble. """
+        if treble is not False:
+            return await self._call('SetTreble', DesiredTreble=treble)
+        else:
+            return int((await self._query('GetTreble'))['CurrentTreble'])
+
+    async def set_loudness(self, loudness):
+        """ Set the Sonos speaker's loudness compensation. See SoCo.set_loudness. """
+        return await self._call('SetLoudness', DesiredLoudness=loudness is True)
+
+    async def status_light(self, led_on):
+        """ Turn on (or off) the white Sonos status light. See SoCo.status_light. """
+        led_state = 'On' if led_on is True else 'Off'
+
+        return await self._call('SetLEDState', DesiredLEDState=led_state)
+
+    async def get_current_track_info(self):
+        """ Get information about the currently playing track.
+
+        See SoCo.get_current_track_info.
+
+        """
+        position = await self._query('GetPositionInfo')
+
+        return Track(position.get('Track', ''),
+                     position.get('TrackDuration', ''),
+                     position.get('TrackURI', ''),
+                     position.get('TrackMetaData', ''),
+                     'http://' + self.speaker_ip + ':1400',
+                     position.get('RelTime', ''))
+
+    async def get_speaker_info(self, refresh=False):
+        """ Get information about the Sonos speaker. See SoCo.get_speaker_info. """
+        if self.speaker_info is not None and refresh is False:
+            return self.speaker_info
+
+        status, content = await self.pool.request('GET', self.speaker_ip, '/status/zp')
+
+        self.speaker_info = parse_speaker_info(content)
+
+        return self.speaker_info
+
+    async def _call(self, name, **arguments):
+        """ Send an action that has no out-arguments.
+
+        Returns:
+        True if the Sonos speaker acknowledged the action, otherwise the parsed
+        UPnP error code (or the raw response if it couldn't be parsed).
+
+        """
+        response = await self._send_command(name, **arguments)
+
+        if ACTIONS[name].succeeded(response):
+            return True
+        else:
+            return self._parse_error(name, response)
+
+    async def _query(self, name, **arguments):
+        """ Send an action and decode its out-arguments. See SoCo.__query. """
+        return ACTIONS[name].decode(await self._send_command(name, **arguments))
+
+    async def _send_command(self, name, **arguments):
+        """ Send a registered action (see actions.ACTIONS) to the Sonos speaker.
+
+        Returns:
+        The raw response body returned by the Sonos speaker, as bytes.
+
+        """
+        action = ACTIONS[name]
+
+        status, content = await self.pool.request('POST', self.speaker_ip, action.endpoint, action.envelope(arguments), action.headers)
+
+        return content
+
+    @staticmethod
+    def _parse_error(name, response):
+        """ Parse an error returned from the Sonos speaker. See SoCo.__parse_error. """
+        error = ACTIONS[name].fault(response)
+
+        if error is not None:
+            return error.code
+        else:
+            # Unknown error, so just return the entire response
+            return response.decode('utf-8', 'replace')
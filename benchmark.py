@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""Benchmark SoCo against in-process fake speakers.
+
+Usage: benchmark.py [--iterations N] [--speakers N] [--latency MS] [--output FILE]
+
+Measures ops/sec and p50/p99 latency for every SoCo function, fan-out
+across N fake speakers (threaded, asyncio and sharded over worker
+processes), DIDL-Lite parsing and the cold start of sonoshell. The
+results are printed (or written to FILE) as JSON so runs can be compared
+between releases.
+"""
+
+try:
+    import xml.etree.cElementTree as XML
+except ImportError:
+    import xml.etree.ElementTree as XML
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from actions import ACTIONS, UPnPError
+from asyncsoco import AsyncSoCo
+from didl import iter_didl
+from fakespeaker import ENVELOPE, FAULT, FakeSpeaker, make_didl
+from fleet import SoCoFleet
+from metrics import Metrics
+from shards import ShardedController
+from soco import SoCo
+
+
+BENCHMARKS = []
+
+SONOSHELL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sonoshell')
+
+# Targets for the p50 of a cold sonoshell run, over the p50 of starting the
+# bare interpreter. `-v` must not import requests or an XML parser; a command
+# pays for those once, plus one request.
+COLD_START_TARGETS_MS = {
+    'version': 30,
+    'command': 200,
+}
+
+
+def benchmark(name):
+    """ Register a function as a benchmark setup. See run_benchmarks. """
+    def register(function):
+        BENCHMARKS.append((name, function))
+        return function
+    return register
+
+
+def measure(function, iterations, warmup=5):
+    """ Call function repeatedly and summarise the timings.
+
+    Returns:
+    A dictionary with ops_per_sec, p50_ms, p99_ms, mean_ms and iterations.
+
+    """
+    for _ in range(warmup):
+        function()
+
+    timings = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - t)
+    total = time.perf_counter() - started
+
+    return summarise(timings, total)
+
+
+def summarise(timings, total):
+    timings = sorted(timings)
+
+    return {
+        'iterations': len(timings),
+        'ops_per_sec': round(len(timings) / total, 2) if total else None,
+        'mean_ms': round(sum(timings) / len(timings) * 1000, 4),
+        'p50_ms': round(percentile(timings, 50) * 1000, 4),
+        'p99_ms': round(percentile(timings, 99) * 1000, 4),
+    }
+
+
+def percentile(sorted_values, pct):
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def speaker_ips(count):
+    """ Loopback addresses for count fake speakers, starting at 127.0.0.2. """
+    return ['127.0.%d.%d' % ((i + 2) // 256, (i + 2) % 256) for i in range(count)]
+
+
+@benchmark('soco')
+def soco_benchmarks(ctx):
+    sonos = SoCo(ctx.ips[0])
+
+    calls = [
+        ('play', lambda: sonos.play()),
+        ('play_uri', lambda: sonos.play('x-rincon-mp3radio://stream.example.com/radio.mp3')),
+        ('pause', lambda: sonos.pause()),
+        ('stop', lambda: sonos.stop()),
+        ('next', lambda: sonos.next()),
+        ('previous', lambda: sonos.previous()),
+        ('mute', lambda: sonos.mute(False)),
+        ('get_volume', lambda: sonos.volume()),
+        ('set_volume', lambda: sonos.volume(20)),
+        ('get_bass', lambda: sonos.bass()),
+        ('set_bass', lambda: sonos.bass(2)),
+        ('get_treble', lambda: sonos.treble()),
+        ('set_treble', lambda: sonos.treble(2)),
+        ('set_loudness', lambda: sonos.set_loudness(True)),
+        ('status_light', lambda: sonos.status_light(True)),
+        ('get_current_track_info', lambda: sonos.get_current_track_info()),
+        ('get_speaker_info', lambda: sonos.get_speaker_info(refresh=True)),
+        ('get_queue_50', lambda: list(sonos.get_queue())),
+        ('get_library_1000', lambda: list(sonos.get_library())),
+    ]
+
+    for name, function in calls:
+        yield name, measure(function, ctx.iterations)
+
+    uris = ['x-file-cifs://server/music/%d.mp3' % i for i in range(500)]
+
+    def build_queue():
+        sonos.clear_queue()
+        sonos.add_to_queue(uris)
+
+    yield 'build_queue_500', measure(build_queue, max(1, ctx.iterations // 10))
+
+    # The cost of recording every request, against get_volume above.
+    metrics = Metrics().install()
+    try:
+        yield 'get_volume_with_metrics', measure(lambda: sonos.volume(), ctx.iterations)
+    finally:
+        metrics.uninstall()
+
+
+@benchmark('fanout')
+def fanout_benchmarks(ctx):
+    iterations = max(1, ctx.iterations // 10)
+
+    with SoCoFleet(ctx.ips) as fleet:
+        yield 'fleet_pause', measure(lambda: fleet.pause(), iterations)
+        yield 'fleet_get_volume', measure(lambda: fleet.volume(), iterations)
+        yield 'fleet_relative_volume', measure(lambda: fleet.set_relative_volume(1), iterations)
+
+    speakers = [AsyncSoCo(ip) for ip in ctx.ips]
+    loop = asyncio.new_event_loop()
+
+    async def gather_all(method):
+        return await asyncio.gather(*[getattr(s, method)() for s in speakers])
+
+    def gather(method):
+        return loop.run_until_complete(gather_all(method))
+
+    try:
+        yield 'async_pause', measure(lambda: gather('pause'), iterations)
+        yield 'async_get_volume', measure(lambda: gather('volume'), iterations)
+    finally:
+        AsyncSoCo.pool.close()
+        loop.close()
+
+
+@benchmark('shards')
+def shard_benchmarks(ctx):
+    iterations = max(1, ctx.iterations // 10)
+
+    # The fake speakers answer from this process, so with many workers they
+    # become the bottleneck; add --latency to see the workers scale.
+    for processes in sorted(set([1, os.cpu_count() or 1])):
+        with ShardedController(ctx.ips, processes=processes, shard_by='ip') as controller:
+            yield 'sharded_get_volume_%d_processes' % processes, measure(lambda: controller.volume(), iterations)
+
+
+@benchmark('startup')
+def startup_benchmarks(ctx):
+    iterations = max(3, ctx.iterations // 20)
+
+    def cold_start(*args):
+        subprocess.run([sys.executable, '-W', 'ignore', SONOSHELL] + list(args), stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, check=True)
+
+    baseline = measure(lambda: subprocess.run([sys.executable, '-c', 'pass'], check=True), iterations, warmup=1)
+    yield 'python_baseline', baseline
+
+    runs = [
+        ('sonoshell_version', 'version', ('-v',)),
+        ('sonoshell_volume', 'command', (ctx.ips[0], 'volume')),
+        ('sonoshell_mute', 'command', (ctx.ips[0], 'mute', 'off')),
+    ]
+
+    for name, target, args in runs:
+        result = measure(lambda: cold_start(*args), iterations, warmup=1)
+        result['overhead_ms'] = round(result['p50_ms'] - baseline['p50_ms'], 4)
+        result['target_ms'] = COLD_START_TARGETS_MS[target]
+        result['within_target'] = result['overhead_ms'] <= result['target_ms']
+        yield name, result
+
+
+@benchmark('parse')
+def parse_benchmarks(ctx):
+    for count in (1, 100, 1000):
+        document = make_didl(count).encode('utf-8')
+        iterations = max(10, ctx.iterations * 10 // count)
+        yield 'didl_fromstring_%d_items' % count, measure(lambda: XML.fromstring(document), iterations)
+        yield 'didl_iter_%d_items' % count, measure(lambda: list(iter_didl(document)), iterations)
+
+
+@benchmark('parse')
+def response_benchmarks(ctx):
+    status, body = FakeSpeaker().handle_action('urn:schemas-upnp-org:service:AVTransport:1', 'GetPositionInfo', {})
+    position = body.encode('utf-8')
+    fault = (ENVELOPE % (FAULT % 701)).encode('utf-8')
+    action = ACTIONS['GetPositionInfo']
+    fields = ('Track', 'TrackDuration', 'TrackURI', 'TrackMetaData', 'RelTime')
+    iterations = ctx.iterations * 10
+
+    # The way responses were handled before Action.decode, for comparison.
+    def findtext():
+        dom = XML.fromstring(position)
+        return [dom.findtext('.//' + field) for field in fields]
+
+    def fault_findtext():
+        if not action.succeeded(fault):
+            return int(XML.fromstring(fault).findtext('.//{urn:schemas-upnp-org:control-1-0}errorCode'))
+
+    def fault_decode():
+        try:
+            action.decode(fault)
+        except UPnPError as e:
+            return e.code
+
+    yield 'position_info_findtext', measure(findtext, iterations)
+    yield 'position_info_decode', measure(lambda: action.decode(position), iterations)
+    yield 'fault_findtext', measure(fault_findtext, iterations)
+    yield 'fault_decode', measure(fault_decode, iterations)
+
+
+def run_benchmarks(iterations=200, speakers=8, latency=0.0, only=None):
+    """ Start the fake speakers and run every registered benchmark.
+
+    Arguments:
+    iterations -- Calls per single-speaker benchmark (fan-out uses a tenth).
+    speakers -- Number of fake speakers for the fan-out benchmarks.
+    latency -- Seconds of simulated latency added by every fake speaker.
+    only -- Optional list of benchmark group names to run.
+
+    Returns:
+    A JSON-serialisable dictionary of results.
+
+    """
+    ctx = argparse.Namespace(iterations=iterations, ips=speaker_ips(speakers))
+
+    fakes = [FakeSpeaker(ip, latency=latency, uid='RINCON_FAKE%05d01400' % i).start() for i, ip in enumerate(ctx.ips)]
+
+    results = {}
+    try:
+        for group, function in BENCHMARKS:
+            if only and group not in only:
+                continue
+            for name, result in function(ctx):
+                results[group + '.' + name] = result
+    finally:
+        for fake in fakes:
+            fake.stop()
+
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'iterations': iterations,
+            'speakers': speakers,
+            'latency_ms': latency * 1000,
+        },
+        'results': results,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark SoCo against in-process fake speakers.')
+    parser.add_argument('--iterations', type=int, default=200, help='calls per benchmark')
+    parser.add_argument('--speakers', type=int, default=8, help='fake speakers for fan-out')
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated speaker latency in ms')
+    parser.add_argument('--only', action='append', help='only run this benchmark group (repeatable)')
+    parser.add_argument('--output', help='write JSON results to this file instead of stdout')
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.iterations, args.speakers, args.latency / 1000.0, args.only)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
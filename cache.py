@@ -0,0 +1,92 @@
+import threading
+import time
+
+
+class StateCache(object):
+    """A read-through cache of one Sonos speaker's state.
+
+    Pass an instance to SoCo (SoCo(ip, cache=StateCache())) to have the
+    getters answer from the cache while a value is fresh. Setters that succeed
+    write the new value through to the cache, and events from an
+    events.Subscription can keep it current via on_event.
+
+    Cached fields are: volume, bass, treble, mute, loudness and track_info.
+
+    Public functions:
+    get -- Get a field if it is still fresh.
+    set -- Store a field.
+    invalidate -- Drop one field, or everything.
+    on_event -- Update the cache from an events.Event.
+
+    """
+
+    def __init__(self, ttl=1.0, ttls=None):
+        """ Arguments:
+        ttl -- Default number of seconds a cached value stays fresh.
+        ttls -- Dictionary of per-field overrides, e.g. {'track_info': 0.5}.
+
+        """
+        self.ttl = ttl
+        self.ttls = dict(ttls or {})
+
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, field):
+        """ Return the cached value of field, or None if missing or stale. """
+        with self._lock:
+            entry = self._values.get(field)
+
+            if entry is None:
+                return None
+
+            value, expires = entry
+            if time.monotonic() >= expires:
+                del self._values[field]
+                return None
+
+            return value
+
+    def set(self, field, value):
+        """ Store a value for field, fresh for that field's TTL. """
+        ttl = self.ttls.get(field, self.ttl)
+
+        with self._lock:
+            self._values[field] = (value, time.monotonic() + ttl)
+
+    def invalidate(self, field=None):
+        """ Drop a cached field, or every field if none is given. """
+        with self._lock:
+            if field is None:
+                self._values.clear()
+            else:
+                self._values.pop(field, None)
+
+    def on_event(self, event):
+        """ Update the cache from an events.Event.
+
+        Use it as (or call it from) a subscription callback, e.g.
+        events.subscribe(ip, 'RenderingControl', callback=cache.on_event).
+
+        """
+        variables = event.variables
+
+        if event.service == 'RenderingControl':
+            for name, field, convert in (('Volume', 'volume', int),
+                                         ('Mute', 'mute', _to_bool),
+                                         ('Loudness', 'loudness', _to_bool)):
+                if 'Master' in variables.get(name, {}):
+                    self.set(field, convert(variables[name]['Master']))
+
+            for name, field in (('Bass', 'bass'), ('Treble', 'treble')):
+                if variables.get(name) is not None:
+                    self.set(field, int(variables[name]))
+
+        elif event.service == 'AVTransport':
+            # The event doesn't carry everything get_current_track_info
+            # returns, so just make the next call fetch it again.
+            self.invalidate('track_info')
+
+
+def _to_bool(value):
+    return value == '1'
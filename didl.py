@@ -0,0 +1,117 @@
+try:
+    import xml.etree.cElementTree as XML
+except ImportError:
+    import xml.etree.ElementTree as XML
+
+import collections
+
+from sys import intern
+from xml.sax.saxutils import escape, quoteattr
+
+
+DIDL_NS = '{urn:schemas-upnp-org:metadata-1-0/DIDL-Lite/}'
+DC_NS = '{http://purl.org/dc/elements/1.1/}'
+UPNP_NS = '{urn:schemas-upnp-org:metadata-1-0/upnp/}'
+
+ITEM_TAG = DIDL_NS + 'item'
+CONTAINER_TAG = DIDL_NS + 'container'
+
+DIDL_TEMPLATE = ('<DIDL-Lite xmlns:dc="http://purl.org/dc/elements/1.1/" '
+                 'xmlns:upnp="urn:schemas-upnp-org:metadata-1-0/upnp/" '
+                 'xmlns:r="urn:schemas-rinconnetworks-com:metadata-1-0/" '
+                 'xmlns="urn:schemas-upnp-org:metadata-1-0/DIDL-Lite/">'
+                 '<item id=%s parentID=%s restricted="true">'
+                 '<dc:title>%s</dc:title><upnp:class>%s</upnp:class>'
+                 '<desc id="cdudn" nameSpace="urn:schemas-rinconnetworks-com:metadata-1-0/">'
+                 'RINCON_AssociatedZPUDN</desc></item></DIDL-Lite>')
+
+# Feed the parser this many characters at a time, so a large Result is never
+# turned into one big tree.
+CHUNK_SIZE = 16384
+
+
+DidlItem = collections.namedtuple('DidlItem', ['item_id', 'parent_id', 'item_class', 'title', 'creator', 'album', 'album_art', 'uri'])
+DidlItem.__doc__ = """A track, album, artist, playlist or queue entry from a DIDL-Lite document.
+
+item_id -- The object ID, which can be browsed (containers) or played (items).
+parent_id -- The object ID of the parent container.
+item_class -- The UPnP class, e.g. 'object.item.audioItem.musicTrack'.
+title -- dc:title.
+creator -- dc:creator, usually the artist.
+album -- upnp:album.
+album_art -- upnp:albumArtURI, relative to the speaker (e.g. '/getaa?...').
+uri -- The res element, i.e. what to play.
+
+Missing fields are empty strings.
+
+"""
+
+
+def iter_didl(document):
+    """ Parse a DIDL-Lite document incrementally.
+
+    Each item or container is turned into a DidlItem and discarded from the
+    parse tree as soon as its end tag has been read, so memory use doesn't
+    grow with the size of the document.
+
+    Arguments:
+    document -- The DIDL-Lite document, as a string or bytes.
+
+    Yields:
+    A DidlItem for every item and container, in document order.
+
+    """
+    parser = XML.XMLPullParser(events=('start', 'end'))
+    root = None
+
+    for offset in range(0, len(document), CHUNK_SIZE):
+        parser.feed(document[offset:offset + CHUNK_SIZE])
+
+        for event, element in parser.read_events():
+            if event == 'start':
+                if root is None:
+                    root = element
+                continue
+
+            if element.tag == ITEM_TAG or element.tag == CONTAINER_TAG:
+                yield didl_item(element)
+                # Drop the finished item (and anything before it) from the tree.
+                root.clear()
+
+    parser.close()
+
+
+def didl_item(element):
+    """ Turn an item or container element into a DidlItem. """
+    fields = {
+        DC_NS + 'title': '',
+        DC_NS + 'creator': '',
+        UPNP_NS + 'album': '',
+        UPNP_NS + 'albumArtURI': '',
+        UPNP_NS + 'class': '',
+        DIDL_NS + 'res': '',
+    }
+
+    # A single pass over the children instead of one findtext scan per field.
+    for child in element:
+        if child.tag in fields and not fields[child.tag]:
+            fields[child.tag] = child.text or ''
+
+    # Parents, classes, artists and albums repeat across a queue or library,
+    # so intern them to keep a single copy of each.
+    return DidlItem(element.get('id', ''),
+                    intern(element.get('parentID', '')),
+                    intern(fields[UPNP_NS + 'class']),
+                    fields[DC_NS + 'title'],
+                    intern(fields[DC_NS + 'creator']),
+                    intern(fields[UPNP_NS + 'album']),
+                    fields[UPNP_NS + 'albumArtURI'],
+                    fields[DIDL_NS + 'res'])
+
+
+def to_didl(item):
+    """ Build the DIDL-Lite metadata a speaker expects along with an item's URI,
+    e.g. when adding it to the queue.
+    """
+    return DIDL_TEMPLATE % (quoteattr(item.item_id), quoteattr(item.parent_id), escape(item.title),
+                            escape(item.item_class or 'object.item.audioItem.musicTrack'))
@@ -0,0 +1,340 @@
+import collections
+import concurrent.futures
+import json
+import os
+import socket
+import struct
+import threading
+import time
+
+from soco import SoCo
+
+
+MCAST_GROUP = '239.255.255.250'
+MCAST_PORT = 1900
+
+ZONE_PLAYER_ST = 'urn:schemas-upnp-org:device:ZonePlayer:1'
+
+DEFAULT_REGISTRY_PATH = os.path.join(os.path.expanduser('~'), '.sonoshell', 'speakers.json')
+
+
+Speaker = collections.namedtuple('Speaker', ['uid', 'ip', 'zone_name', 'household_id', 'boot_seq', 'last_seen'])
+Speaker.__doc__ = """A Sonos speaker known to the registry.
+
+uid -- The speaker's LocalUID, e.g. 'RINCON_000E58XXXXXX01400'.
+ip -- The speaker's IP address.
+zone_name -- The name of the zone (room) the speaker is in.
+household_id -- The Sonos household the speaker belongs to, if announced.
+boot_seq -- The speaker's X-RINCON-BOOTSEQ, which changes when it reboots.
+last_seen -- time.time() at which the speaker last announced itself.
+
+"""
+
+
+def parse_ssdp(data):
+    """ Parse an SSDP datagram (M-SEARCH response or NOTIFY).
+
+    Returns:
+    A (start_line, headers) tuple, with header names upper-cased.
+
+    """
+    lines = data.decode('utf-8', 'replace').split('\r\n')
+
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(':')
+        if sep:
+            headers[name.strip().upper()] = value.strip()
+
+    return lines[0], headers
+
+
+def uid_from_usn(usn):
+    """ Extract the LocalUID from an SSDP USN, e.g. 'uuid:RINCON_X::urn:...'. """
+    if not usn.startswith('uuid:'):
+        return None
+
+    return usn[5:].split('::')[0]
+
+
+class SpeakerRegistry(object):
+    """A registry of Sonos speakers, keyed by LocalUID, kept up to date by SSDP.
+
+    The registry is loaded from (and saved to) a JSON file so that a new
+    process can resolve zone names without scanning the network first. After
+    an initial discover(), listening for NOTIFY announcements keeps it current
+    incrementally: speakers are only queried over HTTP when they are new,
+    have moved to another IP or have rebooted.
+
+    Public functions:
+    discover -- Actively search the network with M-SEARCH.
+    start -- Start listening for NOTIFY announcements in the background.
+    stop -- Stop listening.
+    resolve -- Get the IP address of a zone name or LocalUID.
+    get -- Get the Speaker for a LocalUID.
+    speakers -- Get every known Speaker.
+    save -- Write the registry to disk.
+
+    """
+
+    def __init__(self, path=DEFAULT_REGISTRY_PATH, group=MCAST_GROUP, port=MCAST_PORT,
+                 interface='0.0.0.0'):
+        """ Arguments:
+        path -- JSON file the registry is cached in, or None for no cache.
+        group -- SSDP multicast group.
+        port -- SSDP multicast port.
+        interface -- Local interface address to send and listen on.
+
+        """
+        self.path = path
+        self.group = group
+        self.port = port
+        self.interface = interface
+
+        self._speakers = {}
+        self._zones = {}
+        self._lock = threading.Lock()
+        self._listener = None
+        self._stopping = threading.Event()
+
+        self.load()
+
+    def discover(self, timeout=1.0, mx=1, max_workers=32):
+        """ Send an M-SEARCH and add every speaker that answers in time.
+
+        The answers are collected for the whole timeout first, and then the
+        speakers that need querying are queried at the same time, so a slow
+        speaker can't make others' answers be missed.
+
+        Returns:
+        The list of Speakers that answered.
+
+        """
+        message = '\r\n'.join([
+            'M-SEARCH * HTTP/1.1',
+            'HOST: ' + self.group + ':' + str(self.port),
+            'MAN: "ssdp:discover"',
+            'MX: ' + str(mx),
+            'ST: ' + ZONE_PLAYER_ST,
+            '', '']).encode('utf-8')
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(self.interface))
+
+        responses = collections.OrderedDict()
+        deadline = time.time() + timeout
+
+        try:
+            sock.sendto(message, (self.group, self.port))
+
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+
+                sock.settimeout(remaining)
+                try:
+                    data, addr = sock.recvfrom(2048)
+                except socket.timeout:
+                    break
+
+                start_line, headers = parse_ssdp(data)
+                uid = uid_from_usn(headers.get('USN', ''))
+                if start_line.startswith('HTTP/') and headers.get('ST') == ZONE_PLAYER_ST and uid is not None:
+                    responses[uid] = (addr[0], headers)
+        finally:
+            sock.close()
+
+        found = []
+        if responses:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(responses))) as executor:
+                found = [speaker for speaker in executor.map(lambda response: self._announce(*response),
+                                                             responses.values()) if speaker is not None]
+
+        self.save()
+
+        return found
+
+    def start(self):
+        """ Listen for NOTIFY announcements on a background thread. """
+        if self._listener is not None:
+            return
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, 'SO_REUSEPORT'):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(('', self.port))
+
+        membership = struct.pack('4s4s', socket.inet_aton(self.group), socket.inet_aton(self.interface))
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        sock.settimeout(0.5)
+
+        self._stopping.clear()
+        self._listener = threading.Thread(target=self._listen, args=(sock,))
+        self._listener.daemon = True
+        self._listener.start()
+
+    def stop(self):
+        """ Stop listening for NOTIFY announcements and save the registry. """
+        if self._listener is None:
+            return
+
+        self._stopping.set()
+        self._listener.join()
+        self._listener = None
+
+        self.save()
+
+    def resolve(self, name):
+        """ Get the IP address of a speaker by zone name or LocalUID.
+
+        Zone names are matched case-insensitively. If a zone contains several
+        speakers (e.g. a stereo pair), the first one registered is returned.
+
+        Returns:
+        The IP address, or None if the name is unknown.
+
+        """
+        with self._lock:
+            speaker = self._speakers.get(name)
+            if speaker is None:
+                uids = self._zones.get(name.lower())
+                if uids:
+                    speaker = self._speakers[uids[0]]
+
+            return speaker.ip if speaker is not None else None
+
+    def get(self, uid):
+        """ Get the Speaker with the given LocalUID, or None. """
+        with self._lock:
+            return self._speakers.get(uid)
+
+    def speakers(self):
+        """ Get a list of every known Speaker. """
+        with self._lock:
+            return list(self._speakers.values())
+
+    def load(self):
+        """ Load the registry from disk, if there is a cache file. """
+        if self.path is None or not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path) as f:
+                records = json.load(f)
+            # Fields this version doesn't know are ignored, and missing ones
+            # are None, so a cache from another version still loads.
+            speakers = [Speaker(*[record.get(field) for field in Speaker._fields]) for record in records]
+        except (IOError, ValueError, TypeError, AttributeError):
+            # A corrupt cache is no worse than no cache.
+            return
+
+        with self._lock:
+            for speaker in speakers:
+                if speaker.uid and speaker.ip:
+                    self._add(speaker)
+
+    def save(self):
+        """ Write the registry to disk, if it has a cache file. """
+        if self.path is None:
+            return
+
+        with self._lock:
+            records = [speaker._asdict() for speaker in self._speakers.values()]
+
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(records, f, indent=2)
+        os.rename(tmp_path, self.path)
+
+    def _listen(self, sock):
+        try:
+            while not self._stopping.is_set():
+                try:
+                    data, addr = sock.recvfrom(2048)
+                except socket.timeout:
+                    continue
+
+                start_line, headers = parse_ssdp(data)
+                if not start_line.startswith('NOTIFY') or headers.get('NT') != ZONE_PLAYER_ST:
+                    continue
+
+                if headers.get('NTS') == 'ssdp:byebye':
+                    self._remove(uid_from_usn(headers.get('USN', '')))
+                else:
+                    self._announce(addr[0], headers)
+        finally:
+            sock.close()
+
+    def _announce(self, ip, headers):
+        """ Record an announcement, querying the speaker only if needed. """
+        uid = uid_from_usn(headers.get('USN', ''))
+        if uid is None:
+            return None
+
+        boot_seq = headers.get('X-RINCON-BOOTSEQ')
+        household_id = headers.get('X-RINCON-HOUSEHOLD')
+        now = time.time()
+
+        with self._lock:
+            known = self._speakers.get(uid)
+
+            if known is not None and known.ip == ip and known.boot_seq == boot_seq:
+                speaker = known._replace(last_seen=now)
+                self._speakers[uid] = speaker
+                return speaker
+
+            if household_id is None and known is not None:
+                household_id = known.household_id
+
+        try:
+            info = SoCo(ip).get_speaker_info()
+        except Exception:
+            return None
+
+        speaker = Speaker(uid, ip, info['zone_name'], household_id, boot_seq, now)
+
+        with self._lock:
+            self._remove_locked(uid)
+            self._add(speaker)
+
+        return speaker
+
+    def _add(self, speaker):
+        self._speakers[speaker.uid] = speaker
+
+        if speaker.zone_name:
+            self._zones.setdefault(speaker.zone_name.lower(), []).append(speaker.uid)
+
+    def _remove(self, uid):
+        with self._lock:
+            self._remove_locked(uid)
+
+    def _remove_locked(self, uid):
+        speaker = self._speakers.pop(uid, None)
+
+        if speaker is not None and speaker.zone_name:
+            uids = self._zones.get(speaker.zone_name.lower(), [])
+            if uid in uids:
+                uids.remove(uid)
+            if not uids:
+                self._zones.pop(speaker.zone_name.lower(), None)
+
+
+def discover(timeout=1.0, path=DEFAULT_REGISTRY_PATH):
+    """ Search the network for Sonos speakers.
+
+    Returns:
+    A SpeakerRegistry populated from the cache file and an M-SEARCH.
+
+    """
+    registry = SpeakerRegistry(path)
+    registry.discover(timeout)
+
+    return registry
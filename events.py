@@ -0,0 +1,439 @@
+try:
+    import xml.etree.cElementTree as XML
+except ImportError:
+    import xml.etree.ElementTree as XML
+
+import collections
+import queue
+import socket
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from soco import SoCo
+
+
+TRANSPORT_EVENT_ENDPOINT = '/MediaRenderer/AVTransport/Event'
+RENDERING_EVENT_ENDPOINT = '/MediaRenderer/RenderingControl/Event'
+TOPOLOGY_EVENT_ENDPOINT = '/ZoneGroupTopology/Event'
+
+SERVICE_EVENT_ENDPOINTS = {
+    'AVTransport': TRANSPORT_EVENT_ENDPOINT,
+    'RenderingControl': RENDERING_EVENT_ENDPOINT,
+    'ZoneGroupTopology': TOPOLOGY_EVENT_ENDPOINT,
+}
+
+EVENT_NS = '{urn:schemas-upnp-org:event-1-0}'
+
+# Seconds a NOTIFY for an unknown SID waits for a SUBSCRIBE in flight to
+# return it, since a speaker may send its initial event first.
+PENDING_SID_WAIT = 5.0
+
+# Seconds before a failed resubscription is retried, doubling with every
+# failure up to RESUBSCRIBE_MAX_DELAY.
+RESUBSCRIBE_DELAY = 1.0
+RESUBSCRIBE_MAX_DELAY = 300.0
+
+
+Event = collections.namedtuple('Event', ['speaker_ip', 'service', 'sid', 'seq', 'variables', 'timestamp'])
+Event.__doc__ = """A state change pushed by a Sonos speaker.
+
+speaker_ip -- IP address of the speaker that sent the event.
+service -- The UPnP service name, e.g. 'AVTransport'.
+sid -- The subscription ID the event was delivered for.
+seq -- The event sequence number (0 for the initial event).
+variables -- Dictionary of changed state variables, see parse_event.
+timestamp -- time.time() at which the event was received.
+
+"""
+
+
+def parse_event(content):
+    """ Parse the body of a UPnP NOTIFY request.
+
+    LastChange properties (as sent by AVTransport and RenderingControl) are
+    expanded into their individual state variables. Variables with a channel
+    attribute, like Volume or Mute, are returned as a dictionary keyed by
+    channel, e.g. {'Volume': {'Master': '20', 'LF': '100', 'RF': '100'}}.
+
+    Returns:
+    A dictionary mapping state variable names to their (string) values.
+
+    """
+    variables = {}
+
+    propertyset = XML.fromstring(content)
+
+    for prop in propertyset.iter(EVENT_NS + 'property'):
+        for var in prop:
+            if var.tag == 'LastChange':
+                variables.update(parse_last_change(var.text or ''))
+            else:
+                variables[var.tag] = var.text
+
+    return variables
+
+
+def parse_last_change(last_change):
+    """ Parse a LastChange event document into a dictionary of variables. """
+    variables = {}
+
+    if not last_change:
+        return variables
+
+    event = XML.fromstring(last_change.encode('utf-8'))
+
+    for instance in event:
+        for var in instance:
+            # Strip the namespace, which differs between services.
+            name = var.tag.rpartition('}')[2]
+            value = var.get('val')
+            channel = var.get('channel')
+
+            if channel is not None:
+                variables.setdefault(name, {})[channel] = value
+            else:
+                variables[name] = value
+
+    return variables
+
+
+class Subscription(object):
+    """A GENA event subscription to one service on one Sonos speaker.
+
+    Events are pushed to the callback (if any) and to the events queue.
+    The subscription is renewed automatically before it times out. If the
+    speaker forgot it, it's subscribed again, retrying with backoff until it
+    succeeds or is unsubscribed; meanwhile is_subscribed is False and error
+    holds the last failure.
+
+    Public functions:
+    subscribe -- Start the subscription.
+    renew -- Renew the subscription.
+    unsubscribe -- Cancel the subscription.
+
+    """
+
+    def __init__(self, listener, speaker_ip, service, callback=None, timeout=1800):
+        """ Arguments:
+        listener -- The EventListener that receives the speaker's NOTIFYs.
+        speaker_ip -- IP address of the Sonos speaker.
+        service -- Service to subscribe to, e.g. 'AVTransport'.
+        callback -- Called with an Event for every event received.
+        timeout -- Requested subscription lifetime in seconds.
+
+        """
+        self.listener = listener
+        self.speaker_ip = speaker_ip
+        self.service = service
+        self.callback = callback
+        self.requested_timeout = timeout
+
+        self.events = queue.Queue()
+        self.sid = None
+        self.timeout = None
+        self.is_subscribed = False
+        # The exception of the last failed resubscription, and the number of
+        # failures in a row. Reset once subscribed again.
+        self.error = None
+        self.failures = 0
+
+        self._cancelled = False
+        self._renew_timer = None
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        """ Send a SUBSCRIBE request and start the renewal timer. """
+        with self._lock:
+            self._cancelled = False
+
+        self._subscribe()
+
+    def renew(self):
+        """ Renew the subscription, resubscribing if the speaker forgot it. """
+        # The request is made without the lock, so a slow or unreachable
+        # speaker doesn't hold up unsubscribe (or a concurrent subscribe).
+        with self._lock:
+            if self._cancelled:
+                return
+
+            sid = self.sid if self.is_subscribed else None
+
+        if sid is not None:
+            headers = {
+                'SID': sid,
+                'TIMEOUT': 'Second-' + str(self.requested_timeout),
+            }
+
+            try:
+                response = SoCo.pool.request('SUBSCRIBE', self.speaker_ip, SERVICE_EVENT_ENDPOINTS[self.service], headers=headers)
+            except Exception:
+                response = None
+
+            with self._lock:
+                # Unsubscribed, or subscribed again, meanwhile.
+                if self._cancelled or not self.is_subscribed or self.sid != sid:
+                    return
+
+                if response is not None and response.status_code == 200:
+                    self._accept_timeout(response)
+                    return
+
+                # The renewal failed (the speaker rebooted or dropped the
+                # SID), so start over with a fresh subscription.
+                self.listener.unregister(self)
+                self.is_subscribed = False
+
+        try:
+            self._subscribe()
+        except Exception as e:
+            with self._lock:
+                if self._cancelled:
+                    return
+
+                self.error = e
+                self.failures += 1
+                delay = min(RESUBSCRIBE_DELAY * 2 ** (self.failures - 1), RESUBSCRIBE_MAX_DELAY)
+                self._start_timer(delay)
+
+    def unsubscribe(self):
+        """ Cancel the subscription. """
+        with self._lock:
+            self._cancelled = True
+            if self._renew_timer is not None:
+                self._renew_timer.cancel()
+
+            if not self.is_subscribed:
+                return
+
+            self.is_subscribed = False
+            self.listener.unregister(self)
+
+        try:
+            SoCo.pool.request('UNSUBSCRIBE', self.speaker_ip, SERVICE_EVENT_ENDPOINTS[self.service], headers={'SID': self.sid})
+        except Exception:
+            # The speaker will expire the subscription by itself.
+            pass
+
+    def dispatch(self, event):
+        """ Deliver an event to the queue and the callback. """
+        self.events.put(event)
+
+        if self.callback is not None:
+            self.callback(event)
+
+    def _subscribe(self):
+        headers = {
+            'CALLBACK': '<' + self.listener.callback_url(self.speaker_ip) + '>',
+            'NT': 'upnp:event',
+            'TIMEOUT': 'Second-' + str(self.requested_timeout),
+        }
+
+        # The speaker may send its initial event before we know the SID, so
+        # have the listener hold unknown SIDs until this request returns.
+        self.listener.expect()
+        try:
+            response = SoCo.pool.request('SUBSCRIBE', self.speaker_ip, SERVICE_EVENT_ENDPOINTS[self.service], headers=headers)
+            response.raise_for_status()
+
+            with self._lock:
+                self.sid = response.headers['SID']
+                self.is_subscribed = True
+                self.error = None
+                self.failures = 0
+                self.listener.register(self)
+                self._accept_timeout(response)
+        finally:
+            self.listener.settle()
+
+    def _accept_timeout(self, response):
+        timeout = response.headers.get('TIMEOUT', '').lower()
+
+        if timeout.startswith('second-') and timeout[7:].isdigit():
+            self.timeout = int(timeout[7:])
+        else:
+            self.timeout = self.requested_timeout
+
+        # Renew well before the speaker would expire the subscription.
+        self._start_timer(self.timeout * 0.85)
+
+    def _start_timer(self, delay):
+        if self._renew_timer is not None:
+            self._renew_timer.cancel()
+
+        self._renew_timer = threading.Timer(delay, self.renew)
+        self._renew_timer.daemon = True
+        self._renew_timer.start()
+
+
+class EventListener(object):
+    """A local HTTP server that receives UPnP event NOTIFYs from speakers.
+
+    Public functions:
+    start -- Start the listener thread.
+    stop -- Stop the listener and cancel all of its subscriptions.
+    subscribe -- Subscribe to a service on a speaker.
+    callback_url -- The URL speakers should send their events to.
+
+    """
+
+    def __init__(self, host='', port=0):
+        """ Arguments:
+        host -- Local address to bind to. Defaults to all interfaces.
+        port -- Local port to bind to. Defaults to any free port.
+
+        """
+        self.host = host
+        self.port = port
+
+        self._server = None
+        self._subscriptions = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._registered = threading.Condition(self._lock)
+
+    def start(self):
+        """ Start serving on a background thread. Does nothing if running. """
+        with self._lock:
+            if self._server is not None:
+                return
+
+            listener = self
+
+            class Handler(_NotifyHandler):
+                event_listener = listener
+
+            self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+            self._server.daemon_threads = True
+            self.port = self._server.server_address[1]
+
+            thread = threading.Thread(target=self._server.serve_forever)
+            thread.daemon = True
+            thread.start()
+
+    def stop(self):
+        """ Unsubscribe everything and stop serving. """
+        with self._lock:
+            subscriptions = list(self._subscriptions.values())
+
+        for subscription in subscriptions:
+            subscription.unsubscribe()
+
+        with self._lock:
+            if self._server is not None:
+                self._server.shutdown()
+                self._server.server_close()
+                self._server = None
+
+    def subscribe(self, speaker_ip, service, callback=None, timeout=1800):
+        """ Subscribe to events from a service on a speaker.
+
+        Arguments:
+        speaker_ip -- IP address of the Sonos speaker.
+        service -- 'AVTransport', 'RenderingControl' or 'ZoneGroupTopology'.
+        callback -- Called with an Event for every event received.
+        timeout -- Requested subscription lifetime in seconds.
+
+        Returns:
+        The active Subscription. Events can also be read from its events queue.
+
+        """
+        self.start()
+
+        subscription = Subscription(self, speaker_ip, service, callback, timeout)
+        subscription.subscribe()
+
+        return subscription
+
+    def callback_url(self, speaker_ip):
+        """ Return the URL on this host that speaker_ip can reach us at. """
+        # Let the routing table tell us which of our addresses faces the speaker.
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.connect((speaker_ip, 1400))
+            local_ip = sock.getsockname()[0]
+        finally:
+            sock.close()
+
+        return 'http://' + local_ip + ':' + str(self.port) + '/'
+
+    def expect(self):
+        """ Note that a SUBSCRIBE is in flight. See settle. """
+        with self._lock:
+            self._pending += 1
+
+    def settle(self):
+        """ Note that a SUBSCRIBE returned, whether or not it succeeded. """
+        with self._lock:
+            self._pending -= 1
+            self._registered.notify_all()
+
+    def register(self, subscription):
+        with self._lock:
+            self._subscriptions[subscription.sid] = subscription
+            self._registered.notify_all()
+
+    def unregister(self, subscription):
+        with self._lock:
+            self._subscriptions.pop(subscription.sid, None)
+
+    def notify(self, sid, seq, content):
+        """ Handle an incoming NOTIFY. Returns False if the SID is unknown. """
+        deadline = time.monotonic() + PENDING_SID_WAIT
+
+        with self._lock:
+            subscription = self._subscriptions.get(sid)
+
+            # Maybe the SUBSCRIBE that returns this SID hasn't returned yet.
+            while subscription is None and self._pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._registered.wait(remaining)
+                subscription = self._subscriptions.get(sid)
+
+        if subscription is None:
+            return False
+
+        event = Event(subscription.speaker_ip, subscription.service, sid, seq, parse_event(content), time.time())
+        subscription.dispatch(event)
+
+        return True
+
+
+class _NotifyHandler(BaseHTTPRequestHandler):
+    """Request handler that forwards NOTIFYs to an EventListener."""
+
+    event_listener = None
+
+    def do_NOTIFY(self):
+        content = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        seq = self.headers.get('SEQ', '0')
+
+        try:
+            known = self.event_listener.notify(self.headers.get('SID'), int(seq) if seq.isdigit() else 0, content)
+        except XML.ParseError:
+            self.send_response(400)
+        else:
+            # 412 Precondition Failed tells the speaker to drop the SID.
+            self.send_response(200 if known else 412)
+
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+# A listener shared by everything in this process, started on first use.
+event_listener = EventListener()
+
+
+def subscribe(speaker_ip, service, callback=None, timeout=1800):
+    """ Subscribe to a service on a speaker using the shared event listener.
+
+    See EventListener.subscribe.
+
+    """
+    return event_listener.subscribe(speaker_ip, service, callback, timeout)
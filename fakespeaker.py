@@ -0,0 +1,645 @@
+try:
+    import xml.etree.cElementTree as XML
+except ImportError:
+    import xml.etree.ElementTree as XML
+
+import http.client
+import itertools
+import socket
+import struct
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+
+from actions import ENDPOINTS
+from discovery import MCAST_GROUP, MCAST_PORT, ZONE_PLAYER_ST, parse_ssdp
+
+
+ENVELOPE = '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"><s:Body>%s</s:Body></s:Envelope>'
+
+FAULT = '<s:Fault><faultcode>s:Client</faultcode><faultstring>UPnPError</faultstring><detail><UPnPError xmlns="urn:schemas-upnp-org:control-1-0"><errorCode>%d</errorCode></UPnPError></detail></s:Fault>'
+
+STATUS_ZP = '<?xml version="1.0" ?><ZPSupportInfo><ZPInfo><ZoneName>%s</ZoneName><ZoneIcon>x-rincon-roomicon:living</ZoneIcon><LocalUID>%s</LocalUID><SerialNumber>00-0E-58-00-00-00:0</SerialNumber><SoftwareVersion>29.3-87071</SoftwareVersion><HardwareVersion>1.8.3.7-2</HardwareVersion><MACAddress>00:0E:58:00:00:00</MACAddress><HouseholdControlID>%s</HouseholdControlID></ZPInfo></ZPSupportInfo>'
+
+DIDL_ITEM = '<item id="%s" parentID="%s" restricted="true"><res protocolInfo="x-file-cifs:*:audio/mpeg:*" duration="0:03:30">x-file-cifs://server/music/track%d.mp3</res><upnp:albumArtURI>/getaa?s=1&amp;u=x-file-cifs%%3a%%2f%%2fserver%%2fmusic%%2ftrack%d.mp3</upnp:albumArtURI><dc:title>Track %d</dc:title><upnp:class>object.item.audioItem.musicTrack</upnp:class><dc:creator>Artist %d</dc:creator><upnp:album>Album %d</upnp:album><upnp:originalTrackNumber>%d</upnp:originalTrackNumber></item>'
+
+DIDL_START = '<DIDL-Lite xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:upnp="urn:schemas-upnp-org:metadata-1-0/upnp/" xmlns:r="urn:schemas-rinconnetworks-com:metadata-1-0/" xmlns="urn:schemas-upnp-org:metadata-1-0/DIDL-Lite/">'
+DIDL_END = '</DIDL-Lite>'
+
+PROPERTYSET = '<e:propertyset xmlns:e="urn:schemas-upnp-org:event-1-0"><e:property><LastChange>%s</LastChange></e:property></e:propertyset>'
+
+VOLUME_CHANGE = '<Event xmlns="urn:schemas-upnp-org:metadata-1-0/RCS/"><InstanceID val="0"><Volume channel="Master" val="%d"/></InstanceID></Event>'
+
+ZONE_GROUP_MEMBER = '<ZoneGroupMember UUID="%s" Location="http://%s:1400/xml/device_description.xml" ZoneName="%s"/>'
+
+
+def make_didl(count, start=0, parent_id='-1'):
+    """ Build a DIDL-Lite document with count music track items. """
+    items = [DIDL_ITEM % (parent_id + '/' + str(i + 1) if parent_id != '-1' else '-1', parent_id, i, i, i, i % 50, i % 200, i % 20 + 1)
+             for i in range(start, start + count)]
+    return DIDL_START + ''.join(items) + DIDL_END
+
+
+def make_zone_group_state(groups):
+    """ Build a ZoneGroupState document.
+
+    Arguments:
+    groups -- A list of groups, each a list of FakeSpeakers with the
+              coordinator first.
+
+    """
+    zone_groups = []
+    for group in groups:
+        members = ''.join(ZONE_GROUP_MEMBER % (s.uid, s.ip, escape(s.zone_name)) for s in group)
+        zone_groups.append('<ZoneGroup Coordinator="%s" ID="%s:1">%s</ZoneGroup>' % (group[0].uid, group[0].uid, members))
+
+    return '<ZoneGroupState><ZoneGroups>' + ''.join(zone_groups) + '</ZoneGroups></ZoneGroupState>'
+
+
+class FakeSpeaker(object):
+    """An in-process stand-in for a Sonos speaker, for benchmarks and tests.
+
+    Serves the AVTransport, RenderingControl and DeviceProperties control
+    endpoints plus /status/zp on a loopback address, keeps just enough state
+    (volume, EQ, transport state, current URI) for getters to reflect setters,
+    and can add a fixed latency to every response.
+
+    Public functions:
+    start -- Start serving on a background thread.
+    stop -- Stop serving.
+
+    """
+
+    def __init__(self, ip='127.0.0.1', port=1400, latency=0.0, zone_name='Living Room',
+                 uid='RINCON_000E58000000001400', household_id='Sonos_FAKE'):
+        """ Arguments:
+        ip -- Loopback address to serve on. Any 127.x.y.z works on Linux, which
+              allows many fake speakers on the port 1400 SoCo expects.
+        port -- Port to serve on.
+        latency -- Seconds to wait before answering each request.
+        zone_name -- Zone name reported by /status/zp.
+        uid -- LocalUID reported by /status/zp.
+        household_id -- HouseholdControlID reported by /status/zp.
+
+        """
+        self.ip = ip
+        self.port = port
+        self.latency = latency
+        self.zone_name = zone_name
+        self.uid = uid
+        self.household_id = household_id
+
+        self.state = {
+            'volume': 20,
+            'mute': False,
+            'bass': 0,
+            'treble': 0,
+            'loudness': True,
+            'led': 'On',
+            'transport_state': 'STOPPED',
+            'play_mode': 'NORMAL',
+            'uri': '',
+            'uri_metadata': '',
+            'track': 1,
+            'rel_time': '0:00:00',
+            # Streams and line-in report '0:00:00' or 'NOT_IMPLEMENTED'.
+            'track_duration': '0:03:30',
+            'track_metadata': make_didl(1),
+            # Number of tracks in the fake music library, and the queue's URIs.
+            'library_size': 1000,
+            'queue': ['x-file-cifs://fake/music/%d.mp3' % i for i in range(50)],
+            'playlists': {},
+            # ContentDirectory SystemUpdateID; bump it to simulate a library change.
+            'update_id': 1,
+            # See make_zone_group_state. Defaults to a group of just this speaker.
+            'zone_group_state': None,
+        }
+        # The speakers whose volumes the group volume actions change, when
+        # this one is the coordinator.
+        self.group = [self]
+        self.group_snapshot = None
+        # Maps an action name to a UPnP error code it should fail with.
+        self.faults = {}
+        self.requests = 0
+        # Set chunked to send SOAP responses with Transfer-Encoding: chunked,
+        # and close_idle to close every keep-alive connection unanswered when
+        # its next request arrives, as when a speaker's idle timeout races a
+        # client reusing the connection.
+        self.chunked = False
+        self.close_idle = False
+
+        # Event subscriptions: SID -> callback URL. Every initial NOTIFY
+        # sent is recorded as (SID, HTTP status it got back). Set
+        # refuse_subscriptions to answer new SUBSCRIBEs with a 503.
+        self.subscriptions = {}
+        self.notifications = []
+        self.refuse_subscriptions = False
+        self._sids = itertools.count()
+
+        self._server = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """ Start serving on a background thread. Returns self. """
+        speaker = self
+
+        class Handler(_FakeSpeakerHandler):
+            fake_speaker = speaker
+
+        self._server = ThreadingHTTPServer((self.ip, self.port), Handler)
+        self._server.daemon_threads = True
+
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        return self
+
+    def stop(self):
+        """ Stop serving. """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def handle_action(self, service, name, arguments):
+        """ Apply an action to the fake state.
+
+        Returns:
+        An (HTTP status, response body) tuple.
+
+        """
+        with self._lock:
+            self.requests += 1
+
+            if name in self.faults:
+                return 500, ENVELOPE % (FAULT % self.faults[name])
+
+            out = self._apply(name, arguments)
+
+        if out is None:
+            return 500, ENVELOPE % (FAULT % 401)
+
+        body = ''.join('<%s>%s</%s>' % (arg, escape(str(value)), arg) for arg, value in out)
+
+        return 200, ENVELOPE % ('<u:%sResponse xmlns:u="%s">%s</u:%sResponse>' % (name, service, body, name))
+
+    def status_zp(self):
+        with self._lock:
+            self.requests += 1
+
+        return STATUS_ZP % (self.zone_name, self.uid, self.household_id)
+
+    def subscribe(self, callback, sid):
+        """ Handle a SUBSCRIBE: a new subscription if sid is None, else a renewal.
+
+        Returns:
+        An (HTTP status, SID) tuple.
+
+        """
+        with self._lock:
+            self.requests += 1
+
+            if sid is not None:
+                return (200, sid) if sid in self.subscriptions else (412, None)
+
+            if self.refuse_subscriptions:
+                return 503, None
+
+            sid = 'uuid:%s_sub%010d' % (self.uid, next(self._sids))
+            self.subscriptions[sid] = callback.strip('<>')
+            volume = self.state['volume']
+
+        # Like a real speaker, the initial event may reach the subscriber
+        # before the SUBSCRIBE response does.
+        notify = threading.Thread(target=self._notify, args=(sid, PROPERTYSET % escape(VOLUME_CHANGE % volume)))
+        notify.daemon = True
+        notify.start()
+        notify.join(0.5)
+
+        return 200, sid
+
+    def unsubscribe(self, sid):
+        with self._lock:
+            self.requests += 1
+            return 200 if self.subscriptions.pop(sid, None) else 412
+
+    def _notify(self, sid, body):
+        """ Send the initial (SEQ 0) NOTIFY of a subscription. """
+        with self._lock:
+            url = self.subscriptions.get(sid)
+        if url is None:
+            return
+
+        host, _, path = url.partition('//')[2].partition('/')
+        connection = http.client.HTTPConnection(host, timeout=5)
+        try:
+            connection.request('NOTIFY', '/' + path, body.encode('utf-8'), {
+                'NT': 'upnp:event', 'NTS': 'upnp:propchange', 'SID': sid, 'SEQ': '0',
+                'Content-Type': 'text/xml; charset="utf-8"'})
+            status = connection.getresponse().status
+        except (OSError, http.client.HTTPException):
+            status = None
+        finally:
+            connection.close()
+
+        with self._lock:
+            self.notifications.append((sid, status))
+            if status == 412:
+                self.subscriptions.pop(sid, None)
+
+    def _apply(self, name, arguments):
+        """ Update the state for an action, returning its out-arguments. """
+        state = self.state
+
+        if name == 'Play':
+            state['transport_state'] = 'PLAYING'
+        elif name == 'Pause':
+            state['transport_state'] = 'PAUSED_PLAYBACK'
+        elif name == 'Stop':
+            state['transport_state'] = 'STOPPED'
+        elif name == 'Next':
+            state['track'] += 1
+        elif name == 'Previous':
+            state['track'] = max(1, state['track'] - 1)
+        elif name == 'SetAVTransportURI':
+            state['uri'] = arguments.get('CurrentURI', '')
+            state['uri_metadata'] = arguments.get('CurrentURIMetaData', '')
+            state['track'] = 1
+            state['rel_time'] = '0:00:00'
+            state['transport_state'] = 'STOPPED'
+        elif name == 'Seek':
+            if arguments.get('Unit') == 'TRACK_NR':
+                state['track'] = int(arguments['Target'])
+            else:
+                state['rel_time'] = arguments['Target']
+        elif name == 'AddMultipleURIsToQueue':
+            uris = arguments['EnqueuedURIs'].split(' ')
+            if len(uris) != int(arguments['NumberOfURIs']) or len(uris) > 16:
+                return None
+            first = int(arguments.get('DesiredFirstTrackNumberEnqueued', 0))
+            if arguments.get('EnqueueAsNext') == '1' and first == 0:
+                first = state['track'] + 1
+            if first == 0 or first > len(state['queue']):
+                first = len(state['queue']) + 1
+            state['queue'][first - 1:first - 1] = uris
+            return [('FirstTrackNumberEnqueued', first),
+                    ('NumTracksAdded', len(uris)),
+                    ('NewQueueLength', len(state['queue'])),
+                    ('NewUpdateID', 0)]
+        elif name == 'RemoveTrackRangeFromQueue':
+            start = int(arguments['StartingIndex']) - 1
+            del state['queue'][start:start + int(arguments['NumberOfTracks'])]
+            return [('NewUpdateID', 0)]
+        elif name == 'ReorderTracksInQueue':
+            start = int(arguments['StartingIndex']) - 1
+            count = int(arguments['NumberOfTracks'])
+            before = int(arguments['InsertBefore']) - 1
+            moved = state['queue'][start:start + count]
+            rest = state['queue'][:start] + state['queue'][start + count:]
+            before -= sum(1 for i in range(start, start + count) if i < before)
+            state['queue'] = rest[:before] + moved + rest[before:]
+        elif name == 'RemoveAllTracksFromQueue':
+            state['queue'] = []
+        elif name == 'SaveQueue':
+            object_id = 'SQ:%d' % (len(state['playlists']) + 1)
+            state['playlists'][object_id] = (arguments['Title'], list(state['queue']))
+            return [('AssignedObjectID', object_id)]
+        elif name == 'BecomeCoordinatorOfStandaloneGroup':
+            state['uri'] = 'x-rincon-queue:' + self.uid + '#0'
+            state['uri_metadata'] = ''
+            state['transport_state'] = 'STOPPED'
+        elif name == 'GetMediaInfo':
+            return [('NrTracks', len(state['queue'])),
+                    ('MediaDuration', 'NOT_IMPLEMENTED'),
+                    ('CurrentURI', state['uri']),
+                    ('CurrentURIMetaData', state['uri_metadata']),
+                    ('NextURI', ''),
+                    ('NextURIMetaData', ''),
+                    ('PlayMedium', 'NETWORK'),
+                    ('RecordMedium', 'NOT_IMPLEMENTED'),
+                    ('WriteStatus', 'NOT_IMPLEMENTED')]
+        elif name == 'GetTransportInfo':
+            return [('CurrentTransportState', state['transport_state']),
+                    ('CurrentTransportStatus', 'OK'),
+                    ('CurrentSpeed', 1)]
+        elif name == 'SetPlayMode':
+            state['play_mode'] = arguments.get('NewPlayMode', 'NORMAL')
+        elif name == 'StartAutoplay':
+            state['volume'] = int(arguments['Volume'])
+            state['transport_state'] = 'PLAYING'
+        elif name == 'GetPositionInfo':
+            return [('Track', state['track']),
+                    ('TrackDuration', state['track_duration']),
+                    ('TrackMetaData', state['track_metadata']),
+                    ('TrackURI', state['uri']),
+                    ('RelTime', state['rel_time']),
+                    ('AbsTime', 'NOT_IMPLEMENTED'),
+                    ('RelCount', 2147483647),
+                    ('AbsCount', 2147483647)]
+        elif name == 'SetVolume':
+            state['volume'] = int(arguments['DesiredVolume'])
+        elif name == 'SetRelativeVolume':
+            state['volume'] = clamp_volume(state['volume'] + int(arguments['Adjustment']))
+            return [('NewVolume', state['volume'])]
+        elif name == 'GetVolume':
+            return [('CurrentVolume', state['volume'])]
+        elif name == 'GetGroupVolume':
+            return [('CurrentVolume', self._group_volume())]
+        elif name == 'SnapshotGroupVolume':
+            self.group_snapshot = [(s, s.state['volume']) for s in self.group]
+        elif name == 'SetGroupVolume':
+            self._set_group_volume(int(arguments['DesiredVolume']))
+        elif name == 'SetRelativeGroupVolume':
+            self.group_snapshot = [(s, s.state['volume']) for s in self.group]
+            self._set_group_volume(clamp_volume(self._group_volume() + int(arguments['Adjustment'])))
+            return [('NewVolume', self._group_volume())]
+        elif name == 'SetMute':
+            state['mute'] = arguments['DesiredMute'] == '1'
+        elif name == 'GetMute':
+            return [('CurrentMute', int(state['mute']))]
+        elif name == 'SetBass':
+            state['bass'] = int(arguments['DesiredBass'])
+        elif name == 'GetBass':
+            return [('CurrentBass', state['bass'])]
+        elif name == 'SetTreble':
+            state['treble'] = int(arguments['DesiredTreble'])
+        elif name == 'GetTreble':
+            return [('CurrentTreble', state['treble'])]
+        elif name == 'SetLoudness':
+            state['loudness'] = arguments['DesiredLoudness'] == '1'
+        elif name == 'GetLoudness':
+            return [('CurrentLoudness', int(state['loudness']))]
+        elif name == 'SetLEDState':
+            state['led'] = arguments['DesiredLEDState']
+        elif name == 'Browse':
+            size = len(state['queue']) if arguments['ObjectID'].startswith('Q:') else state['library_size']
+            start = int(arguments.get('StartingIndex', 0))
+            count = max(0, min(int(arguments.get('RequestedCount', 100)), size - start))
+            return [('Result', make_didl(count, start, arguments['ObjectID'])),
+                    ('NumberReturned', count),
+                    ('TotalMatches', size),
+                    ('UpdateID', state['update_id'])]
+        elif name == 'GetSystemUpdateID':
+            return [('Id', state['update_id'])]
+        elif name == 'GetZoneGroupState':
+            return [('ZoneGroupState', state['zone_group_state'] or make_zone_group_state([[self]]))]
+        else:
+            return None
+
+        return []
+
+    def _group_volume(self):
+        return sum(s.state['volume'] for s in self.group) // len(self.group)
+
+    def _set_group_volume(self, volume):
+        """ Scale the members' snapshot volumes so they average volume. """
+        snapshot = self.group_snapshot or [(s, s.state['volume']) for s in self.group]
+        average = sum(v for s, v in snapshot) / float(len(snapshot))
+
+        for speaker, snapshot_volume in snapshot:
+            if average:
+                speaker.state['volume'] = clamp_volume(int(round(snapshot_volume * volume / average)))
+            else:
+                speaker.state['volume'] = volume
+
+
+class FakeSSDP(object):
+    """A loopback stand-in for the SSDP traffic of FakeSpeakers.
+
+    Answers M-SEARCHes for ZonePlayers on behalf of the speakers, and sends
+    their NOTIFY announcements, each from the speaker's own address as a
+    real speaker would, so a discovery.SpeakerRegistry on the same
+    interface and port sees them.
+
+    Public functions:
+    start -- Start answering M-SEARCHes on a background thread.
+    stop -- Stop answering.
+    notify -- Send a speaker's NOTIFY announcement.
+
+    """
+
+    def __init__(self, speakers, group=MCAST_GROUP, port=MCAST_PORT, interface='127.0.0.1'):
+        """ Arguments:
+        speakers -- The FakeSpeakers to answer for.
+        group -- SSDP multicast group.
+        port -- SSDP port. Use another port than 1900 to keep tests apart.
+        interface -- Local interface to join the group on.
+
+        """
+        self.speakers = list(speakers)
+        self.group = group
+        self.port = port
+        self.interface = interface
+
+        # X-RINCON-BOOTSEQ of each speaker by UID; bump it to simulate a reboot.
+        self.boot_seq = dict((speaker.uid, 1) for speaker in self.speakers)
+        self.searches = 0
+
+        self._sock = None
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        """ Start answering M-SEARCHes. Returns self. """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, 'SO_REUSEPORT'):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(('', self.port))
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                        struct.pack('4s4s', socket.inet_aton(self.group), socket.inet_aton(self.interface)))
+        sock.settimeout(0.1)
+
+        self._sock = sock
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._serve)
+        self._thread.daemon = True
+        self._thread.start()
+
+        return self
+
+    def stop(self):
+        """ Stop answering M-SEARCHes. """
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def notify(self, speaker, nts='ssdp:alive'):
+        """ Send a speaker's NOTIFY (nts 'ssdp:alive' or 'ssdp:byebye') to the group. """
+        lines = ['NOTIFY * HTTP/1.1',
+                 'HOST: %s:%d' % (self.group, self.port),
+                 'NT: ' + ZONE_PLAYER_ST,
+                 'NTS: ' + nts] + self._headers(speaker)
+
+        self._send(speaker, lines, (self.group, self.port))
+
+    def _serve(self):
+        try:
+            while not self._stopping.is_set():
+                try:
+                    data, addr = self._sock.recvfrom(2048)
+                except socket.timeout:
+                    continue
+
+                start_line, headers = parse_ssdp(data)
+                if not start_line.startswith('M-SEARCH') or headers.get('ST') not in (ZONE_PLAYER_ST, 'ssdp:all'):
+                    continue
+
+                self.searches += 1
+                for speaker in self.speakers:
+                    lines = ['HTTP/1.1 200 OK', 'CACHE-CONTROL: max-age = 1800', 'EXT:',
+                             'ST: ' + ZONE_PLAYER_ST] + self._headers(speaker)
+                    self._send(speaker, lines, addr)
+        finally:
+            self._sock.close()
+
+    def _headers(self, speaker):
+        return ['LOCATION: http://%s:%d/xml/device_description.xml' % (speaker.ip, speaker.port),
+                'USN: uuid:%s::%s' % (speaker.uid, ZONE_PLAYER_ST),
+                'X-RINCON-HOUSEHOLD: ' + speaker.household_id,
+                'X-RINCON-BOOTSEQ: %d' % self.boot_seq.get(speaker.uid, 1)]
+
+    def _send(self, speaker, lines, addr):
+        """ Send a datagram from the speaker's own address. """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        try:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(self.interface))
+            sock.bind((speaker.ip, 0))
+            sock.sendto('\r\n'.join(lines + ['', '']).encode('utf-8'), addr)
+        finally:
+            sock.close()
+
+
+def clamp_volume(volume):
+    return max(0, min(100, volume))
+
+
+class _FakeSpeakerHandler(BaseHTTPRequestHandler):
+    """Request handler that forwards requests to a FakeSpeaker."""
+
+    protocol_version = 'HTTP/1.1'
+    # Send headers and body in one segment, so keep-alive clients don't stall
+    # on delayed ACKs.
+    wbufsize = -1
+    disable_nagle_algorithm = True
+    fake_speaker = None
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.answered = False
+
+    def parse_request(self):
+        if self.answered and self.fake_speaker.close_idle:
+            self.close_connection = True
+            return False
+
+        self.answered = True
+        return BaseHTTPRequestHandler.parse_request(self)
+
+    def do_GET(self):
+        self._delay()
+
+        if self.path == '/status/zp':
+            self._respond(200, self.fake_speaker.status_zp())
+        elif self.path.startswith('/getaa?'):
+            self._album_art()
+        else:
+            self._respond(404, '')
+
+    def do_SUBSCRIBE(self):
+        self._delay()
+
+        status, sid = self.fake_speaker.subscribe(self.headers.get('CALLBACK', ''), self.headers.get('SID'))
+
+        self.send_response(status)
+        if sid is not None:
+            self.send_header('SID', sid)
+            self.send_header('TIMEOUT', self.headers.get('TIMEOUT', 'Second-1800'))
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_UNSUBSCRIBE(self):
+        self._delay()
+
+        self.send_response(self.fake_speaker.unsubscribe(self.headers.get('SID')))
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_POST(self):
+        content = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self._delay()
+
+        if self.path not in ENDPOINTS.values():
+            self._respond(404, '')
+            return
+
+        service, _, name = self.headers.get('SOAPACTION', '').strip('"').partition('#')
+
+        arguments = {}
+        for element in XML.fromstring(content).iter():
+            if len(element) == 0:
+                arguments[element.tag] = element.text or ''
+
+        self._respond(*self.fake_speaker.handle_action(service, name, arguments))
+
+    def _album_art(self):
+        """ Serve a fake cover for any album art URL, honouring If-None-Match. """
+        with self.fake_speaker._lock:
+            self.fake_speaker.requests += 1
+
+        body = b'\xff\xd8\xff\xe0fake cover ' + self.path.encode('utf-8')
+        etag = '"%x"' % (hash(body) & 0xffffffff)
+
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _delay(self):
+        if self.fake_speaker.latency:
+            time.sleep(self.fake_speaker.latency)
+
+    def _respond(self, status, body):
+        body = body.encode('utf-8')
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/xml; charset="utf-8"')
+        if self.fake_speaker.chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for i in range(0, len(body), 256):
+                chunk = body[i:i + 256]
+                self.wfile.write(('%x;fake=1\r\n' % len(chunk)).encode('ascii') + chunk + b'\r\n')
+            self.wfile.write(b'0\r\nX-Fake-Trailer: 1\r\n\r\n')
+        else:
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
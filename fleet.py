@@ -0,0 +1,111 @@
+import collections
+import concurrent.futures
+import time
+
+from soco import SoCo
+
+
+FleetResult = collections.namedtuple('FleetResult', ['value', 'error', 'elapsed'])
+FleetResult.__doc__ = """The outcome of running a SoCo function on one speaker.
+
+value -- What the SoCo function returned, or None if it raised.
+error -- The exception raised by the SoCo function, or None.
+elapsed -- Seconds the call took (or had taken when the deadline passed).
+
+"""
+
+
+class SoCoFleet(object):
+    """Run SoCo functions on many Sonos speakers in parallel.
+
+    Any public SoCo function can be called on the fleet, e.g. fleet.pause()
+    or fleet.volume(20). The call is dispatched to every speaker on a thread
+    pool and returns a dictionary mapping each speaker IP to a FleetResult.
+
+    Public functions:
+    run -- Run a SoCo function on every speaker.
+    close -- Shut down the thread pool.
+
+    """
+
+    def __init__(self, speaker_ips, max_workers=32, timeout=None, topology=None, scheduler=None):
+        """ Arguments:
+        speaker_ips -- The IP addresses of the speakers in the fleet.
+        max_workers -- Maximum number of speakers contacted at the same time.
+        timeout -- Default overall deadline in seconds for a fleet call.
+        topology -- An optional topology.Topology shared by every speaker,
+                    see SoCo.
+        scheduler -- An optional scheduler.CommandScheduler shared by every
+                     speaker, see SoCo.
+
+        """
+        self.speakers = collections.OrderedDict((ip, SoCo(ip, topology=topology, scheduler=scheduler)) for ip in speaker_ips)
+        self.timeout = timeout
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getattr__(self, name):
+        if name.startswith('_') or not callable(getattr(SoCo, name, None)):
+            raise AttributeError(name)
+
+        def fleet_call(*args, **kwargs):
+            return self.run(name, *args, **kwargs)
+
+        fleet_call.__name__ = name
+        return fleet_call
+
+    def run(self, method, *args, **kwargs):
+        """ Run a SoCo function on every speaker in the fleet.
+
+        Arguments:
+        method -- Name of the SoCo function to run.
+        timeout -- Keyword only. Overall deadline in seconds for this call,
+                   overriding the fleet's default.
+
+        Any other arguments are passed to the SoCo function.
+
+        Returns:
+        A dictionary mapping each speaker IP to a FleetResult. Speakers that
+        didn't answer before the deadline get a concurrent.futures.TimeoutError
+        as their error.
+
+        """
+        timeout = kwargs.pop('timeout', self.timeout)
+        started = time.monotonic()
+
+        futures = collections.OrderedDict()
+        for ip, speaker in self.speakers.items():
+            futures[ip] = self._executor.submit(self._timed, getattr(speaker, method), args, kwargs)
+
+        concurrent.futures.wait(futures.values(), timeout=timeout)
+
+        results = collections.OrderedDict()
+        for ip, future in futures.items():
+            if future.done():
+                results[ip] = future.result()
+            else:
+                future.cancel()
+                results[ip] = FleetResult(None, concurrent.futures.TimeoutError(), time.monotonic() - started)
+
+        return results
+
+    def close(self):
+        """ Shut down the thread pool, without waiting for calls in flight. """
+        self._executor.shutdown(wait=False)
+
+    @staticmethod
+    def _timed(function, args, kwargs):
+        started = time.monotonic()
+
+        try:
+            value = function(*args, **kwargs)
+        except Exception as e:
+            return FleetResult(None, e, time.monotonic() - started)
+
+        return FleetResult(value, None, time.monotonic() - started)
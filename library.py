@@ -0,0 +1,267 @@
+import os
+import sqlite3
+import threading
+import time
+
+from didl import DidlItem
+
+
+DEFAULT_LIBRARY_PATH = os.path.join(os.path.expanduser('~'), '.sonoshell', 'library.db')
+
+# The library categories mirrored by default. See SoCo.LIBRARY_CATEGORIES.
+DEFAULT_CATEGORIES = ('tracks', 'albums', 'artists', 'playlists', 'sonos_playlists')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    household TEXT NOT NULL,
+    category TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    parent_id TEXT,
+    item_class TEXT,
+    title TEXT,
+    creator TEXT,
+    album TEXT,
+    album_art TEXT,
+    uri TEXT,
+    PRIMARY KEY (household, item_id)
+);
+CREATE INDEX IF NOT EXISTS items_creator ON items (household, category, creator COLLATE NOCASE);
+CREATE TABLE IF NOT EXISTS sync_state (
+    household TEXT NOT NULL,
+    container TEXT NOT NULL,
+    update_id TEXT,
+    PRIMARY KEY (household, container)
+);
+CREATE TABLE IF NOT EXISTS sync_times (
+    household TEXT PRIMARY KEY,
+    checked REAL NOT NULL
+);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(
+    title, creator, album, content='items', content_rowid='rowid'
+);
+CREATE TRIGGER IF NOT EXISTS items_ai AFTER INSERT ON items BEGIN
+    INSERT INTO items_fts (rowid, title, creator, album) VALUES (new.rowid, new.title, new.creator, new.album);
+END;
+CREATE TRIGGER IF NOT EXISTS items_ad AFTER DELETE ON items BEGIN
+    INSERT INTO items_fts (items_fts, rowid, title, creator, album) VALUES ('delete', old.rowid, old.title, old.creator, old.album);
+END;
+CREATE TRIGGER IF NOT EXISTS items_au AFTER UPDATE ON items BEGIN
+    INSERT INTO items_fts (items_fts, rowid, title, creator, album) VALUES ('delete', old.rowid, old.title, old.creator, old.album);
+    INSERT INTO items_fts (rowid, title, creator, album) VALUES (new.rowid, new.title, new.creator, new.album);
+END;
+"""
+
+ITEM_COLUMNS = 'item_id, parent_id, item_class, title, creator, album, album_art, uri'
+
+# An UPSERT, rather than INSERT OR REPLACE: the row a REPLACE deletes doesn't
+# fire items_ad (recursive_triggers is off), which left stale FTS rows.
+UPSERT_ITEM = ('INSERT INTO items (household, category, ' + ITEM_COLUMNS + ') VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+               ' ON CONFLICT (household, item_id) DO UPDATE SET category = excluded.category, ' +
+               ', '.join(column.strip() + ' = excluded.' + column.strip() for column in ITEM_COLUMNS.split(',')[1:]))
+
+
+class LibraryIndex(object):
+    """A local SQLite mirror of Sonos music libraries, one per household.
+
+    sync() copies the library from a speaker with ContentDirectory browsing.
+    Later syncs first compare the speaker's SystemUpdateID, and then each
+    category's UpdateID, with the ones seen last time, so only categories
+    that actually changed are fetched again. With max_age, a household
+    checked less than max_age seconds ago isn't checked at all. Searches
+    are answered from the index (full-text, where SQLite has FTS5) without
+    touching the speaker.
+
+    Public functions:
+    sync -- Bring the index up to date with a speaker's library.
+    search -- Full-text search over titles, artists and albums.
+    artist_tracks -- Get the tracks of an artist.
+    checked -- Get when a household was last checked.
+    count -- Get the number of indexed entries.
+    close -- Close the database.
+
+    """
+
+    def __init__(self, path=DEFAULT_LIBRARY_PATH):
+        """ Arguments:
+        path -- SQLite database file, or ':memory:'.
+
+        """
+        if path != ':memory:':
+            directory = os.path.dirname(path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+
+        self.path = path
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+        with self._db:
+            self._db.executescript(SCHEMA)
+            try:
+                self._db.executescript(FTS_SCHEMA)
+                self.has_fts = True
+            except sqlite3.OperationalError:
+                # This SQLite was built without FTS5; search falls back to LIKE.
+                self.has_fts = False
+
+    def sync(self, soco, categories=DEFAULT_CATEGORIES, page_size=500, max_age=None):
+        """ Bring the index up to date with a speaker's music library.
+
+        Arguments:
+        soco -- A SoCo for any speaker in the household.
+        categories -- The SoCo.LIBRARY_CATEGORIES to mirror.
+        page_size -- Entries per Browse request.
+        max_age -- Don't check a household that was checked less than this
+                   many seconds ago. None to always check.
+
+        Returns:
+        A list of the categories that were fetched again.
+
+        """
+        household = soco.get_speaker_info()['household_id'] or soco.speaker_ip
+
+        if max_age is not None:
+            checked = self.checked(household)
+            if checked is not None and time.time() - checked < max_age:
+                return []
+
+        # The SystemUpdateID is stored per category, so that a category
+        # asked for the first time is fetched even if nothing changed.
+        system_update_id = soco.get_system_update_id()
+        if system_update_id is not None and all(
+                system_update_id == self._update_id(household, 'system:' + category) for category in categories):
+            self._set_checked(household)
+            return []
+
+        refreshed = []
+        for category in categories:
+            container = soco.LIBRARY_CATEGORIES[category]
+
+            page = soco.browse_page(container, 0, 1)
+            if not isinstance(page, dict):
+                continue
+            if page['update_id'] is not None and page['update_id'] == self._update_id(household, container):
+                continue
+
+            # Browse the whole category before taking the lock, so searches
+            # aren't held up by the crawl and a failed crawl changes nothing.
+            items = list(soco.browse(container, page_size=page_size))
+            self._replace(household, category, items, container, page['update_id'])
+            refreshed.append(category)
+
+        for category in categories:
+            self._set_update_id(household, 'system:' + category, system_update_id)
+        self._set_checked(household)
+
+        return refreshed
+
+    def search(self, term, household=None, category=None, limit=50):
+        """ Search titles, artists and albums.
+
+        Arguments:
+        term -- Words to look for. Each word matches as a prefix.
+        household -- Only search this household's library.
+        category -- Only search this category, e.g. 'tracks'.
+        limit -- Maximum number of results.
+
+        Returns:
+        A list of didl.DidlItem, best matches first.
+
+        """
+        words = term.split()
+        if not words:
+            return []
+
+        where = []
+        params = []
+
+        if self.has_fts:
+            query = ' '.join('"' + word.replace('"', '""') + '"*' for word in words)
+            sql = 'SELECT ' + ', '.join('items.' + c.strip() for c in ITEM_COLUMNS.split(',')) + ' FROM items_fts JOIN items ON items.rowid = items_fts.rowid WHERE items_fts MATCH ?'
+            params.append(query)
+            order = ' ORDER BY items_fts.rank'
+        else:
+            sql = 'SELECT ' + ITEM_COLUMNS + ' FROM items WHERE 1'
+            for word in words:
+                where.append('(title LIKE ? OR creator LIKE ? OR album LIKE ?)')
+                params.extend(['%' + word + '%'] * 3)
+            order = ''
+
+        if household is not None:
+            where.append('items.household = ?')
+            params.append(household)
+        if category is not None:
+            where.append('items.category = ?')
+            params.append(category)
+
+        for clause in where:
+            sql += ' AND ' + clause
+
+        return self._query(sql + order + ' LIMIT ?', params + [limit])
+
+    def artist_tracks(self, artist, household=None):
+        """ Get every indexed track by an artist (case-insensitive exact match).
+
+        Returns:
+        A list of didl.DidlItem, ordered by album and title.
+
+        """
+        sql = 'SELECT ' + ITEM_COLUMNS + " FROM items WHERE category = 'tracks' AND creator = ? COLLATE NOCASE"
+        params = [artist]
+
+        if household is not None:
+            sql += ' AND household = ?'
+            params.append(household)
+
+        return self._query(sql + ' ORDER BY album, title', params)
+
+    def checked(self, household):
+        """ Get the time.time() a household was last synced or found unchanged, or None. """
+        with self._lock:
+            row = self._db.execute('SELECT checked FROM sync_times WHERE household = ?', (household,)).fetchone()
+        return row[0] if row is not None else None
+
+    def count(self, household=None):
+        """ Get the number of indexed entries. """
+        with self._lock:
+            if household is None:
+                return self._db.execute('SELECT COUNT(*) FROM items').fetchone()[0]
+            return self._db.execute('SELECT COUNT(*) FROM items WHERE household = ?', (household,)).fetchone()[0]
+
+    def close(self):
+        """ Close the database. """
+        self._db.close()
+
+    def _query(self, sql, params):
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+
+        return [DidlItem(*row) for row in rows]
+
+    def _replace(self, household, category, items, container, update_id):
+        """ Replace a category's entries with freshly browsed ones, and
+        record the container's update ID, in one transaction.
+        """
+        rows = [(household, category) + tuple(item) for item in items]
+
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM items WHERE household = ? AND category = ?', (household, category))
+            self._db.executemany(UPSERT_ITEM, rows)
+            self._db.execute('INSERT OR REPLACE INTO sync_state (household, container, update_id) VALUES (?, ?, ?)', (household, container, update_id))
+
+    def _update_id(self, household, container):
+        with self._lock:
+            row = self._db.execute('SELECT update_id FROM sync_state WHERE household = ? AND container = ?', (household, container)).fetchone()
+        return row[0] if row is not None else None
+
+    def _set_update_id(self, household, container, update_id):
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO sync_state (household, container, update_id) VALUES (?, ?, ?)', (household, container, update_id))
+
+    def _set_checked(self, household):
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO sync_times (household, checked) VALUES (?, ?)', (household, time.time()))
@@ -0,0 +1,300 @@
+import bisect
+import collections
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+CallRecord = collections.namedtuple('CallRecord', ['speaker_ip', 'action', 'latency', 'bytes_sent',
+                                                   'bytes_received', 'error', 'parse_time', 'timestamp'])
+CallRecord.__doc__ = """One request SoCo made to a speaker, as passed to the hooks.
+
+speaker_ip -- IP address the request was sent to (the coordinator, if routed).
+action -- The action name, e.g. 'SetVolume', or 'status_zp' for get_speaker_info.
+latency -- Seconds from sending the request to receiving the whole response.
+bytes_sent -- Size of the request body.
+bytes_received -- Size of the response body.
+error -- None on success. Otherwise the UPnP error code, 'invalid_response'
+         if the response couldn't be understood, or the name of the
+         exception if the request itself failed (e.g. 'ConnectionError').
+parse_time -- Seconds spent parsing the response.
+timestamp -- time.time() at which the request completed.
+
+"""
+
+# Callables that get a CallRecord for every request. See add_hook.
+hooks = []
+
+# Histogram bucket upper bounds, in seconds.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PARSE_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025)
+
+
+def add_hook(hook):
+    """ Call hook with a CallRecord for every request SoCo makes. """
+    hooks.append(hook)
+
+
+def remove_hook(hook):
+    """ Stop calling a hook added with add_hook. """
+    hooks.remove(hook)
+
+
+def emit(record):
+    """ Pass a CallRecord to every hook. A failing hook doesn't fail the call. """
+    for hook in list(hooks):
+        try:
+            hook(record)
+        except Exception:
+            pass
+
+
+class Histogram(object):
+    """A cumulative histogram with fixed buckets, as Prometheus expects."""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count', 'max')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def cumulative(self):
+        """ Yield (upper bound, count of values <= it), ending with '+Inf'. """
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield bound, total
+
+    def quantile(self, q):
+        """ Estimate a quantile: the upper bound of the bucket it falls in. """
+        rank = q * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return self.max if bound == '+Inf' else min(bound, self.max)
+        return self.max
+
+
+class _ActionStats(object):
+    """Everything recorded for one action on one speaker."""
+
+    __slots__ = ('latency', 'parse_time', 'bytes_sent', 'bytes_received', 'errors')
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.parse_time = Histogram(PARSE_BUCKETS)
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.errors = collections.Counter()
+
+
+class Metrics(object):
+    """Collects CallRecords into per-speaker, per-action metrics.
+
+    metrics = Metrics()
+    metrics.install()           # start recording every SoCo request
+    metrics.serve(port=9464)    # optional: Prometheus text on /metrics
+
+    Public functions:
+    install -- Register as a hook.
+    uninstall -- Unregister.
+    on_call -- Record a CallRecord.
+    summary -- Get a row of figures per speaker and action.
+    report -- Get the summary as a text table.
+    render -- Get the metrics in the Prometheus text format.
+    serve -- Serve render() over HTTP.
+    stop -- Stop serving.
+    reset -- Forget everything recorded so far.
+
+    """
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def install(self):
+        """ Start recording every request SoCo makes. Returns self. """
+        add_hook(self.on_call)
+        return self
+
+    def uninstall(self):
+        """ Stop recording. """
+        remove_hook(self.on_call)
+
+    def on_call(self, record):
+        """ Record a CallRecord. """
+        key = (record.speaker_ip, record.action)
+
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = _ActionStats()
+
+            stats.latency.observe(record.latency)
+            if record.parse_time is not None:
+                stats.parse_time.observe(record.parse_time)
+            stats.bytes_sent += record.bytes_sent
+            stats.bytes_received += record.bytes_received
+            if record.error is not None:
+                stats.errors[str(record.error)] += 1
+
+    def reset(self):
+        """ Forget everything recorded so far. """
+        with self._lock:
+            self._stats.clear()
+
+    def summary(self):
+        """ Get a row of figures per speaker and action, slowest p95 first.
+
+        Returns:
+        A list of dictionaries with speaker_ip, action, count, errors (a
+        dictionary of error to count), mean_ms, p95_ms, max_ms, parse_mean_ms,
+        bytes_sent and bytes_received.
+
+        """
+        rows = []
+
+        with self._lock:
+            for (speaker_ip, action), stats in self._stats.items():
+                latency = stats.latency
+                parse_time = stats.parse_time
+                rows.append({
+                    'speaker_ip': speaker_ip,
+                    'action': action,
+                    'count': latency.count,
+                    'errors': dict(stats.errors),
+                    'mean_ms': round(latency.sum / latency.count * 1000, 3),
+                    'p95_ms': round(latency.quantile(0.95) * 1000, 3),
+                    'max_ms': round(latency.max * 1000, 3),
+                    'parse_mean_ms': round(parse_time.sum / parse_time.count * 1000, 3) if parse_time.count else None,
+                    'bytes_sent': stats.bytes_sent,
+                    'bytes_received': stats.bytes_received,
+                })
+
+        rows.sort(key=lambda row: row['p95_ms'], reverse=True)
+
+        return rows
+
+    def report(self):
+        """ Get the summary as a text table. """
+        lines = ['%-15s %-24s %7s %7s %9s %9s %9s %10s %10s' % (
+            'speaker', 'action', 'count', 'errors', 'mean_ms', 'p95_ms', 'max_ms', 'sent', 'received')]
+
+        for row in self.summary():
+            lines.append('%-15s %-24s %7d %7d %9.3f %9.3f %9.3f %10d %10d' % (
+                row['speaker_ip'], row['action'], row['count'], sum(row['errors'].values()),
+                row['mean_ms'], row['p95_ms'], row['max_ms'], row['bytes_sent'], row['bytes_received']))
+
+        return '\n'.join(lines)
+
+    def render(self):
+        """ Get the metrics in the Prometheus text exposition format. """
+        with self._lock:
+            items = sorted(self._stats.items())
+
+            lines = []
+
+            def family(name, kind, help):
+                lines.append('# HELP ' + name + ' ' + help)
+                lines.append('# TYPE ' + name + ' ' + kind)
+
+            family('sonos_requests_total', 'counter', 'Requests sent to Sonos speakers.')
+            for key, stats in items:
+                lines.append('sonos_requests_total%s %d' % (_labels(key), stats.latency.count))
+
+            family('sonos_request_errors_total', 'counter', 'Requests that failed, by UPnP error code or exception.')
+            for key, stats in items:
+                for error, count in sorted(stats.errors.items()):
+                    lines.append('sonos_request_errors_total%s %d' % (_labels(key, code=error), count))
+
+            family('sonos_request_bytes_sent_total', 'counter', 'Request body bytes sent.')
+            for key, stats in items:
+                lines.append('sonos_request_bytes_sent_total%s %d' % (_labels(key), stats.bytes_sent))
+
+            family('sonos_request_bytes_received_total', 'counter', 'Response body bytes received.')
+            for key, stats in items:
+                lines.append('sonos_request_bytes_received_total%s %d' % (_labels(key), stats.bytes_received))
+
+            for name, attribute, help in (('sonos_request_latency_seconds', 'latency', 'Request round-trip time.'),
+                                          ('sonos_response_parse_seconds', 'parse_time', 'Time spent parsing responses.')):
+                family(name, 'histogram', help)
+                for key, stats in items:
+                    histogram = getattr(stats, attribute)
+                    for bound, total in histogram.cumulative():
+                        lines.append('%s_bucket%s %d' % (name, _labels(key, le=bound), total))
+                    lines.append('%s_sum%s %r' % (name, _labels(key), histogram.sum))
+                    lines.append('%s_count%s %d' % (name, _labels(key), histogram.count))
+
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, host='127.0.0.1', port=9464):
+        """ Serve render() on http://host:port/metrics from a background thread.
+
+        Only localhost can connect by default. Pass host='' to let a
+        Prometheus server on another machine scrape it.
+
+        Returns the port.
+        """
+        metrics = self
+
+        class Handler(_MetricsHandler):
+            source = metrics
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        return self._server.server_address[1]
+
+    def stop(self):
+        """ Stop serving. """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def _labels(key, **extra):
+    speaker_ip, action = key
+    labels = [('speaker', speaker_ip), ('action', action)] + sorted(extra.items())
+    return '{' + ','.join('%s="%s"' % (name, _escape(value)) for name, value in labels) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """Serves a Metrics' render() on /metrics."""
+
+    source = None
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        body = self.source.render().encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
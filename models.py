@@ -0,0 +1,174 @@
+try:
+    import xml.etree.cElementTree as XML
+except ImportError:
+    import xml.etree.ElementTree as XML
+
+from sys import intern
+
+from didl import DidlItem, iter_didl
+
+
+# What the speaker sends as TrackMetaData for sources without metadata,
+# e.g. line-in.
+NOT_IMPLEMENTED = 'NOT_IMPLEMENTED'
+
+NO_METADATA = DidlItem('', '', '', '', '', '', '', '')
+
+
+class Record(object):
+    """Base for the slotted models, letting them be read like the dicts they replace.
+
+    record['title'], record.get('title'), record.keys() and dict(record) all
+    work, so existing callers don't need to change.
+
+    """
+
+    __slots__ = ()
+
+    FIELDS = ()
+
+    def __getitem__(self, field):
+        if field not in self.FIELDS:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def get(self, field, default=None):
+        return getattr(self, field) if field in self.FIELDS else default
+
+    def keys(self):
+        return list(self.FIELDS)
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self):
+        return len(self.FIELDS)
+
+    def __contains__(self, field):
+        return field in self.FIELDS
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, dict)):
+            return self.as_dict() == dict(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def as_dict(self):
+        """ Get a plain dictionary of every field. """
+        return dict((field, getattr(self, field)) for field in self.FIELDS)
+
+    def __repr__(self):
+        return repr(self.as_dict())
+
+
+class Track(Record):
+    """The currently playing track, as returned by SoCo.get_current_track_info.
+
+    The TrackMetaData DIDL-Lite document is only parsed when title, artist,
+    album or album_art is first read, in a single pass, so callers that
+    only want the uri or duration never pay for it.
+
+    """
+
+    __slots__ = ('playlist_position', 'duration', 'position', 'uri', '_metadata', '_base_url', '_item')
+
+    FIELDS = ('playlist_position', 'duration', 'position', 'title', 'artist', 'album', 'album_art', 'uri')
+
+    def __init__(self, playlist_position, duration, uri, metadata, base_url, position=''):
+        """ Arguments:
+        playlist_position -- The track's position in the queue.
+        duration -- The track's duration, e.g. '0:03:30'.
+        uri -- The URI of the track.
+        metadata -- The TrackMetaData DIDL-Lite document.
+        base_url -- URL of the speaker, which album art URIs are relative to.
+        position -- How far into the track playback was (RelTime), e.g.
+                    '0:01:30'.
+
+        """
+        self.playlist_position = playlist_position
+        self.duration = duration
+        self.position = position
+        self.uri = uri
+        self._metadata = metadata
+        self._base_url = base_url
+        self._item = None
+
+    @property
+    def title(self):
+        return self._parsed().title
+
+    @property
+    def artist(self):
+        return self._parsed().creator
+
+    @property
+    def album(self):
+        return self._parsed().album
+
+    @property
+    def album_art(self):
+        album_art = self._parsed().album_art
+        return self._base_url + album_art if album_art else ''
+
+    def _parsed(self):
+        """ Parse the metadata the first time it's needed. """
+        if self._item is None:
+            if self._metadata and self._metadata != NOT_IMPLEMENTED:
+                try:
+                    self._item = next(iter_didl(self._metadata), NO_METADATA)
+                except XML.ParseError:
+                    # Some sources send metadata that isn't valid DIDL-Lite.
+                    self._item = NO_METADATA
+            else:
+                self._item = NO_METADATA
+            self._metadata = None
+
+        return self._item
+
+
+class SpeakerInfo(Record):
+    """Information about a Sonos speaker, as returned by SoCo.get_speaker_info."""
+
+    __slots__ = ('zone_name', 'zone_icon', 'uid', 'serial_number', 'software_version',
+                 'hardware_version', 'mac_address', 'household_id')
+
+    FIELDS = __slots__
+
+    # Maps the /status/zp elements to fields.
+    TAGS = {
+        'ZoneName': 'zone_name',
+        'ZoneIcon': 'zone_icon',
+        'LocalUID': 'uid',
+        'SerialNumber': 'serial_number',
+        'SoftwareVersion': 'software_version',
+        'HardwareVersion': 'hardware_version',
+        'MACAddress': 'mac_address',
+        'HouseholdControlID': 'household_id',
+    }
+
+    # Shared by many speakers, so only kept in memory once.
+    INTERNED = ('zone_icon', 'software_version', 'hardware_version', 'household_id')
+
+    def __init__(self, **fields):
+        for field in self.FIELDS:
+            value = fields.get(field)
+            if value is not None and field in self.INTERNED:
+                value = intern(value)
+            setattr(self, field, value)
+
+
+def parse_speaker_info(content):
+    """ Turn a /status/zp document into a SpeakerInfo in one pass. """
+    fields = {}
+
+    for element in XML.fromstring(content).iter():
+        field = SpeakerInfo.TAGS.get(element.tag)
+        if field is not None and field not in fields:
+            fields[field] = element.text or ''
+
+    return SpeakerInfo(**fields)
@@ -0,0 +1,344 @@
+import concurrent.futures
+import threading
+import time
+
+from soco import SoCo
+
+
+class Ramp(object):
+    """A volume fade on one speaker, as returned by RampScheduler.fade.
+
+    Public functions:
+    level -- Get the volume the ramp should be at.
+    retarget -- Change the target (and duration) mid-flight.
+    cancel -- Stop the ramp where it is.
+    wait -- Wait for the ramp to finish.
+
+    """
+
+    def __init__(self, scheduler, speaker_ip, target, duration, start_volume=None):
+        self.speaker_ip = speaker_ip
+        self.target = target
+        self.duration = duration
+        # Both are set once the starting volume is known.
+        self.start_volume = start_volume
+        self.started = None
+
+        self.cancelled = False
+        self.error = None
+
+        self._scheduler = scheduler
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        """ True once the ramp reached its target, failed or was cancelled. """
+        return self._done.is_set()
+
+    @property
+    def ends(self):
+        """ time.monotonic() at which the ramp reaches its target. """
+        return self.started + self.duration if self.started is not None else None
+
+    def level(self, now=None):
+        """ Get the volume the ramp should be at (now defaults to time.monotonic()). """
+        if self.started is None:
+            return self.start_volume
+
+        if now is None:
+            now = time.monotonic()
+
+        if self.duration <= 0 or now >= self.ends:
+            return self.target
+
+        progress = (now - self.started) / self.duration
+
+        return int(round(self.start_volume + (self.target - self.start_volume) * progress))
+
+    def retarget(self, target, duration=None):
+        """ Fade to a new target from wherever the ramp is now.
+
+        Arguments:
+        target -- The new volume to end at.
+        duration -- Seconds to get there. Defaults to the time the ramp had
+                    left.
+
+        """
+        self._scheduler.retarget(self, target, duration)
+
+    def cancel(self):
+        """ Stop the ramp at its current volume. """
+        self._scheduler.cancel(self)
+
+    def wait(self, timeout=None):
+        """ Wait for the ramp to finish. Returns False if timeout passed first. """
+        return self._done.wait(timeout)
+
+    def __repr__(self):
+        return '<Ramp %s %s->%s over %ss%s>' % (self.speaker_ip, self.start_volume, self.target, self.duration,
+                                               ' done' if self.done else '')
+
+
+class _Sender(object):
+    """The SetVolume state of one speaker: at most one call in flight."""
+
+    __slots__ = ('soco', 'sent', 'pending', 'owner', 'in_flight')
+
+    def __init__(self, soco):
+        self.soco = soco
+        self.sent = None
+        self.pending = None
+        # The ramp the pending level belongs to, which a failure is charged to.
+        self.owner = None
+        self.in_flight = False
+
+
+class RampScheduler(object):
+    """Runs volume fades on many speakers from one background worker.
+
+    Every interval seconds the worker works out where each ramp should be
+    and asks for that volume. Each speaker has at most one SetVolume in
+    flight; while it's waiting for the speaker, newer levels replace the
+    pending one rather than queueing up behind it, so a slow speaker only
+    ever gets the latest level and never falls behind.
+
+    Public functions:
+    fade -- Fade a speaker to a volume.
+    fade_many -- Fade many speakers to a volume.
+    cancel -- Stop a ramp (or a speaker's ramp) where it is.
+    retarget -- Change a ramp's target mid-flight.
+    ramp -- Get a speaker's active ramp.
+    close -- Cancel every ramp and stop the worker.
+
+    """
+
+    def __init__(self, interval=0.1, max_workers=16):
+        """ Arguments:
+        interval -- Seconds between volume steps.
+        max_workers -- Maximum number of speakers sent a volume at the same time.
+
+        """
+        self.interval = interval
+
+        # Number of SetVolume calls made, and of levels that were replaced
+        # by a newer one before they were sent.
+        self.sent = 0
+        self.coalesced = 0
+
+        self._ramps = {}
+        self._senders = {}
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        self._wakeup = threading.Condition()
+        self._worker = None
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def fade(self, speaker_ip, target, duration, start_volume=None):
+        """ Fade a speaker to a volume.
+
+        A ramp already running on the speaker is replaced, and the new one
+        starts from wherever the old one had got to.
+
+        Arguments:
+        speaker_ip -- IP address of the Sonos speaker.
+        target -- The volume to end at, between 0 and 100.
+        duration -- Seconds the fade should take.
+        start_volume -- The volume to start from. Defaults to the speaker's
+                        current volume.
+
+        Returns:
+        The Ramp, which can be waited for, retargeted or cancelled.
+
+        """
+        ramp = Ramp(self, speaker_ip, target, duration, start_volume)
+
+        with self._wakeup:
+            if self._closed:
+                raise RuntimeError('RampScheduler is closed')
+
+            previous = self._ramps.get(speaker_ip)
+            if previous is not None:
+                if ramp.start_volume is None:
+                    ramp.start_volume = previous.level()
+                self._finish(previous, cancelled=True)
+
+            self._ramps[speaker_ip] = ramp
+            self._sender(speaker_ip)
+
+            if ramp.start_volume is None:
+                self._executor.submit(self._fetch_start_volume, ramp)
+            else:
+                ramp.started = time.monotonic()
+
+            self._start_worker()
+            self._wakeup.notify()
+
+        return ramp
+
+    def fade_many(self, speaker_ips, target, duration):
+        """ Fade many speakers to the same volume at the same time.
+
+        Returns:
+        A dictionary mapping each speaker IP to its Ramp.
+
+        """
+        return dict((speaker_ip, self.fade(speaker_ip, target, duration)) for speaker_ip in speaker_ips)
+
+    def ramp(self, speaker_ip):
+        """ Get the active Ramp of a speaker, or None. """
+        with self._wakeup:
+            return self._ramps.get(speaker_ip)
+
+    def retarget(self, ramp, target, duration=None):
+        """ Fade to a new target from wherever the ramp is now. See Ramp.retarget. """
+        with self._wakeup:
+            if ramp.done:
+                return
+
+            now = time.monotonic()
+            if ramp.started is not None:
+                if duration is None:
+                    duration = max(0, ramp.ends - now)
+                ramp.start_volume = ramp.level(now)
+                ramp.started = now
+
+            ramp.target = target
+            if duration is not None:
+                ramp.duration = duration
+
+            self._wakeup.notify()
+
+    def cancel(self, ramp):
+        """ Stop a ramp (or a speaker IP's ramp) at its current volume. """
+        with self._wakeup:
+            if not isinstance(ramp, Ramp):
+                ramp = self._ramps.get(ramp)
+
+            if ramp is not None and not ramp.done:
+                self._finish(ramp, cancelled=True)
+
+    def close(self):
+        """ Cancel every ramp and stop the worker. """
+        with self._wakeup:
+            self._closed = True
+            for ramp in list(self._ramps.values()):
+                self._finish(ramp, cancelled=True)
+            self._wakeup.notify()
+
+        if self._worker is not None:
+            self._worker.join()
+        self._executor.shutdown(wait=True)
+
+    def _sender(self, speaker_ip):
+        sender = self._senders.get(speaker_ip)
+        if sender is None:
+            sender = self._senders[speaker_ip] = _Sender(SoCo(speaker_ip))
+        return sender
+
+    def _start_worker(self):
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run)
+            self._worker.daemon = True
+            self._worker.start()
+
+    def _run(self):
+        """ The worker: step every ramp each interval while there are any. """
+        with self._wakeup:
+            while not self._closed:
+                if not self._ramps:
+                    self._wakeup.wait()
+                    continue
+
+                self._step(time.monotonic())
+                self._wakeup.wait(self.interval)
+
+    def _step(self, now):
+        """ Ask for every ramp's current level, and retire finished ramps. """
+        for ramp in list(self._ramps.values()):
+            if ramp.started is None:
+                continue
+
+            sender = self._senders[ramp.speaker_ip]
+            self._set_volume(sender, ramp, ramp.level(now))
+
+            if now >= ramp.ends and sender.sent == ramp.target and not sender.in_flight:
+                self._finish(ramp)
+
+    def _set_volume(self, sender, ramp, volume):
+        """ Queue a ramp's volume, replacing any level not yet sent. """
+        if volume == (sender.pending if sender.pending is not None else sender.sent):
+            return
+
+        if sender.pending is not None:
+            self.coalesced += 1
+        sender.pending = volume
+        sender.owner = ramp
+
+        if not sender.in_flight:
+            sender.in_flight = True
+            self._executor.submit(self._send, sender)
+
+    def _send(self, sender):
+        """ Send the pending volume, then whatever became pending meanwhile. """
+        while True:
+            with self._wakeup:
+                volume, ramp = sender.pending, sender.owner
+                sender.pending = sender.owner = None
+                if volume is None:
+                    sender.in_flight = False
+                    return
+                self.sent += 1
+
+            try:
+                result = sender.soco.volume(volume)
+            except Exception as e:
+                result = e
+
+            with self._wakeup:
+                if result is True:
+                    sender.sent = volume
+                else:
+                    # We don't know where the speaker is now. Only the ramp
+                    # the volume was sent for fails, not one that replaced it
+                    # meanwhile.
+                    sender.sent = None
+                    if not ramp.done:
+                        ramp.error = result
+                        self._finish(ramp)
+
+    def _fetch_start_volume(self, ramp):
+        try:
+            volume = self._senders[ramp.speaker_ip].soco.volume()
+        except Exception as e:
+            volume = e
+
+        with self._wakeup:
+            if ramp.done:
+                return
+
+            if not isinstance(volume, int):
+                ramp.error = volume
+                self._finish(ramp)
+                return
+
+            self._senders[ramp.speaker_ip].sent = volume
+            ramp.start_volume = volume
+            ramp.started = time.monotonic()
+            self._wakeup.notify()
+
+    def _finish(self, ramp, cancelled=False):
+        """ Retire a ramp. Must be called with the lock held. """
+        if self._ramps.get(ramp.speaker_ip) is ramp:
+            del self._ramps[ramp.speaker_ip]
+            if cancelled:
+                # Drop the level that hasn't been sent yet.
+                sender = self._senders[ramp.speaker_ip]
+                sender.pending = sender.owner = None
+
+        ramp.cancelled = cancelled
+        ramp._done.set()
@@ -0,0 +1,261 @@
+import collections
+import concurrent.futures
+import random
+import threading
+import time
+
+import requests
+
+from actions import SoCoError
+
+
+class DeadlineExceeded(SoCoError):
+    """A command couldn't be completed before its deadline."""
+
+
+class SpeakerUnavailable(SoCoError):
+    """The speaker's circuit breaker is open: recent commands all failed."""
+
+
+CircuitState = collections.namedtuple('CircuitState', ['state', 'failures', 'retry_at'])
+CircuitState.__doc__ = """The circuit breaker of one speaker.
+
+state -- 'closed' (commands go through), 'open' (they fail fast) or
+         'half-open' (the next command is a trial).
+failures -- Consecutive failed commands.
+retry_at -- time.monotonic() after which an open breaker lets a trial through.
+
+"""
+
+# Errors that say the speaker couldn't be reached, as opposed to a reply
+# we didn't like. Only these are retried and count towards the breaker.
+NETWORK_ERRORS = (requests.ConnectionError, requests.Timeout)
+
+
+class _Speaker(object):
+    """The queue, rate limit and circuit breaker of one speaker."""
+
+    def __init__(self):
+        self.jobs = collections.deque()
+        self.worker = None
+        self.next_slot = 0.0
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+
+class CommandScheduler(object):
+    """Sends each speaker's commands in order, with deadlines and retries.
+
+    Every speaker gets its own queue and worker thread (which exits when the
+    queue is empty), so commands to one speaker are sent one at a time in
+    the order they were submitted, and a hung speaker only holds up its own
+    commands. On top of that:
+
+    - An optional rate limit spaces out the commands to each speaker.
+    - Every command has a deadline. Commands still queued when it passes
+      are dropped, and the HTTP timeout never runs past it.
+    - Idempotent commands (getters, Stop, Pause, absolute setters) are
+      retried with exponential backoff when the speaker can't be reached.
+    - After failure_threshold consecutive network failures a speaker's
+      circuit breaker opens, and its commands fail at once with
+      SpeakerUnavailable for reset_timeout seconds. Then the next command
+      to run is a trial, which closes the breaker if it succeeds; while it
+      runs, other commands still fail fast.
+
+    Pass an instance to SoCo (SoCo(ip, scheduler=scheduler)) to use it.
+
+    Public functions:
+    call -- Run a command for a speaker and wait for its result.
+    submit -- Queue a command for a speaker.
+    circuit -- Get the circuit breaker state of a speaker.
+    reset -- Close a speaker's circuit breaker.
+
+    """
+
+    def __init__(self, rate=None, timeout=10.0, retries=2, backoff=0.1,
+                 failure_threshold=3, reset_timeout=30.0):
+        """ Arguments:
+        rate -- Maximum commands per second to each speaker. None for no limit.
+        timeout -- Default deadline in seconds for a command.
+        retries -- Retries for idempotent commands that hit a network error.
+        backoff -- Seconds before the first retry. Doubles for each retry.
+        failure_threshold -- Consecutive network failures that open a
+                             speaker's circuit breaker.
+        reset_timeout -- Seconds an open breaker fails fast before a trial.
+
+        """
+        self.rate = rate
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._speakers = {}
+        self._lock = threading.Lock()
+
+    def call(self, speaker_ip, function, idempotent=False, timeout=None):
+        """ Run a command for a speaker and wait for its result.
+
+        Arguments:
+        speaker_ip -- IP address of the Sonos speaker.
+        function -- Sends the command. It's called with the number of seconds
+                    left before the deadline, to use as its timeout.
+        idempotent -- True if sending the command twice is harmless, so it
+                      can be retried.
+        timeout -- Deadline in seconds. Defaults to the scheduler's timeout.
+
+        Returns:
+        Whatever function returned.
+
+        Raises:
+        DeadlineExceeded if the command didn't complete in time.
+        SpeakerUnavailable if the speaker's circuit breaker is open.
+        Otherwise, whatever function raised.
+
+        """
+        if timeout is None:
+            timeout = self.timeout
+
+        future = self.submit(speaker_ip, function, idempotent, timeout)
+
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            # Drops the command if it's still queued.
+            future.cancel()
+            raise DeadlineExceeded('Command to ' + speaker_ip + ' took longer than ' + str(timeout) + 's')
+
+    def submit(self, speaker_ip, function, idempotent=False, timeout=None):
+        """ Queue a command for a speaker. See call.
+
+        Returns:
+        A concurrent.futures.Future for the command's result.
+
+        """
+        if timeout is None:
+            timeout = self.timeout
+
+        future = concurrent.futures.Future()
+        deadline = time.monotonic() + timeout
+
+        with self._lock:
+            speaker = self._speaker(speaker_ip)
+
+            if self._is_open(speaker, time.monotonic()):
+                future.set_exception(SpeakerUnavailable(speaker_ip + ' is not responding'))
+                return future
+
+            speaker.jobs.append((function, idempotent, deadline, future))
+
+            if speaker.worker is None:
+                speaker.worker = threading.Thread(target=self._run, args=(speaker_ip, speaker))
+                speaker.worker.daemon = True
+                speaker.worker.start()
+
+        return future
+
+    def circuit(self, speaker_ip):
+        """ Get the circuit breaker state of a speaker, as a CircuitState. """
+        with self._lock:
+            speaker = self._speaker(speaker_ip)
+
+            if speaker.opened_at is None:
+                return CircuitState('closed', speaker.failures, None)
+
+            retry_at = speaker.opened_at + self.reset_timeout
+            state = 'open' if time.monotonic() < retry_at else 'half-open'
+
+            return CircuitState(state, speaker.failures, retry_at)
+
+    def reset(self, speaker_ip):
+        """ Close a speaker's circuit breaker, e.g. after it was rediscovered. """
+        with self._lock:
+            speaker = self._speaker(speaker_ip)
+            speaker.failures = 0
+            speaker.opened_at = None
+            speaker.trial = False
+
+    def _speaker(self, speaker_ip):
+        speaker = self._speakers.get(speaker_ip)
+        if speaker is None:
+            speaker = self._speakers[speaker_ip] = _Speaker()
+        return speaker
+
+    def _is_open(self, speaker, now):
+        """ True if commands should fail fast: the breaker is open, or a trial is running. """
+        if speaker.opened_at is None:
+            return False
+
+        return now < speaker.opened_at + self.reset_timeout or speaker.trial
+
+    def _run(self, speaker_ip, speaker):
+        """ A speaker's worker: run its commands one at a time, in order. """
+        while True:
+            with self._lock:
+                if not speaker.jobs:
+                    speaker.worker = None
+                    return
+                function, idempotent, deadline, future = speaker.jobs.popleft()
+
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                future.set_result(self._execute(speaker_ip, speaker, function, idempotent, deadline))
+            except Exception as e:
+                future.set_exception(e)
+
+    def _execute(self, speaker_ip, speaker, function, idempotent, deadline):
+        attempt = 0
+        trial = False
+
+        try:
+            while True:
+                now = time.monotonic()
+
+                with self._lock:
+                    if speaker.opened_at is not None and not trial:
+                        if speaker.trial or now < speaker.opened_at + self.reset_timeout:
+                            raise SpeakerUnavailable(speaker_ip + ' is not responding')
+                        # Half-open: this command is the trial. The flag is
+                        # only set while it runs, so a trial that expires,
+                        # fails or is dropped can't keep the breaker open.
+                        speaker.trial = trial = True
+
+                    start = max(now, speaker.next_slot)
+                    if start >= deadline:
+                        raise DeadlineExceeded('Command to ' + speaker_ip + ' expired in the queue')
+                    if self.rate:
+                        speaker.next_slot = start + 1.0 / self.rate
+
+                if start > now:
+                    time.sleep(start - now)
+
+                try:
+                    result = function(deadline - time.monotonic())
+                except NETWORK_ERRORS:
+                    delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.0)
+
+                    with self._lock:
+                        speaker.failures += 1
+                        if trial or speaker.failures >= self.failure_threshold:
+                            speaker.opened_at = time.monotonic()
+                        retry = idempotent and attempt < self.retries and speaker.opened_at is None
+
+                    if not retry or time.monotonic() + delay >= deadline:
+                        raise
+
+                    time.sleep(delay)
+                    attempt += 1
+                else:
+                    with self._lock:
+                        speaker.failures = 0
+                        speaker.opened_at = None
+
+                    return result
+        finally:
+            if trial:
+                with self._lock:
+                    speaker.trial = False
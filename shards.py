@@ -0,0 +1,359 @@
+import collections
+import concurrent.futures
+import inspect
+import itertools
+import multiprocessing
+import os
+import pickle
+import threading
+import time
+import zlib
+
+from fleet import FleetResult, SoCoFleet
+from soco import SoCo
+
+
+class ShardedController(object):
+    """Drive very many speakers from a pool of worker processes.
+
+    The speakers are split into shards, one per worker process, so that
+    neither the GIL nor one process's sockets limit how many speakers can be
+    driven at once. Each worker has its own connection pool, topology,
+    optional state caches and event subscriptions, and runs its speakers'
+    commands on its own threads.
+
+    Speakers are sharded by household (the default, which keeps a household's
+    topology and group commands in one process, and balances households
+    over the workers by size), by UID or by IP address.
+
+    Any public SoCo function can be called on the controller, e.g.
+    controller.pause() or controller.volume(20). The call is sent to every
+    shard at once and returns a dictionary mapping each speaker IP to a
+    fleet.FleetResult, like SoCoFleet.
+
+    The workers are started with the 'spawn' method, so scripts using the
+    controller need an `if __name__ == '__main__':` guard.
+
+    Public functions:
+    call -- Run a SoCo function on one speaker.
+    run -- Run a SoCo function on many speakers.
+    shard_of -- Get the shard a speaker is in.
+    close -- Stop the worker processes.
+
+    """
+
+    def __init__(self, speaker_ips, processes=None, shard_by='household', threads=32, cache_ttl=None,
+                 events=False):
+        """ Arguments:
+        speaker_ips -- The IP addresses of the speakers.
+        processes -- Number of worker processes. Defaults to the number of
+                     CPUs.
+        shard_by -- 'household', 'uid' or 'ip'. The first two fetch every
+                    speaker's info once, in parallel, to find out.
+        threads -- Maximum number of commands each worker runs at once.
+        cache_ttl -- Give every speaker a cache.StateCache with this TTL.
+                     None for no caching.
+        events -- With a cache, keep it current through each speaker's
+                  RenderingControl and AVTransport events.
+
+        """
+        self.processes = processes or os.cpu_count() or 1
+        self.shards = [[] for _ in range(self.processes)]
+        self._shard_of = {}
+
+        for shard, ips in enumerate(self._assign(list(speaker_ips), shard_by)):
+            self.shards[shard] = ips
+            for ip in ips:
+                self._shard_of[ip] = shard
+
+        self._ids = itertools.count()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._workers = []
+
+        context = multiprocessing.get_context('spawn')
+
+        for ips in self.shards:
+            connection, child = context.Pipe()
+            process = context.Process(target=_worker, args=(child, ips, threads, cache_ttl, events))
+            process.daemon = True
+            process.start()
+            child.close()
+
+            receiver = threading.Thread(target=self._receive, args=(len(self._workers), connection))
+            receiver.daemon = True
+            receiver.start()
+
+            self._workers.append((process, connection, threading.Lock()))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getattr__(self, name):
+        if name.startswith('_') or not callable(getattr(SoCo, name, None)):
+            raise AttributeError(name)
+
+        def sharded_call(*args, **kwargs):
+            return self.run(name, *args, **kwargs)
+
+        sharded_call.__name__ = name
+        return sharded_call
+
+    def shard_of(self, speaker_ip):
+        """ Get the index of the shard (and worker process) a speaker is in. """
+        return self._shard_of[speaker_ip]
+
+    def call(self, speaker_ip, method, *args, **kwargs):
+        """ Run a SoCo function on one speaker, in its shard's worker.
+
+        Arguments:
+        speaker_ip -- IP address of the speaker.
+        method -- Name of the SoCo function to run.
+        timeout -- Keyword only. Seconds to wait for the result.
+
+        Any other arguments are passed to the SoCo function.
+
+        Returns:
+        What the SoCo function returned. Generators (like get_queue) are
+        returned as lists.
+
+        Raises:
+        What the SoCo function raised, or concurrent.futures.TimeoutError.
+
+        """
+        timeout = kwargs.pop('timeout', None)
+
+        result = self.run(method, *args, speaker_ips=[speaker_ip], timeout=timeout, **kwargs)[speaker_ip]
+        if result.error is not None:
+            raise result.error
+
+        return result.value
+
+    def run(self, method, *args, **kwargs):
+        """ Run a SoCo function on many speakers, every shard at the same time.
+
+        Arguments:
+        method -- Name of the SoCo function to run.
+        speaker_ips -- Keyword only. The speakers to run it on. Defaults to
+                       every speaker.
+        timeout -- Keyword only. Overall deadline in seconds for this call.
+
+        Any other arguments are passed to the SoCo function.
+
+        Returns:
+        A dictionary mapping each speaker IP to a fleet.FleetResult, in the
+        order the speakers were given. Speakers that didn't answer before the
+        deadline get a concurrent.futures.TimeoutError as their error.
+
+        """
+        speaker_ips = kwargs.pop('speaker_ips', None)
+        timeout = kwargs.pop('timeout', None)
+        started = time.monotonic()
+
+        if speaker_ips is None:
+            speaker_ips = [ip for ips in self.shards for ip in ips]
+
+        by_shard = collections.defaultdict(list)
+        for ip in speaker_ips:
+            by_shard[self._shard_of[ip]].append(ip)
+
+        futures = dict((self._send(shard, (ips, method, args, kwargs)), ips) for shard, ips in by_shard.items())
+        done, _ = concurrent.futures.wait(futures, timeout=timeout)
+
+        merged = {}
+        for future in done:
+            try:
+                merged.update(future.result())
+            except Exception as e:
+                # The worker process died.
+                merged.update((ip, FleetResult(None, e, time.monotonic() - started)) for ip in futures[future])
+
+        results = collections.OrderedDict()
+        for ip in speaker_ips:
+            results[ip] = merged.get(ip) or FleetResult(None, concurrent.futures.TimeoutError(), time.monotonic() - started)
+
+        return results
+
+    def close(self):
+        """ Stop the worker processes. """
+        for process, connection, lock in self._workers:
+            try:
+                with lock:
+                    connection.send(None)
+            except (OSError, EOFError):
+                pass
+
+        for process, connection, lock in self._workers:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+            connection.close()
+
+        self._workers = []
+
+    def _assign(self, speaker_ips, shard_by):
+        """ Split the speakers into self.processes lists. """
+        if shard_by == 'ip':
+            keys = dict((ip, ip) for ip in speaker_ips)
+        else:
+            field = 'household_id' if shard_by == 'household' else 'uid'
+            with SoCoFleet(speaker_ips) as fleet:
+                infos = fleet.get_speaker_info()
+            # Speakers that didn't answer are sharded by IP.
+            keys = dict((ip, result.value[field] if result.error is None and result.value[field] else ip)
+                        for ip, result in infos.items())
+
+        groups = collections.OrderedDict()
+        for ip in speaker_ips:
+            groups.setdefault(keys[ip], []).append(ip)
+
+        shards = [[] for _ in range(self.processes)]
+
+        if shard_by == 'household':
+            # Largest households first, each to the emptiest shard.
+            for ips in sorted(groups.values(), key=len, reverse=True):
+                min(shards, key=len).extend(ips)
+        else:
+            # A stable hash, so a speaker stays in the same shard across runs.
+            for key, ips in groups.items():
+                shards[zlib.crc32(key.encode('utf-8')) % self.processes].extend(ips)
+
+        return shards
+
+    def _send(self, shard, request):
+        future = concurrent.futures.Future()
+        request_id = next(self._ids)
+
+        with self._lock:
+            self._pending[request_id] = (shard, future)
+
+        process, connection, lock = self._workers[shard]
+        try:
+            with lock:
+                connection.send((request_id,) + request)
+        except (EOFError, OSError) as e:
+            with self._lock:
+                self._pending.pop(request_id, None)
+            future.set_exception(e)
+
+        return future
+
+    def _receive(self, shard, connection):
+        """ Hand the results a worker sends back to the waiting futures. """
+        while True:
+            try:
+                request_id, results = connection.recv()
+            except (EOFError, OSError):
+                break
+
+            with self._lock:
+                owner, future = self._pending.pop(request_id, (shard, None))
+
+            if future is not None:
+                future.set_result(results)
+
+        # The worker is gone: fail whatever was still waiting for it.
+        with self._lock:
+            lost = [request_id for request_id, (owner, future) in self._pending.items() if owner == shard]
+            futures = [self._pending.pop(request_id)[1] for request_id in lost]
+
+        for future in futures:
+            future.set_exception(EOFError('Worker process %d exited' % shard))
+
+
+def _worker(connection, speaker_ips, threads, cache_ttl, subscribe):
+    """ A worker process: run the commands of its shard's speakers. """
+    from cache import StateCache
+    from topology import Topology
+
+    topology = Topology()
+    speakers = {}
+
+    for ip in speaker_ips:
+        cache = StateCache(ttl=cache_ttl) if cache_ttl is not None else None
+        speakers[ip] = SoCo(ip, cache=cache, topology=topology)
+
+        if cache is not None and subscribe:
+            import events
+            try:
+                for service in ('RenderingControl', 'AVTransport'):
+                    events.subscribe(ip, service, callback=cache.on_event)
+            except Exception:
+                # The cache still works without events, only with its TTL.
+                pass
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+    send_lock = threading.Lock()
+
+    def reply(request_id, results):
+        _reply(connection, send_lock, request_id, results)
+
+    while True:
+        try:
+            request = connection.recv()
+        except (EOFError, OSError):
+            break
+        if request is None:
+            break
+
+        request_id, ips, method, args, kwargs = request
+        _dispatch(executor, speakers, request_id, ips, method, args, kwargs, reply)
+
+    executor.shutdown(wait=False)
+    connection.close()
+
+
+def _dispatch(executor, speakers, request_id, ips, method, args, kwargs, reply):
+    """ Run a request on its speakers, replying once they have all finished. """
+    results = {}
+    lock = threading.Lock()
+
+    def run(ip):
+        started = time.monotonic()
+        try:
+            value = getattr(speakers[ip], method)(*args, **kwargs)
+            if inspect.isgenerator(value):
+                value = list(value)
+            result = FleetResult(value, None, time.monotonic() - started)
+        except Exception as e:
+            result = FleetResult(None, e, time.monotonic() - started)
+
+        with lock:
+            results[ip] = result
+            finished = len(results) == len(ips)
+
+        if finished:
+            reply(request_id, results)
+
+    for ip in ips:
+        executor.submit(run, ip)
+
+
+def _reply(connection, lock, request_id, results):
+    """ Send a request's results to the front end.
+
+    The results are only checked one by one (see _picklable) when they can't
+    be sent as they are, so that the usual case pickles them once.
+
+    """
+    with lock:
+        try:
+            connection.send((request_id, results))
+        except (pickle.PicklingError, TypeError, AttributeError):
+            # Nothing was written: the message is pickled before it's sent.
+            connection.send((request_id, dict((ip, _picklable(result)) for ip, result in results.items())))
+
+
+def _picklable(result):
+    """ Replace a value or error that can't be sent back to the front end. """
+    try:
+        pickle.dumps(result)
+        return result
+    except Exception:
+        if result.error is not None:
+            return result._replace(error=RuntimeError(repr(result.error)))
+        return result._replace(value=None, error=RuntimeError('Result of type %s cannot be sent between processes'
+                                                               % type(result.value).__name__))
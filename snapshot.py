@@ -0,0 +1,251 @@
+import collections
+import concurrent.futures
+import json
+import os
+import time
+
+from fleet import FleetResult
+from soco import SoCo
+from topology import Topology
+
+
+TransportState = collections.namedtuple('TransportState', ['uri', 'metadata', 'track', 'position', 'state'])
+TransportState.__doc__ = """What a group coordinator was playing.
+
+uri -- The URI loaded on the coordinator (x-rincon-queue:<uid>#0 for its queue).
+metadata -- The URI's DIDL-Lite metadata.
+track -- The track number within the queue.
+position -- The position within the track, e.g. '0:01:30'.
+state -- 'PLAYING', 'PAUSED_PLAYBACK', 'STOPPED' or 'TRANSITIONING'.
+
+"""
+
+SpeakerState = collections.namedtuple('SpeakerState', ['ip', 'uid', 'coordinator_uid', 'volume', 'mute', 'bass',
+                                                       'treble', 'loudness', 'transport'])
+SpeakerState.__doc__ = """The state of one speaker, as captured by snapshot().
+
+ip -- The speaker's IP address.
+uid -- The speaker's UID, or None if it wasn't in the topology.
+coordinator_uid -- UID of the coordinator of the speaker's group (its own UID
+                   if it coordinates the group).
+volume, mute, bass, treble, loudness -- The speaker's rendering settings.
+transport -- A TransportState for group coordinators, None for members
+             (they play whatever their coordinator plays).
+
+"""
+
+# Streams have no position to go back to.
+STREAM_PREFIXES = ('x-rincon:', 'x-rincon-stream:', 'x-rincon-mp3radio:', 'x-sonosapi-stream:',
+                   'x-sonosapi-radio:', 'x-sonosapi-hls:', 'hls-radio:', 'aac:')
+
+DEFAULT_SNAPSHOT_PATH = os.path.join(os.path.expanduser('~'), '.sonoshell', 'snapshot.json')
+
+
+def snapshot(speaker_ips, max_workers=32, scheduler=None):
+    """ Capture the state of many speakers at once, e.g. before an announcement.
+
+    Every getter of every speaker is sent at the same time, so taking a
+    snapshot of a household costs about as long as a couple of requests to
+    one speaker. The transport is only captured for group coordinators, as
+    members play whatever their coordinator plays. A speaker that can't be
+    captured doesn't stop the others from being captured.
+
+    Arguments:
+    speaker_ips -- The IP addresses of the speakers, or a single IP address
+                   to capture every visible speaker of its household.
+    max_workers -- Maximum number of requests in flight at the same time.
+    scheduler -- An optional scheduler.CommandScheduler, see SoCo.
+
+    Returns:
+    A dictionary mapping each speaker IP to a fleet.FleetResult, whose value
+    is the speaker's SpeakerState, or whose error is what its getters raised
+    (e.g. actions.UPnPError). See captured() for the SpeakerStates.
+
+    """
+    started = time.time()
+    household = isinstance(speaker_ips, str)
+    if household:
+        speaker_ips = [speaker_ips]
+
+    try:
+        groups = Topology(scheduler=scheduler).groups(speaker_ips[0])
+    except Exception:
+        groups = []
+    members = dict((member.ip, (member, group)) for group in groups for member in group.members)
+
+    if household:
+        speaker_ips = [ip for ip, (member, group) in members.items() if not member.invisible] or speaker_ips
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = []
+
+        for ip in speaker_ips:
+            sonos = SoCo(ip, scheduler=scheduler)
+            member, group = members.get(ip, (None, None))
+            uid = member.uid if member is not None else None
+            coordinator_uid = group.coordinator.uid if group is not None else uid
+
+            rendering = [executor.submit(function) for function in
+                         (sonos.volume, sonos.mute, sonos.bass, sonos.treble, sonos.get_loudness)]
+
+            transport = None
+            if coordinator_uid == uid:
+                transport = [executor.submit(function) for function in
+                             (sonos.get_media_info, sonos.get_position_info, sonos.get_transport_info)]
+
+            pending.append((ip, uid, coordinator_uid, rendering, transport))
+
+        results = collections.OrderedDict()
+
+        for ip, uid, coordinator_uid, rendering, transport in pending:
+            try:
+                volume, mute, bass, treble, loudness = [future.result() for future in rendering]
+
+                if transport is not None:
+                    media, position, transport_info = [future.result() for future in transport]
+                    transport = TransportState(media.get('CurrentURI', ''),
+                                               media.get('CurrentURIMetaData', ''),
+                                               int(position.get('Track') or 0),
+                                               position.get('RelTime', ''),
+                                               transport_info.get('CurrentTransportState', ''))
+
+                state = SpeakerState(ip, uid, coordinator_uid, volume, mute, bass, treble, loudness, transport)
+                results[ip] = FleetResult(state, None, time.time() - started)
+            except Exception as e:
+                results[ip] = FleetResult(None, e, time.time() - started)
+
+    return results
+
+
+def captured(results):
+    """ Get the SpeakerStates of the speakers snapshot() could capture. """
+    return [result.value for result in results.values() if result.error is None]
+
+
+def restore(speakers, max_workers=32, scheduler=None):
+    """ Put speakers back the way snapshot() found them.
+
+    Speakers that left their group are put back first. Then, all at the
+    same time, the coordinators get their URI, track, position and play
+    state back, and every speaker its rendering settings. Speakers already
+    in the right group aren't regrouped, so restoring costs one topology
+    request plus one request per setting.
+
+    Arguments:
+    speakers -- A list of SpeakerState, as returned by captured() or load().
+    max_workers -- Maximum number of requests in flight at the same time.
+    scheduler -- An optional scheduler.CommandScheduler, see SoCo.
+
+    Returns:
+    A dictionary mapping each speaker IP to a list of (step, error) pairs
+    for whatever couldn't be restored. The lists are empty on success.
+
+    """
+    failures = collections.OrderedDict((state.ip, []) for state in speakers)
+    if not speakers:
+        return failures
+
+    sonos = dict((state.ip, SoCo(state.ip, scheduler=scheduler)) for state in speakers)
+
+    try:
+        groups = Topology(scheduler=scheduler).groups(speakers[0].ip)
+    except Exception:
+        groups = []
+    current = dict((member.uid, group.coordinator.uid) for group in groups for member in group.members)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+        def run(steps):
+            """ Run (ip, name, function, args) steps at the same time, recording failures. """
+            futures = [(ip, name, executor.submit(_attempt, function, *args)) for ip, name, function, args in steps]
+            for ip, name, future in futures:
+                error = future.result()
+                if error is not None:
+                    failures[ip].append((name, error))
+
+        # Coordinators that have joined another group since the snapshot
+        # have to leave it before their members can rejoin them.
+        run([(state.ip, 'unjoin', sonos[state.ip].unjoin, ()) for state in speakers
+             if state.transport is not None and state.uid is not None and current.get(state.uid, state.uid) != state.uid])
+
+        steps = []
+
+        for state in speakers:
+            speaker = sonos[state.ip]
+
+            if state.transport is not None:
+                steps.append((state.ip, 'transport', _restore_transport, (speaker, state.transport)))
+            elif current.get(state.uid) != state.coordinator_uid:
+                steps.append((state.ip, 'join', speaker.join, (state.coordinator_uid,)))
+
+            steps.extend([
+                (state.ip, 'volume', speaker.volume, (state.volume,)),
+                (state.ip, 'mute', speaker.mute, (state.mute,)),
+                (state.ip, 'bass', speaker.bass, (state.bass,)),
+                (state.ip, 'treble', speaker.treble, (state.treble,)),
+                (state.ip, 'loudness', speaker.set_loudness, (state.loudness,)),
+            ])
+
+        run(steps)
+
+    return failures
+
+
+def save(speakers, path=DEFAULT_SNAPSHOT_PATH):
+    """ Write a snapshot to a JSON file. """
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    document = {
+        'taken': time.time(),
+        'speakers': [dict(state._asdict(), transport=state.transport._asdict() if state.transport else None)
+                     for state in speakers],
+    }
+
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=2)
+
+
+def load(path=DEFAULT_SNAPSHOT_PATH):
+    """ Read a snapshot written by save(), as a list of SpeakerState. """
+    with open(path) as f:
+        document = json.load(f)
+
+    speakers = []
+    for fields in document['speakers']:
+        transport = fields.pop('transport')
+        speakers.append(SpeakerState(transport=TransportState(**transport) if transport else None, **fields))
+
+    return speakers
+
+
+def _restore_transport(speaker, transport):
+    """ Load a coordinator's URI again, and go back to its track, position and play state. """
+    if not transport.uri:
+        # Nothing was loaded.
+        return True
+
+    result = speaker.set_transport_uri(transport.uri, transport.metadata)
+
+    if result is True and transport.uri.startswith('x-rincon-queue:') and transport.track:
+        result = speaker.seek(transport.track, 'TRACK_NR')
+
+    if result is True and not transport.uri.startswith(STREAM_PREFIXES) \
+            and transport.position and transport.position not in ('0:00:00', 'NOT_IMPLEMENTED'):
+        result = speaker.seek(transport.position)
+
+    if result is True and transport.state in ('PLAYING', 'TRANSITIONING'):
+        result = speaker.play()
+
+    return result
+
+
+def _attempt(function, *args):
+    """ Call a SoCo setter. Returns None on success, otherwise the error code or exception. """
+    try:
+        result = function(*args)
+    except Exception as e:
+        return e
+
+    return None if result is True else result
@@ -1,6 +1,127 @@
-import xml.etree.cElementTree as XML
+import threading
+import time
 
 import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from actions import ACTIONS, ENDPOINTS, ResponseError, UPnPError
+from didl import iter_didl, to_didl
+from metrics import CallRecord
+from models import Track, parse_speaker_info
+
+
+class ConnectionPool(object):
+    """A shared pool of keep-alive HTTP sessions, one per Sonos speaker.
+
+    Every request to a speaker reuses the same persistent connection(s) to
+    port 1400 instead of paying for a fresh TCP handshake each time. Sessions
+    that haven't been used for idle_timeout seconds are closed the next time
+    the pool is touched.
+
+    Public functions:
+    request -- Send an arbitrary HTTP request (e.g. SUBSCRIBE) to a speaker.
+    get -- Send a GET request to a speaker.
+    post -- Send a POST request to a speaker.
+    evict_idle -- Close sessions that have been idle for too long.
+    close -- Close every session in the pool.
+
+    """
+
+    def __init__(self, pool_size=4, connect_timeout=3.05, read_timeout=10,
+                 idle_timeout=60):
+        """ Arguments:
+        pool_size -- Maximum number of connections kept open per speaker.
+        connect_timeout -- Seconds to wait for a connection to be established.
+        read_timeout -- Seconds to wait for the speaker to send a response.
+        idle_timeout -- Seconds after which an unused session is closed.
+
+        """
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.idle_timeout = idle_timeout
+
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def request(self, method, speaker_ip, path, **kwargs):
+        """ Send an HTTP request to http://speaker_ip:1400/path.
+
+        Returns:
+        The requests.Response returned by the Sonos speaker.
+
+        """
+        kwargs.setdefault('timeout', self._timeout())
+        return self._session(speaker_ip).request(method, self._url(speaker_ip, path), **kwargs)
+
+    def get(self, speaker_ip, path, **kwargs):
+        """ Send a GET request to http://speaker_ip:1400/path.
+
+        Returns:
+        The requests.Response returned by the Sonos speaker.
+
+        """
+        return self.request('GET', speaker_ip, path, **kwargs)
+
+    def post(self, speaker_ip, path, data, headers, **kwargs):
+        """ Send a POST request to http://speaker_ip:1400/path.
+
+        Returns:
+        The requests.Response returned by the Sonos speaker.
+
+        """
+        return self.request('POST', speaker_ip, path, data=data, headers=headers, **kwargs)
+
+    def evict_idle(self):
+        """ Close every session that hasn't been used for idle_timeout seconds.
+
+        Returns:
+        The number of sessions that were closed.
+
+        """
+        cutoff = time.time() - self.idle_timeout
+
+        with self._lock:
+            stale = [ip for ip, (session, last_used) in self._sessions.items() if last_used < cutoff]
+            sessions = [self._sessions.pop(ip)[0] for ip in stale]
+
+        for session in sessions:
+            session.close()
+
+        return len(sessions)
+
+    def close(self):
+        """ Close every session in the pool. """
+        with self._lock:
+            sessions = [session for session, last_used in self._sessions.values()]
+            self._sessions.clear()
+
+        for session in sessions:
+            session.close()
+
+    def _session(self, speaker_ip):
+        """ Return the session for a speaker, creating it if needed. """
+        self.evict_idle()
+
+        with self._lock:
+            if speaker_ip in self._sessions:
+                session = self._sessions[speaker_ip][0]
+            else:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount('http://', adapter)
+
+            self._sessions[speaker_ip] = (session, time.time())
+
+        return session
+
+    def _timeout(self):
+        return (self.connect_timeout, self.read_timeout)
+
+    def _url(self, speaker_ip, path):
+        return 'http://' + speaker_ip + ':1400' + path
+
 
 class SoCo(object):
     """A simple class for controlling a Sonos speaker.
@@ -11,27 +132,86 @@ class SoCo(object):
     stop -- Stop the currently playing track.
     next -- Go to the next track.
     previous -- Go back to the previous track.
-    mute -- Mute (or unmute) the speaker.
+    mute -- Get the mute state, or mute (or unmute) the speaker.
+    seek -- Seek within the current track, or to a track of the queue.
+    set_transport_uri -- Load a URI without playing it.
+    join -- Join the group of another speaker.
+    unjoin -- Leave the speaker's group.
     volume -- Get or set the volume of the speaker.
+    set_relative_volume -- Turn the volume of the speaker up or down.
+    group_volume -- Get or set the volume of the speaker's whole group.
+    set_relative_group_volume -- Turn the whole group up or down.
     bass -- Get or set the speaker's bass EQ.
     treble -- Set the speaker's treble EQ.
     set_loudness -- Turn on (or off) the speaker's loudness compensation.
+    get_loudness -- Get the speaker's loudness compensation.
     switch_to_line_in -- Switch the speaker's input to line-in.
     status_light -- Turn on (or off) the Sonos status light.
     get_current_track_info -- Get information about the currently playing track.
+    get_media_info -- Get the URI loaded on the speaker.
+    get_position_info -- Get the current track number and position.
+    get_transport_info -- Get whether the speaker is playing.
     get_speaker_info -- Get information about the Sonos speaker.
+    browse -- Page through a ContentDirectory container.
+    get_queue -- Page through the speaker's queue.
+    add_to_queue -- Add many tracks to the queue, in batches.
+    remove_from_queue -- Remove a range of tracks from the queue.
+    reorder_queue -- Move a range of tracks within the queue.
+    clear_queue -- Remove every track from the queue.
+    save_queue -- Save the queue as a Sonos playlist.
+    play_from_queue -- Play the queue from a given track.
+    get_library -- Page through the music library.
+    get_system_update_id -- Get the music library's update counter.
+    get_zone_group_state -- Get the household's zone group topology.
 
     """
 
-    TRANSPORT_ENDPOINT = '/MediaRenderer/AVTransport/Control'
-    RENDERING_ENDPOINT = '/MediaRenderer/RenderingControl/Control'
-    DEVICE_ENDPOINT = '/DeviceProperties/Control'
-    MEDIA_SERVER_ENDPOINT = '/MediaServer/ContentDirectory/Control'
-
-    speaker_info = {}
+    LIBRARY_CATEGORIES = {
+        'artists': 'A:ARTIST',
+        'album_artists': 'A:ALBUMARTIST',
+        'albums': 'A:ALBUM',
+        'genres': 'A:GENRE',
+        'composers': 'A:COMPOSER',
+        'tracks': 'A:TRACKS',
+        'playlists': 'A:PLAYLISTS',
+        'sonos_playlists': 'SQ:',
+    }
+
+    TRANSPORT_ENDPOINT = ENDPOINTS['AVTransport']
+    RENDERING_ENDPOINT = ENDPOINTS['RenderingControl']
+    DEVICE_ENDPOINT = ENDPOINTS['DeviceProperties']
+    MEDIA_SERVER_ENDPOINT = ENDPOINTS['ContentDirectory']
+    TOPOLOGY_ENDPOINT = ENDPOINTS['ZoneGroupTopology']
+
+    # Sonos refuses AddMultipleURIsToQueue calls with more URIs than this.
+    QUEUE_BATCH_SIZE = 16
+
+    # Services whose actions act on the whole group, and so are sent to the
+    # group coordinator when a topology is available.
+    GROUP_SERVICES = ('AVTransport', 'GroupRenderingControl')
+
+    # Shared by every SoCo instance so that each speaker gets exactly one
+    # keep-alive session, no matter how many SoCo objects point at it.
+    pool = ConnectionPool()
+
+    def __init__(self, speaker_ip, cache=None, topology=None, scheduler=None):
+        """ Arguments:
+        speaker_ip -- IP address of the Sonos speaker.
+        cache -- An optional cache.StateCache. When given, getters are served
+                 from it while fresh and successful setters update it.
+        topology -- An optional topology.Topology. When given, transport
+                    commands are sent to the coordinator of the speaker's
+                    group instead of the speaker itself.
+        scheduler -- An optional scheduler.CommandScheduler. When given, every
+                     request goes through it, for ordering, deadlines,
+                     retries and fail-fast on offline speakers.
 
-    def __init__(self, speaker_ip):
+        """
         self.speaker_ip = speaker_ip
+        self.speaker_info = None
+        self.cache = cache
+        self.topology = topology
+        self.scheduler = scheduler
 
     def play(self, uri=''):
         """Play the currently selected track or play a stream.
@@ -47,30 +227,22 @@ class SoCo(object):
         speaker will be returned.
 
         """
-        if uri is not '':
-            action = '"urn:schemas-upnp-org:service:AVTransport:1#SetAVTransportURI"'
+        if uri != '':
+            result = self.__call('SetAVTransportURI', CurrentURI=uri)
 
-            body = '<u:SetAVTransportURI xmlns:u="urn:schemas-upnp-org:service:AVTransport:1"><InstanceID>0</InstanceID><CurrentURI>' + uri + '</CurrentURI><CurrentURIMetaData></CurrentURIMetaData></u:SetAVTransportURI>'
-
-            response = self.__send_command(SoCo.TRANSPORT_ENDPOINT, action, body)
-
-            if (response == '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"><s:Body><u:SetAVTransportURIResponse xmlns:u="urn:schemas-upnp-org:service:AVTransport:1"></u:SetAVTransportURIResponse></s:Body></s:Envelope>'):
+            if result is True:
                 # The track is enqueued, now play it.
                 return self.play()
             else:
-                return self.__parse_error(response)
+                return result
 
         else:
-            action = '"urn:schemas-upnp-org:service:AVTransport:1#Play"'
+            result = self.__call('Play')
 
-            body = '<u:Play xmlns:u="urn:schemas-upnp-org:service:AVTransport:1"><InstanceID>0</InstanceID><Speed>1</Speed></u:Play>'
+            if result is True:
+                self.__cache_invalidate('track_info')
 
-            response = self.__send_command(SoCo.TRANSPORT_ENDPOINT, action, body)
-
-            if (response == '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"><s:Body><u:PlayResponse xmlns:u="urn:schemas-upnp-org:service:AVTransport:1"></u:PlayResponse></s:Body></s:Envelope>'):
-                return True
-            else:
-                return self.__parse_error(response)
+            return result
 
     def pause(self):
         """ Pause the currently playing track.
@@ -83,16 +255,12 @@ class SoCo(object):
         speaker will be returned.
         
         """
-        action = '"urn:schemas-upnp-org:service:AVTransport:1#Pause"'
+        result = self.__call('Pause')
 
-        body = '<u:Pause xmlns:u="urn:schemas-upnp-org:service:AVTransport:1"><InstanceID>0</InstanceID><Speed>1</Speed></u:Pause>'
+        if result is True:
+            self.__cache_invalidate('track_info')
 
-        response = self.__send_command(SoCo.TRANSPORT_ENDPOINT, action, body)
-
-        if (response == '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"><s:Body><u:PauseResponse xmlns:u="urn:schemas-upnp-org:service:AVTransport:1"></u:PauseResponse></s:Body></s:Envelope>'):
-            return True
-        else:
-            return self.__parse_error(response)
+        return result
 
     def stop(self):
         """ Stop the currently playing track.
@@ -105,16 +273,12 @@ class SoCo(object):
         speaker will be returned.
         
         """
-        action = '"urn:schemas-upnp-org:service:AVTransport:1#Stop"'
-
-        body = '<u:Stop xmlns:u="urn:schemas-upnp-org:service:AVTransport:1"><InstanceID>0</InstanceID><Speed>1</Speed></u:Stop>'
+        result = self.__call('Stop')
 
-        response = self.__send_command(SoCo.TRANSPORT_ENDPOINT, action, body)
+        if result is True:
+            self.__cache_invalidate('track_info')
 
-        if (response == '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"><s:Body><u:StopResponse xmlns:u="urn:schemas-upnp-org:service:AVTransport:1"></u:StopResponse></s:Body></s:Envelope>'):
-            return True
-        else:
-            return self.__parse_error(response)
+        return result
 
     def next(self):
         """ Go to the next track.
@@ -131,16 +295,12 @@ class SoCo(object):
         songs can be skipped).
         
         """
-        action = '"urn:schemas-upnp-org:service:AVTransport:1#Next"'
-
-        body = '<u:Next xmlns:u="urn:schemas-upnp-org:service:AVTransport:1"><InstanceID>0</InstanceID><Speed>1</Speed></u:Next>'
+        result = self.__call('Next')
 
-        response = self.__send_command(SoCo.TRANSPORT_ENDPOINT, action, body)
+        if result is True:
+            self.__cache_invalidate('track_info')
 
-        if (response == '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"><s:Body><u:NextResponse xmlns:u="urn:schemas-upnp-org:service:AVTransport:1"></u:NextResponse></s:Body></s:Envelope>'):
-            return True
-        else:
-            return self.__parse_error(response)
+        return result
 
     def previous(self):
         """ Go back to the previously played track.
@@ -156,144 +316,177 @@ class SoCo(object):
         go back on tracks.
         
         """
-        action = '"urn:schemas-upnp-org:service:AVTransport:1#Previous"'
+        result = self.__call('Previous')
 
-        body = '<u:Previous xmlns:u="urn:schemas-upnp-org:service:AVTransport:1"><InstanceID>0</InstanceID><Speed>1</Speed></u:Previous>'
+        if result is True:
+            self.__cache_invalidate('track_info')
 
-        response = self.__send_command(SoCo.TRANSPORT_ENDPOINT, action, body)
+        return result
 
-        if (response == '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"><s:Body><u:PreviousResponse xmlns:u="urn:schemas-upnp-org:service:AVTransport:1"></u:PreviousResponse></s:Body></s:Envelope>'):
-            return True
-        else:
-            return self.__parse_error(response)
-
-    def mute(self, mute):
-        """ Mute or unmute the Sonos speaker.
+    def mute(self, mute: bool = None):
+        """ Get, or mute or unmute, the Sonos speaker.
 
         Arguments:
-        mute -- True to mute. False to unmute.
+        mute -- True to mute. False to unmute. Leave out to get the current
+                mute state.
         
         Returns:
-        True if the Sonos speaker was successfully muted or unmuted.
+        If the mute argument was specified: True if the Sonos speaker was
+        successfully muted or unmuted.
+
+        If the mute argument was not specified: True if the speaker is muted,
+        otherwise False.
         
         If an error occurs, we'll attempt to parse the error and return a UPnP
         error code. If that fails, the raw response sent back from the Sonos
-        speaker will be returned.
+        speaker will be returned. Getting the mute state raises an
+        actions.UPnPError instead.
         
         """
-        if mute is True:
-            mute_value = '1'
-        else:
-            mute_value = '0'
-
-        action = '"urn:schemas-upnp-org:service:RenderingControl:1#SetMute"'
+        if mute is not None:
+            result = self.__call('SetMute', DesiredMute=mute is True)
 
-        body = '<u:SetMute xmlns:u="urn:schemas-upnp-org:service:RenderingControl:1"><InstanceID>0</InstanceID><Channel>Master</Channel><DesiredMute>' + mute_value + '</DesiredMute></u:SetMute>'
+            if result is True:
+                self.__cache_set('mute', mute is True)
 
-        response = self.__send_command(SoCo.RENDERING_ENDPOINT, action, body)
-
-        if (response == '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"><s:Body><u:SetMuteResponse xmlns:u="urn:schemas-upnp-org:service:RenderingControl:1"></u:SetMuteResponse></s:Body></s:Envelope>'):
-            return True
+            return result
         else:
-            return self.parse(response)
+            cached = self.__cache_get('mute')
+            if cached is not None:
+                return cached
+
+            mute = self.__query('GetMute')['CurrentMute'] == '1'
 
+            self.__cache_set('mute', mute)
 
+            return mute
 
-    def start_playlist(self, nr=''):
-        """start a playlist
+    def seek(self, target, unit='REL_TIME'):
+        """ Seek within the current track, or to a track of the queue.
 
         Arguments:
+        target -- A position like '0:01:30' for REL_TIME, or a track number
+                  (starting at 1) for TRACK_NR.
+        unit -- 'REL_TIME' or 'TRACK_NR'.
 
         Returns:
+        True if the Sonos speaker successfully seeked.
 
-        """
-
-        # temporary
-        nr = str(1)
-
-        if nr is '':
-            action = ''
-        else:
-            action = '"urn:schemas-upnp-org:service:AVTransport:1#StartAutoplay"'
-
-            body = '<u:StartAutoplay xmlns:u="urn:schemas-upnp-org:service:AVTransport:1"><InstanceID>0</InstanceID><ProgramURI>file:///jffs/settings/savedqueues.rsq#0</ProgramURI><ProgramMetaData>DIDL-Lite xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:upup="urn:schemas-upnp.org:metadata-1-0/upnp/" xmlns:r="urn:schemas-rinconnetworks-com:metadata-1-0/" xmlns="urn:schemas-upnp-org:metadata-1-0/DIDL-Lite/" itemid="SD:0" parentID="SD"></ProgramMetaData><Volume>8</Volume><IncludeLinkedZones>0</IncludeLinkedZones><ResetVolumeAfter>1</ResetVolumeAfter></u:StartAutoplay>'
+        If an error occurs, we'll attempt to parse the error and return a UPnP
+        error code. If that fails, the raw response sent back from the Sonos
+        speaker will be returned.
 
-            # <ProgramURI>file:///jffs/settings/savedqueues.rsq#0</ProgramURI><ProgramMetaData>DIDL-Lite xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:upup="urn:schemas-upnp.org:metadata-1-0/upnp/" xmlns:r="urn:schemas-rinconnetworks-com:metadata-1-0/" xmlns="urn:schemas-upnp-org:metadata-1-0/DIDL-Lite/" itemid="SD:0" parentID="SD"></ProgramMetaData>
+        """
+        result = self.__call('Seek', Unit=unit, Target=target)
 
-            response = self.__send_command(SoCo.TRANSPORT_ENDPOINT, action, body)
+        if result is True:
+            self.__cache_invalidate('track_info')
 
-            if (response == '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"><s:Body><u:StartAutoplayResponse xmlns:u="urn:schemas-upnp-org:service:AVTransport:1"></u:StartAutoplayResponse></s:Body></s:Envelope>'):
-                return True
-            else:
-                return self.__parse_error(response)
+        return result
 
-    # def start_playlist(self, nr=''):
-    #     """start a playlist
+    def set_transport_uri(self, uri, metadata=''):
+        """ Load a URI without starting to play it.
 
-    #     Arguments:
-
-    #     Returns:
+        Arguments:
+        uri -- URI of a track, stream or queue (x-rincon-queue:<uid>#0).
+        metadata -- DIDL-Lite metadata of the URI, as returned by
+                    get_media_info.
 
-    #     """
-    #     # temporary
-    #     nr = str(1)
+        Returns:
+        True if the Sonos speaker successfully loaded the URI.
 
-    #     if nr is '':
-    #         action = ''
-    #     else:
-    #         action = '"urn:schemas-upnp-org:service:ContentDirectory:1#Browse"'
+        If an error occurs, we'll attempt to parse the error and return a UPnP
+        error code. If that fails, the raw response sent back from the Sonos
+        speaker will be returned.
 
-    #         body = '<u:Browse xmlns:u="urn:schemas-upnp-org:service:ContentDirectory:1"><ObjectID>SQ:1</ObjectID><BrowseFlag>BrowseDirectChildren</BrowseFlag><Filter></Filter><StartingIndex>0</StartingIndex><RequestedCount>1000</RequestedCount><SortCriteria></SortCriteria></u:Browse>'
+        """
+        result = self.__call('SetAVTransportURI', CurrentURI=uri, CurrentURIMetaData=metadata)
 
-    #         print body
+        if result is True:
+            self.__cache_invalidate('track_info')
 
-    #         response = self.__send_command(SoCo.TRANSPORT_ENDPOINT, action, body)
+        return result
 
-    #         print response
+    def join(self, coordinator_uid):
+        """ Join the group of another speaker.
 
-    #         if (response == '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"><s:Body><u:BrowseResponse xmlns:u="urn:schemas-upnp-org:service:AVTransport:1"></u:BrowseResponse></s:Body></s:Envelope>'):
-    #             return True
-    #         else:
-    #             return self.__parse_error(response)
+        Arguments:
+        coordinator_uid -- UID of the group's coordinator, e.g.
+                           'RINCON_000E58000000001400'.
 
+        Returns:
+        True if the Sonos speaker successfully joined the group.
 
+        If an error occurs, we'll attempt to parse the error and return a UPnP
+        error code. If that fails, the raw response sent back from the Sonos
+        speaker will be returned.
 
+        """
+        # Sent to the speaker itself, even if it's now a member of a group.
+        result = self.__call('SetAVTransportURI', route=False, CurrentURI='x-rincon:' + coordinator_uid)
 
+        if result is True and self.topology is not None:
+            self.topology.invalidate(self.speaker_ip)
 
+        return result
 
+    def unjoin(self):
+        """ Leave the speaker's group, to play on its own.
 
+        Returns:
+        True if the Sonos speaker successfully left its group.
 
+        If an error occurs, we'll attempt to parse the error and return a UPnP
+        error code. If that fails, the raw response sent back from the Sonos
+        speaker will be returned.
 
+        """
+        result = self.__call('BecomeCoordinatorOfStandaloneGroup', route=False)
 
+        if result is True and self.topology is not None:
+            self.topology.invalidate(self.speaker_ip)
 
-    # Utility functions  
+        return result
 
-    def set_playmode(self, play_mode=''):
-        """start a playlist
+    def start_playlist(self, nr=0, volume=None):
+        """ Start playing one of the speaker's saved queues.
 
         Arguments:
+        nr -- The number of the saved queue, starting at 0.
+        volume -- The volume to play it at. By default, the current volume.
 
         Returns:
+        True if the Sonos speaker successfully started playing the queue.
+
+        If an error occurs, we'll attempt to parse the error and return a UPnP
+        error code. If that fails, the raw response sent back from the Sonos
+        speaker will be returned.
 
         """
+        # StartAutoplay always sets a volume, so keep the one it has.
+        if volume is None:
+            volume = self.volume()
 
-        # temporary
-        play_mode = 'REPEAT_ALL'
+        return self.__call('StartAutoplay', ProgramURI='file:///jffs/settings/savedqueues.rsq#%d' % int(nr),
+                           Volume=volume)
 
-        if play_mode is '':
-            action = ''
-        else:
-            action = '"urn:schemas-upnp-org:service:AVTransport:1#SetPlayMode"'
+    # Utility functions
 
-            body = '<u:SetPlayMode xmlns:u="urn:schemas-upnp-org:service:AVTransport:1"><InstanceID>0</InstanceID><NewPlayMode>REPEAT_ALL</NewPlayMode></u:SetPlayMode>'
+    def set_playmode(self, play_mode):
+        """ Set the play mode.
 
-            response = self.__send_command(SoCo.TRANSPORT_ENDPOINT, action, body)
+        Arguments:
+        play_mode -- One of NORMAL, REPEAT_ALL, SHUFFLE or SHUFFLE_NOREPEAT.
 
-            if (response == '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"><s:Body><u:SetPlayModeResponse xmlns:u="urn:schemas-upnp-org:service:AVTransport:1"></u:SetPlayModeResponse></s:Body></s:Envelope>'):
-                return True
-            else:
-                return self.__parse_error(response)
+        Returns:
+        True if the Sonos speaker successfully set the play mode.
 
+        If an error occurs, we'll attempt to parse the error and return a UPnP
+        error code. If that fails, the raw response sent back from the Sonos
+        speaker will be returned.
+
+        """
+        return self.__call('SetPlayMode', NewPlayMode=play_mode.upper())
 
     def volume(self, volume=False):
         """ Get or set the Sonos speaker volume.
@@ -310,32 +503,27 @@ class SoCo(object):
         
         If an error occurs, we'll attempt to parse the error and return a UPnP
         error code. If that fails, the raw response sent back from the Sonos
-        speaker will be returned.
+        speaker will be returned. Getting the volume raises an actions.UPnPError
+        (which has the code) instead.
         
         """
-        if volume:
-            action = '"urn:schemas-upnp-org:service:RenderingControl:1#SetVolume"'
-
-            body = '<u:SetVolume xmlns:u="urn:schemas-upnp-org:service:RenderingControl:1"><InstanceID>0</InstanceID><Channel>Master</Channel><DesiredVolume>' + repr(volume) + '</DesiredVolume></u:SetVolume>'
+        if volume is not False:
+            result = self.__call('SetVolume', DesiredVolume=volume)
 
-            response = self.__send_command(SoCo.RENDERING_ENDPOINT, action, body)
+            if result is True:
+                self.__cache_set('volume', volume)
 
-            if (response == '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"><s:Body><u:SetVolumeResponse xmlns:u="urn:schemas-upnp-org:service:RenderingControl:1"></u:SetVolumeResponse></s:Body></s:Envelope>'):
-                return True
-            else:
-                return self.__parse_error(response)
+            return result
         else:
-            action = '"urn:schemas-upnp-org:service:RenderingControl:1#GetVolume"'
-
-            body = '<u:GetVolume xmlns:u="urn:schemas-upnp-org:service:RenderingControl:1"><InstanceID>0</InstanceID><Channel>Master</Channel></u:GetVolume>'
-
-            response = self.__send_command(SoCo.RENDERING_ENDPOINT, action, body)
+            cached = self.__cache_get('volume')
+            if cached is not None:
+                return cached
 
-            dom = XML.fromstring(response)
+            volume = int(self.__query('GetVolume')['CurrentVolume'])
 
-            volume = dom.findtext('.//CurrentVolume')
+            self.__cache_set('volume', volume)
 
-            return int(volume)
+            return volume
 
     def bass(self, bass=''):
         """ Get or set the Sonos speaker's bass EQ.
@@ -351,32 +539,27 @@ class SoCo(object):
         
         If an error occurs, we'll attempt to parse the error and return a UPnP
         error code. If that fails, the raw response sent back from the Sonos
-        speaker will be returned.
+        speaker will be returned. Getting the bass raises an actions.UPnPError
+        (which has the code) instead.
         
         """
         if bass != '':
-            action = '"urn:schemas-upnp-org:service:RenderingControl:1#SetBass"'
-
-            body = '<u:SetBass xmlns:u="urn:schemas-upnp-org:service:RenderingControl:1"><InstanceID>0</InstanceID><DesiredBass>' + repr(bass) + '</DesiredBass></u:SetBass>'
+            result = self.__call('SetBass', DesiredBass=bass)
 
-            response = self.__send_command(SoCo.RENDERING_ENDPOINT, action, body)
+            if result is True:
+                self.__cache_set('bass', bass)
 
-            if (response == '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"><s:Body><u:SetBassResponse xmlns:u="urn:schemas-upnp-org:service:RenderingControl:1"></u:SetBassResponse></s:Body></s:Envelope>'):
-                return True
-            else:
-                return self.__parse_error(response)
+            return result
         else:
-            action = '"urn:schemas-upnp-org:service:RenderingControl:1#GetBass"'
-
-            body = '<u:GetBass xmlns:u="urn:schemas-upnp-org:service:RenderingControl:1"><InstanceID>0</InstanceID><Channel>Master</Channel></u:GetBass>'
+            cached = self.__cache_get('bass')
+            if cached is not None:
+                return cached
 
-            response = self.__send_command(SoCo.RENDERING_ENDPOINT, action, body)
+            bass = int(self.__query('GetBass')['CurrentBass'])
 
-            dom = XML.fromstring(response)
+            self.__cache_set('bass', bass)
 
-            bass = dom.findtext('.//CurrentBass')
-
-            return int(bass)
+            return bass
 
     def treble(self, treble=False):
         """ Get or set the Sonos speaker's treble EQ.
@@ -392,34 +575,116 @@ class SoCo(object):
         
         If an error occurs, we'll attempt to parse the error and return a UPnP
         error code. If that fails, the raw response sent back from the Sonos
-        speaker will be returned.
+        speaker will be returned. Getting the treble raises an actions.UPnPError
+        (which has the code) instead.
         
         """
-        if treble:
-            action = '"urn:schemas-upnp-org:service:RenderingControl:1#SetTreble"'
+        if treble is not False:
+            result = self.__call('SetTreble', DesiredTreble=treble)
+
+            if result is True:
+                self.__cache_set('treble', treble)
 
-            body = '<u:SetTreble xmlns:u="urn:schemas-upnp-org:service:RenderingControl:1"><InstanceID>0</InstanceID><DesiredTreble>' + repr(treble) + '</DesiredTreble></u:SetTreble>'
+            return result
+        else:
+            cached = self.__cache_get('treble')
+            if cached is not None:
+                return cached
 
-            response = self.__send_command(SoCo.RENDERING_ENDPOINT, action, body)
+            treble = int(self.__query('GetTreble')['CurrentTreble'])
 
-            if (response == '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"><s:Body><u:SetTrebleResponse xmlns:u="urn:schemas-upnp-org:service:RenderingControl:1"></u:SetTrebleResponse></s:Body></s:Envelope>'):
-                return True
-            else:
-                return self.__parse_error(response)
+            self.__cache_set('treble', treble)
+
+            return treble
+
+    def set_relative_volume(self, adjustment):
+        """ Turn the Sonos speaker's volume up or down.
+
+        Unlike reading the volume and setting a new one, this takes a single
+        round trip, and can't lose a change made in between.
+
+        Arguments:
+        adjustment -- A number between -100 and 100 to add to the volume. The
+                      speaker keeps the result between 0 and 100.
+
+        Returns:
+        The new volume of the Sonos speaker.
+
+        Raises:
+        actions.UPnPError if the speaker returns a fault.
+
+        """
+        volume = int(self.__query('SetRelativeVolume', Adjustment=adjustment)['NewVolume'])
+
+        self.__cache_set('volume', volume)
+
+        return volume
+
+    def group_volume(self, volume=False):
+        """ Get or set the volume of the speaker's group.
+
+        The group volume is set in a single call to the group coordinator
+        (see the topology argument of SoCo), which changes every member's
+        volume in proportion, keeping their balance.
+
+        Only this speaker's cached volume is dropped. The other members' SoCo
+        objects (and their caches) aren't known here, so their cached volumes
+        stay until they expire, or until a RenderingControl event reaches
+        cache.StateCache.on_event.
+
+        Arguments:
+        volume -- A value between 0 and 100.
+
+        Returns:
+        If the volume argument was specified: returns true if the group
+        volume was successfully set.
+
+        If the volume argument was not specified: returns the current group
+        volume.
+
+        If an error occurs, we'll attempt to parse the error and return a UPnP
+        error code. If that fails, the raw response sent back from the Sonos
+        speaker will be returned. Getting the group volume raises an
+        actions.UPnPError (which has the code) instead.
+
+        """
+        if volume is not False:
+            # The coordinator scales the members from the volumes they had
+            # at the last snapshot.
+            result = self.__call('SnapshotGroupVolume')
+
+            if result is True:
+                result = self.__call('SetGroupVolume', DesiredVolume=volume)
+
+            self.__cache_invalidate('volume')
+
+            return result
         else:
-            action = '"urn:schemas-upnp-org:service:RenderingControl:1#GetTreble"'
+            return int(self.__query('GetGroupVolume')['CurrentVolume'])
+
+    def set_relative_group_volume(self, adjustment):
+        """ Turn the volume of the speaker's whole group up or down.
 
-            body = '<u:GetTreble xmlns:u="urn:schemas-upnp-org:service:RenderingControl:1"><InstanceID>0</InstanceID><Channel>Master</Channel></u:GetTreble>'
+        A single call to the group coordinator, which adjusts every member in
+        proportion. See group_volume, also for what happens to cached volumes.
 
-            response = self.__send_command(SoCo.RENDERING_ENDPOINT, action, body)
+        Arguments:
+        adjustment -- A number between -100 and 100 to add to the group volume.
 
-            dom = XML.fromstring(response)
+        Returns:
+        The new group volume.
 
-            treble = dom.findtext('.//CurrentTreble')
+        Raises:
+        actions.UPnPError if the speaker returns a fault.
 
-            return int(treble)
+        """
+        volume = int(self.__query('SetRelativeGroupVolume', Adjustment=adjustment)['NewVolume'])
 
-    def set_loudness(self, loudness):
+        self.__cache_invalidate('volume')
+
+        return volume
+
+    def set_loudness(self, loudness: bool):
         """ Set the Sonos speaker's loudness compensation.
 
         Loudness is a complicated topic. You can find a nice summary about this
@@ -436,21 +701,32 @@ class SoCo(object):
         speaker will be returned.
         
         """
-        action = '"urn:schemas-upnp-org:service:RenderingControl:1#SetLoudness"'
+        result = self.__call('SetLoudness', DesiredLoudness=loudness is True)
 
-        if loudness is True:
-            loudness_value = '1'
-        else:
-            loudness_value = '0'
+        if result is True:
+            self.__cache_set('loudness', loudness is True)
 
-        body = '<u:SetLoudness xmlns:u="urn:schemas-upnp-org:service:RenderingControl:1"><InstanceID>0</InstanceID><Channel>Master</Channel><DesiredLoudness>' + loudness_value + '</DesiredLoudness></u:SetLoudness>'
+        return result
 
-        response = self.__send_command(SoCo.RENDERING_ENDPOINT, action, body)
+    def get_loudness(self):
+        """ Get the Sonos speaker's loudness compensation.
 
-        if (response == '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"><s:Body><u:SetLoudnessResponse xmlns:u="urn:schemas-upnp-org:service:RenderingControl:1"></u:SetLoudnessResponse></s:Body></s:Envelope>'):
-            return True
-        else:
-            return self.__parse_error(response)
+        Returns:
+        True if loudness compensation is on, otherwise False.
+
+        Raises:
+        actions.UPnPError if the speaker returns a fault.
+
+        """
+        cached = self.__cache_get('loudness')
+        if cached is not None:
+            return cached
+
+        loudness = self.__query('GetLoudness')['CurrentLoudness'] == '1'
+
+        self.__cache_set('loudness', loudness)
+
+        return loudness
 
     def switch_to_line_in(self):
         """ Switch the speaker's input to line-in.
@@ -465,20 +741,16 @@ class SoCo(object):
         line-in capability.
 
         """
-        action = '"urn:schemas-upnp-org:service:AVTransport:1#SetAVTransportURI"'
-
         speaker_info = self.get_speaker_info()
 
-        body = '<u:SetAVTransportURI xmlns:u="urn:schemas-upnp-org:service:AVTransport:1"><InstanceID>0</InstanceID><CurrentURI>x-rincon-stream:' + speaker_info['uid'] + '</CurrentURI><CurrentURIMetaData></CurrentURIMetaData></u:SetAVTransportURI>'
+        result = self.__call('SetAVTransportURI', CurrentURI='x-rincon-stream:' + speaker_info['uid'])
 
-        response = self.__send_command(SoCo.TRANSPORT_ENDPOINT, action, body)
+        if result is True:
+            self.__cache_invalidate('track_info')
 
-        if (response == '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"><s:Body><u:SetAVTransportURIResponse xmlns:u="urn:schemas-upnp-org:service:AVTransport:1"></u:SetAVTransportURIResponse></s:Body></s:Envelope>'):
-            return True
-        else:
-            return self.__parse_error(response)
+        return result
 
-    def status_light(self, led_on):
+    def status_light(self, led_on: bool):
         """ Turn on (or off) the white Sonos status light.
 
         Turns on or off the little white light on the Sonos speaker. (It's
@@ -500,118 +772,530 @@ class SoCo(object):
         else:
             led_state = 'Off'
 
-        action = '"urn:schemas-upnp-org:service:DeviceProperties:1#SetLEDState"'
-
-        body = '<u:SetLEDState xmlns:u="urn:schemas-upnp-org:service:DeviceProperties:1"><DesiredLEDState>' + led_state + '</DesiredLEDState>'
-
-        response = self.__send_command(SoCo.DEVICE_ENDPOINT, action, body)
-
-        if (response == '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"><s:Body><u:SetLEDStateResponse xmlns:u="urn:schemas-upnp-org:service:DeviceProperties:1"></u:SetLEDStateResponse></s:Body></s:Envelope>'):
-            return True
-        else:
-            return self.parse(response)
+        return self.__call('SetLEDState', DesiredLEDState=led_state)
 
     def get_current_track_info(self):
         """ Get information about the currently playing track.
         
         Returns:
-        A dictionary containing the following information about the currently
-        playing track: playlist_position, duration, title, artist, album, and
-        a link to the album art.
+        A models.Track with the following information about the currently
+        playing track: playlist_position, duration, position (how far into
+        the track playback is), title, artist, album, and a link to the album
+        art. Fields can be read as attributes or, as before, like a
+        dictionary (track['title']). See tracker.PositionTracker to follow
+        the position without polling.
         
         If we're unable to return data for a field, we'll return an empty
         string. This can happen for all kinds of reasons so be sure to check
         values. For example, a track may not have complete metadata and be
         missing an album name. In this case track['album'] will be an empty string.
+        The metadata fields are also empty when playing from line-in.
+
+        Raises:
+        actions.UPnPError if the speaker returns a fault.
         
         """
-        action = '"urn:schemas-upnp-org:service:AVTransport:1#GetPositionInfo"'
+        cached = self.__cache_get('track_info')
+        if cached is not None:
+            return cached
 
-        body = '<u:GetPositionInfo xmlns:u="urn:schemas-upnp-org:service:AVTransport:1"><InstanceID>0</InstanceID><Channel>Master</Channel></u:GetPositionInfo>'
+        position = self.__query('GetPositionInfo')
 
-        response = self.__send_command(SoCo.TRANSPORT_ENDPOINT, action, body)
+        # Track metadata is returned in DIDL-Lite format, and only parsed
+        # when one of its fields is read.
+        track = Track(position.get('Track', ''),
+                      position.get('TrackDuration', ''),
+                      position.get('TrackURI', ''),
+                      position.get('TrackMetaData', ''),
+                      'http://' + self.speaker_ip + ':1400',
+                      position.get('RelTime', ''))
 
-        dom = XML.fromstring(response)
+        self.__cache_set('track_info', track)
 
-        track = {}
+        return track
 
-        track['playlist_position'] = dom.findtext('.//Track')
-        track['duration'] = dom.findtext('.//TrackDuration')
-        track['uri'] = dom.findtext('.//TrackURI')
+    def get_media_info(self):
+        """ Get what is loaded on the speaker, as opposed to the current track.
 
-        d = dom.findtext('.//TrackMetaData')
+        Returns:
+        A dictionary of the GetMediaInfo out-arguments, such as CurrentURI
+        (a stream, or x-rincon-queue:<uid>#0 when playing the queue) and
+        CurrentURIMetaData.
 
-        # If the speaker is playing from the line-in source, querying for track
-        # metadata will return "NOT_IMPLEMENTED".
-        if d is not '' or d is not 'NOT_IMPLEMENTED':
-            # Track metadata is returned in DIDL-Lite format
-            metadata = XML.fromstring(d.encode('utf-8'))
+        Raises:
+        actions.UPnPError if the speaker returns a fault.
 
-            track['title'] = metadata.findtext('.//{http://purl.org/dc/elements/1.1/}title')
-            track['artist'] = metadata.findtext('.//{http://purl.org/dc/elements/1.1/}creator')
-            track['album'] = metadata.findtext('.//{urn:schemas-upnp-org:metadata-1-0/upnp/}album')
+        """
+        return self.__query('GetMediaInfo')
 
-            album_art = metadata.findtext('.//{urn:schemas-upnp-org:metadata-1-0/upnp/}albumArtURI')
+    def get_position_info(self):
+        """ Get the current track number and position within it.
 
-            if album_art is not None:
-                track['album_art'] = 'http://' + self.speaker_ip + ':1400' + metadata.findtext('.//{urn:schemas-upnp-org:metadata-1-0/upnp/}albumArtURI')
-            else:
-                track['album_art'] = ''
-        else:
-            track['title'] = ''
-            track['artist'] = ''
-            track['album'] = ''
-            track['album_art'] = ''
+        Returns:
+        A dictionary of the GetPositionInfo out-arguments, such as Track,
+        RelTime ('0:01:30') and TrackDuration.
 
-        return track
+        Raises:
+        actions.UPnPError if the speaker returns a fault.
+
+        """
+        return self.__query('GetPositionInfo')
+
+    def get_transport_info(self):
+        """ Get whether the speaker is playing.
+
+        Returns:
+        A dictionary of the GetTransportInfo out-arguments, such as
+        CurrentTransportState ('PLAYING', 'PAUSED_PLAYBACK', 'STOPPED' or
+        'TRANSITIONING').
+
+        Raises:
+        actions.UPnPError if the speaker returns a fault.
 
-    def get_speaker_info(self, refresh=False):
+        """
+        return self.__query('GetTransportInfo')
+
+    def get_speaker_info(self, refresh: bool = False):
         """ Get information about the Sonos speaker.
 
         Arguments:
         refresh -- Refresh the speaker info cache.
 
         Returns:
-        Information about the Sonos speaker, such as the UID, MAC Address, and
-        Zone Name.
+        A models.SpeakerInfo about the Sonos speaker, such as the UID, MAC
+        Address, and Zone Name.
 
         """
-        if self.speaker_info and refresh is False:
+        if self.speaker_info is not None and refresh is False:
             return self.speaker_info
         else:
-            response = requests.get('http://' + self.speaker_ip + ':1400/status/zp')
-
-            dom = XML.fromstring(response.content)
-
-            self.speaker_info['zone_name'] = dom.findtext('.//ZoneName')
-            self.speaker_info['zone_icon'] = dom.findtext('.//ZoneIcon')
-            self.speaker_info['uid'] = dom.findtext('.//LocalUID')
-            self.speaker_info['serial_number'] = dom.findtext('.//SerialNumber')
-            self.speaker_info['software_version'] = dom.findtext('.//SoftwareVersion')
-            self.speaker_info['hardware_version'] = dom.findtext('.//HardwareVersion')
-            self.speaker_info['mac_address'] = dom.findtext('.//MACAddress')
+            self.speaker_info = self.__exchange('status_zp', 'GET', self.speaker_ip, '/status/zp',
+                                                parse_speaker_info, idempotent=True)
 
             return self.speaker_info
 
-    def __send_command(self, endpoint, action, body):
-        """ Send a raw command to the Sonos speaker.
+    def browse_page(self, object_id, start=0, count=100):
+        """ Fetch one page of a ContentDirectory container.
+
+        Arguments:
+        object_id -- The container to browse, e.g. 'Q:0' or 'A:TRACKS'.
+        start -- Index of the first entry to return.
+        count -- Maximum number of entries to return.
 
         Returns:
-        The raw response body returned by the Sonos speaker.
+        A dictionary with the page's items (a lazily parsed iterator of
+        didl.DidlItem), number_returned, total_matches and update_id.
+
+        If an error occurs, we'll attempt to parse the error and return a UPnP
+        error code. If that fails, the raw response sent back from the Sonos
+        speaker will be returned.
 
         """
-        headers = {
-            'Content-Type': 'text/xml',
-            'SOAPACTION': action
+        try:
+            result = self.__query('Browse', ObjectID=object_id, StartingIndex=start, RequestedCount=count)
+        except UPnPError as e:
+            return e.code
+        except ResponseError as e:
+            return e.response.decode('utf-8', 'replace')
+
+        return {
+            'items': iter_didl(result.get('Result', '')),
+            'number_returned': int(result.get('NumberReturned') or 0),
+            'total_matches': int(result.get('TotalMatches') or 0),
+            'update_id': result.get('UpdateID'),
         }
 
-        soap = '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" s:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"><s:Body>' + body + '</s:Body></s:Envelope>'
+    def browse(self, object_id, start=0, page_size=100, max_items=None):
+        """ Page through a ContentDirectory container.
+
+        Pages are only requested as the caller consumes the results, and each
+        page is parsed incrementally, so even a 50k track library is never
+        held in memory at once.
+
+        Arguments:
+        object_id -- The container to browse, e.g. 'Q:0' or 'A:TRACKS'.
+        start -- Index of the first entry to return.
+        page_size -- Number of entries to request per SOAP call.
+        max_items -- Stop after this many entries. Defaults to all of them.
+
+        Yields:
+        A didl.DidlItem for every entry in the container.
+
+        Raises:
+        IOError if the speaker returns an error for a page.
+
+        """
+        index = start
+        remaining = max_items
+
+        while remaining is None or remaining > 0:
+            count = page_size if remaining is None else min(page_size, remaining)
+
+            page = self.browse_page(object_id, index, count)
+            if not isinstance(page, dict):
+                raise IOError('Browse of ' + object_id + ' failed: ' + str(page))
+
+            for item in page['items']:
+                yield item
+
+            returned = page['number_returned']
+            index += returned
+            if remaining is not None:
+                remaining -= returned
+
+            if returned == 0 or index >= page['total_matches']:
+                break
+
+    def get_queue(self, start=0, max_items=None, page_size=100):
+        """ Page through the speaker's queue. See browse. """
+        return self.browse('Q:0', start, page_size, max_items)
 
-        r = requests.post('http://' + self.speaker_ip + ':1400' + endpoint, data=soap, headers=headers)
+    def add_to_queue(self, items, index=None, as_next: bool = False):
+        """ Add many tracks to the queue, in as few requests as possible.
+
+        The items are sent QUEUE_BATCH_SIZE at a time with
+        AddMultipleURIsToQueue, so a 500 track playlist takes 32 requests
+        rather than 500.
+
+        Arguments:
+        items -- URIs, didl.DidlItems (e.g. from get_library) or
+                 (URI, DIDL-Lite metadata) pairs.
+        index -- Queue index (starting at 0) to insert the items at. Defaults
+                 to the end of the queue.
+        as_next -- True to insert the items after the current track instead.
+
+        Returns:
+        The queue index of the first item added, or None if there were no
+        items.
 
-        return r.content
+        Raises:
+        actions.UPnPError if the speaker returns a fault. The batches sent
+        before it stay in the queue.
 
-    def __parse_error(self, response):
+        """
+        first = None
+        # Sonos numbers tracks from 1. 0 means the end of the queue.
+        position = index + 1 if index is not None else 0
+
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) == self.QUEUE_BATCH_SIZE:
+                added = self.__enqueue(batch, position, as_next)
+                first = added[0] if first is None else first
+                position, as_next = added[0] + added[1], False
+                batch = []
+
+        if batch:
+            added = self.__enqueue(batch, position, as_next)
+            first = added[0] if first is None else first
+
+        return first - 1 if first is not None else None
+
+    def remove_from_queue(self, index, count=1):
+        """ Remove count tracks from the queue, starting at index (from 0).
+
+        Returns:
+        True if the Sonos speaker successfully removed the tracks.
+
+        If an error occurs, we'll attempt to parse the error and return a UPnP
+        error code. If that fails, the raw response sent back from the Sonos
+        speaker will be returned.
+
+        """
+        result = self.__call('RemoveTrackRangeFromQueue', StartingIndex=index + 1, NumberOfTracks=count)
+
+        if result is True:
+            self.__cache_invalidate('track_info')
+
+        return result
+
+    def reorder_queue(self, index, count, insert_before):
+        """ Move count tracks of the queue, starting at index, before the
+        track at insert_before. Indexes start at 0.
+
+        Returns:
+        True if the Sonos speaker successfully moved the tracks.
+
+        If an error occurs, we'll attempt to parse the error and return a UPnP
+        error code. If that fails, the raw response sent back from the Sonos
+        speaker will be returned.
+
+        """
+        result = self.__call('ReorderTracksInQueue', StartingIndex=index + 1, NumberOfTracks=count,
+                             InsertBefore=insert_before + 1)
+
+        if result is True:
+            self.__cache_invalidate('track_info')
+
+        return result
+
+    def clear_queue(self):
+        """ Remove every track from the queue.
+
+        Returns:
+        True if the Sonos speaker successfully cleared the queue.
+
+        If an error occurs, we'll attempt to parse the error and return a UPnP
+        error code. If that fails, the raw response sent back from the Sonos
+        speaker will be returned.
+
+        """
+        result = self.__call('RemoveAllTracksFromQueue')
+
+        if result is True:
+            self.__cache_invalidate('track_info')
+
+        return result
+
+    def save_queue(self, title):
+        """ Save the queue as a Sonos playlist.
+
+        Returns:
+        The object ID of the new playlist, e.g. 'SQ:3'.
+
+        Raises:
+        actions.UPnPError if the speaker returns a fault.
+
+        """
+        return self.__query('SaveQueue', Title=title).get('AssignedObjectID')
+
+    def play_from_queue(self, index):
+        """ Play the queue, starting at the track at index (from 0).
+
+        Returns:
+        True if the Sonos speaker successfully started playing.
+
+        If an error occurs, we'll attempt to parse the error and return a UPnP
+        error code. If that fails, the raw response sent back from the Sonos
+        speaker will be returned.
+
+        """
+        # The queue that plays is the one of the group's coordinator.
+        group = self.topology.group_of(self.speaker_ip) if self.topology is not None else None
+        uid = group.coordinator.uid if group is not None else self.get_speaker_info()['uid']
+
+        result = self.set_transport_uri('x-rincon-queue:' + uid + '#0')
+
+        if result is True:
+            result = self.seek(index + 1, 'TRACK_NR')
+
+        if result is True:
+            result = self.play()
+
+        return result
+
+    def get_library(self, category='tracks', start=0, max_items=None, page_size=100):
+        """ Page through the music library. See browse.
+
+        Arguments:
+        category -- One of the keys of SoCo.LIBRARY_CATEGORIES, e.g. 'tracks',
+                    'albums', 'artists' or 'playlists'.
+
+        """
+        return self.browse(SoCo.LIBRARY_CATEGORIES[category], start, page_size, max_items)
+
+    def get_system_update_id(self):
+        """ Get the ContentDirectory's SystemUpdateID.
+
+        The speaker bumps this counter whenever anything in the music library
+        or the Sonos playlists changes, so it's a cheap way to find out
+        whether a local copy of the library is still current.
+
+        Returns:
+        The SystemUpdateID, as a string, or None if the speaker didn't
+        return one.
+
+        """
+        try:
+            return self.__query('GetSystemUpdateID').get('Id')
+        except UPnPError:
+            return None
+
+    def get_zone_group_state(self):
+        """ Get the zone group topology of the speaker's household.
+
+        Returns:
+        The ZoneGroupState document, as a string. See
+        topology.parse_zone_group_state.
+
+        Raises:
+        actions.UPnPError if the speaker returns a fault.
+
+        """
+        return self.__query('GetZoneGroupState').get('ZoneGroupState', '')
+
+    def __call(self, name, route=True, **arguments):
+        """ Send an action that has no out-arguments.
+
+        Returns:
+        True if the Sonos speaker acknowledged the action, otherwise whatever
+        __parse_error makes of the response.
+
+        """
+        action = ACTIONS[name]
+
+        def acknowledged(response):
+            if action.succeeded(response):
+                return True
+            else:
+                return self.__parse_error(name, response)
+
+        return self.__send_command(name, acknowledged, route, **arguments)
+
+    def __query(self, name, **arguments):
+        """ Send an action and decode its out-arguments (see Action.decode).
+
+        Returns:
+        A dictionary of the out-arguments returned by the Sonos speaker.
+
+        Raises:
+        actions.UPnPError if the speaker returns a fault.
+        actions.ResponseError if the response can't be understood.
+
+        """
+        return self.__send_command(name, ACTIONS[name].decode, **arguments)
+
+    def __send_command(self, name, parse, route=True, **arguments):
+        """ Send a registered action (see actions.ACTIONS) to the Sonos speaker.
+
+        Arguments:
+        name -- The action's name.
+        parse -- Called with the raw response body, as bytes.
+        route -- False to send a group action to the speaker itself rather
+                 than its coordinator, e.g. to change its group.
+
+        Returns:
+        Whatever parse returned.
+
+        """
+        action = ACTIONS[name]
+
+        speaker_ip = self.speaker_ip
+        routed = route and self.topology is not None and action.service in self.GROUP_SERVICES
+        if routed:
+            speaker_ip = self.topology.coordinator_ip(self.speaker_ip)
+
+            decode = parse
+
+            def parse(response):
+                if not action.succeeded(response):
+                    # The groups may have changed since the topology was fetched.
+                    self.topology.invalidate(self.speaker_ip)
+
+                return decode(response)
+
+        return self.__exchange(name, 'POST', speaker_ip, action.endpoint, parse, action.idempotent,
+                               data=action.envelope(arguments), headers=action.headers)
+
+    def __exchange(self, name, method, speaker_ip, path, parse, idempotent=False, **kwargs):
+        """ Send an HTTP request and parse its response body.
+
+        When there are metrics hooks (see metrics.add_hook), they are passed a
+        metrics.CallRecord with the timings, sizes and outcome of the request.
+
+        Returns:
+        Whatever parse returned for the response body.
+
+        """
+        if not metrics.hooks:
+            return parse(self.__request(method, speaker_ip, path, idempotent, **kwargs).content)
+
+        bytes_sent = len(kwargs.get('data') or b'')
+        started = time.perf_counter()
+
+        try:
+            response = self.__request(method, speaker_ip, path, idempotent, **kwargs).content
+        except Exception as e:
+            metrics.emit(CallRecord(speaker_ip, name, time.perf_counter() - started, bytes_sent, 0,
+                                    type(e).__name__, None, time.time()))
+            raise
+
+        received = time.perf_counter()
+        error = None
+
+        try:
+            result = parse(response)
+        except UPnPError as e:
+            error = e.code
+            raise
+        except ResponseError:
+            error = 'invalid_response'
+            raise
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        else:
+            # __call returns what __parse_error made of a failure: the
+            # error code, or the raw response if it had none.
+            if isinstance(result, int) and result is not True:
+                error = result
+            elif isinstance(result, str):
+                error = 'invalid_response'
+        finally:
+            metrics.emit(CallRecord(speaker_ip, name, received - started, bytes_sent, len(response),
+                                    error, time.perf_counter() - received, time.time()))
+
+        return result
+
+    def __request(self, method, speaker_ip, path, idempotent=False, **kwargs):
+        """ Send an HTTP request, through the scheduler if there is one.
+
+        Returns:
+        The requests.Response returned by the Sonos speaker.
+
+        """
+        if self.scheduler is None:
+            return self.pool.request(method, speaker_ip, path, **kwargs)
+
+        def send(remaining):
+            timeout = (min(self.pool.connect_timeout, remaining), min(self.pool.read_timeout, remaining))
+            return self.pool.request(method, speaker_ip, path, timeout=timeout, **kwargs)
+
+        return self.scheduler.call(speaker_ip, send, idempotent)
+
+    def __enqueue(self, items, position, as_next):
+        """ Add one batch of add_to_queue's items.
+
+        Returns:
+        A (first track number added, number of tracks added) tuple.
+
+        """
+        uris = []
+        metadata = []
+
+        for item in items:
+            if isinstance(item, str):
+                uri, didl = item, ''
+            elif isinstance(item, tuple) and len(item) == 2:
+                uri, didl = item
+            else:
+                uri, didl = item.uri, to_didl(item)
+
+            # The URIs are separated by spaces.
+            uris.append(uri.replace(' ', '%20'))
+            metadata.append(didl)
+
+        added = self.__query('AddMultipleURIsToQueue', NumberOfURIs=len(uris), EnqueuedURIs=' '.join(uris),
+                             EnqueuedURIsMetaData=' '.join(metadata), DesiredFirstTrackNumberEnqueued=position,
+                             EnqueueAsNext=as_next)
+
+        return int(added['FirstTrackNumberEnqueued']), int(added['NumTracksAdded'])
+
+    def __cache_get(self, field):
+        """ Return a fresh cached value, or None if there is no cache. """
+        if self.cache is not None:
+            return self.cache.get(field)
+
+    def __cache_set(self, field, value):
+        if self.cache is not None:
+            self.cache.set(field, value)
+
+    def __cache_invalidate(self, field):
+        if self.cache is not None:
+            self.cache.invalidate(field)
+
+    def __parse_error(self, name, response):
         """ Parse an error returned from the Sonos speaker.
 
         Returns:
@@ -620,12 +1304,10 @@ class SoCo(object):
         If we're unable to parse the error response for whatever reason, the
         raw response sent back from the Sonos speaker will be returned.
         """
-        error = XML.fromstring(response)
-
-        errorCode = error.findtext('.//{urn:schemas-upnp-org:control-1-0}errorCode')
+        error = ACTIONS[name].fault(response)
 
-        if errorCode is not None:
-            return int(errorCode)
+        if error is not None:
+            return error.code
         else:
             # Unknown error, so just return the entire response
-            return response
+            return response.decode('utf-8', 'replace')
@@ -0,0 +1,37 @@
+import itertools
+import os
+import sys
+
+import pytest
+
+# The modules live at the top of the repository, next to sonoshell.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fakespeaker import FakeSpeaker  # noqa: E402
+
+
+# A fresh loopback address for every fake speaker, so that no test gets a
+# pooled keep-alive connection to a speaker another test stopped.
+_addresses = ('127.0.%d.%d' % (i // 250 + 10, i % 250 + 2) for i in itertools.count())
+
+
+@pytest.fixture
+def fake_speaker():
+    """ A factory for started FakeSpeakers on port 1400, stopped after the test. """
+    started = []
+
+    def start(**kwargs):
+        fake = FakeSpeaker(next(_addresses), **kwargs).start()
+        started.append(fake)
+        return fake
+
+    yield start
+
+    for fake in started:
+        fake.stop()
+
+
+@pytest.fixture
+def unused_ip():
+    """ A loopback address nothing listens on. """
+    return next(_addresses)
@@ -0,0 +1,84 @@
+import pytest
+
+from actions import (ACTIONS, InvalidArgsError, NoSuchObjectError, ResponseError, TransitionNotAvailableError,
+                     UPnPError)
+from fakespeaker import ENVELOPE, FAULT
+from soco import SoCo
+
+UPNP_FAULT = ENVELOPE % ('<s:Fault><faultcode>s:Client</faultcode><faultstring>UPnPError</faultstring><detail>'
+                         '<UPnPError xmlns="urn:schemas-upnp-org:control-1-0">%s</UPnPError></detail></s:Fault>')
+
+
+def fault(code):
+    return (ENVELOPE % (FAULT % code)).encode('utf-8')
+
+
+@pytest.mark.parametrize('name, code, error', [
+    ('Next', 701, TransitionNotAvailableError),
+    ('Browse', 701, NoSuchObjectError),
+    ('GetVolume', 402, InvalidArgsError),
+    ('GetVolume', 999, UPnPError),
+])
+def test_decode_raises_typed_faults(name, code, error):
+    with pytest.raises(error) as raised:
+        ACTIONS[name].decode(fault(code))
+
+    assert type(raised.value) is error
+    assert raised.value.code == code
+    assert raised.value.action == name
+
+
+def test_fault_returns_the_error():
+    error = ACTIONS['Next'].fault(fault(701))
+
+    assert isinstance(error, TransitionNotAvailableError)
+    assert ACTIONS['Next'].fault(ACTIONS['Next'].envelope({})) is None
+    assert ACTIONS['Next'].fault(b'not xml') is None
+
+
+def test_fault_description_is_unescaped():
+    response = (UPNP_FAULT % '<errorCode>714</errorCode><errorDescription>Can&apos;t play &lt;x&gt;</errorDescription>')
+
+    error = ACTIONS['SetAVTransportURI'].fault(response.encode('utf-8'))
+
+    assert error.code == 714
+    assert error.description == "Can't play <x>"
+
+
+def test_prefixed_faults_fall_back_to_parsing():
+    response = ENVELOPE % ('<s:Fault><faultcode>s:Client</faultcode><faultstring>UPnPError</faultstring><detail>'
+                           '<e:UPnPError xmlns:e="urn:schemas-upnp-org:control-1-0"><e:errorCode>402</e:errorCode>'
+                           '<e:errorDescription>Bad</e:errorDescription></e:UPnPError></detail></s:Fault>')
+
+    with pytest.raises(InvalidArgsError) as raised:
+        ACTIONS['GetVolume'].decode(response.encode('utf-8'))
+
+    assert raised.value.description == 'Bad'
+
+
+def test_faults_without_a_code_use_the_faultstring():
+    response = ENVELOPE % '<s:Fault><faultcode>s:Server</faultcode><faultstring>Busy</faultstring></s:Fault>'
+
+    with pytest.raises(UPnPError) as raised:
+        ACTIONS['GetVolume'].decode(response.encode('utf-8'))
+
+    assert raised.value.code is None
+    assert raised.value.description == 'Busy'
+
+
+@pytest.mark.parametrize('response', [b'not xml', (ENVELOPE % '').encode('utf-8'),
+                                      (ENVELOPE % '<u:Other/>').encode('utf-8')])
+def test_decode_rejects_other_responses(response):
+    with pytest.raises(ResponseError):
+        ACTIONS['GetVolume'].decode(response)
+
+
+def test_speaker_faults(fake_speaker):
+    fake = fake_speaker()
+    fake.faults['GetVolume'] = 402
+    fake.faults['Next'] = 701
+    speaker = SoCo(fake.ip)
+
+    with pytest.raises(InvalidArgsError):
+        speaker.volume()
+    assert speaker.next() == 701
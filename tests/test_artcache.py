@@ -0,0 +1,95 @@
+import concurrent.futures
+
+import pytest
+import requests
+
+from artcache import AlbumArtCache, ArtNotAllowed
+
+
+def art_url(fake, n=1):
+    return 'http://%s:1400/getaa?s=1&u=x-file-cifs%%3a%%2f%%2fserver%%2fmusic%%2ftrack%d.mp3' % (fake.ip, n)
+
+
+@pytest.fixture
+def art_cache(tmpdir):
+    """ A factory for AlbumArtCaches in a temporary directory, closed after the test. """
+    caches = []
+
+    def create(**kwargs):
+        cache = AlbumArtCache(path=str(tmpdir.join('art%d' % len(caches))), **kwargs)
+        caches.append(cache)
+        return cache
+
+    yield create
+
+    for cache in caches:
+        cache.close()
+
+
+def test_fetches_from_known_speakers_only(fake_speaker, art_cache):
+    known, unknown = fake_speaker(), fake_speaker()
+    cache = art_cache(speakers=lambda: [known.ip])
+
+    assert cache.get(art_url(known)).data.startswith(b'\xff\xd8')
+    with pytest.raises(ArtNotAllowed):
+        cache.get(art_url(unknown))
+    with pytest.raises(ArtNotAllowed):
+        cache.get('http://%s:8080/admin' % known.ip)
+
+    assert unknown.requests == 0
+
+
+def test_concurrent_requests_share_one_fetch(fake_speaker, art_cache):
+    fake = fake_speaker(latency=0.1)
+    cache = art_cache(speakers=[fake.ip])
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda i: cache.get(art_url(fake)), range(8)))
+
+    assert len(set(artwork.digest for artwork in results)) == 1
+    assert fake.requests == 1
+    assert cache._fetching == {}
+
+
+def test_proxy_listens_on_localhost(fake_speaker, art_cache):
+    fake = fake_speaker()
+    cache = art_cache(speakers=[fake.ip])
+    cache.serve()
+
+    assert cache._server.server_address[0] == '127.0.0.1'
+    assert requests.get(cache.proxy_url(art_url(fake)), timeout=5).status_code == 200
+    assert requests.get(cache.proxy_url('http://%s:1400/getaa' % '127.0.0.1'), timeout=5).status_code == 403
+
+
+def test_proxy_url_uses_a_real_address(fake_speaker, art_cache):
+    fake = fake_speaker()
+    cache = art_cache(speakers=[fake.ip])
+    port = cache.serve(host='')
+
+    url = cache.proxy_url(art_url(fake), size=64)
+
+    assert url.startswith('http://127.')
+    assert ':%d/art?url=' % port in url
+
+
+@pytest.mark.parametrize('size', ['abc', '0', '-5', '1.5'])
+def test_proxy_rejects_bad_sizes(fake_speaker, art_cache, size):
+    fake = fake_speaker()
+    cache = art_cache(speakers=[fake.ip])
+    cache.serve()
+
+    assert requests.get(cache.proxy_url(art_url(fake)) + '&size=' + size, timeout=5).status_code == 400
+    assert fake.requests == 0
+
+
+def test_proxy_reports_unusable_images_as_a_bad_gateway(fake_speaker, art_cache, monkeypatch):
+    fake = fake_speaker()
+    cache = art_cache(speakers=[fake.ip])
+    cache.serve()
+
+    def get(url, size=None):
+        raise ValueError('cannot identify image file')
+
+    monkeypatch.setattr(cache, 'get', get)
+
+    assert requests.get(cache.proxy_url(art_url(fake), size=64), timeout=5).status_code == 502
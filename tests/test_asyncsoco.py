@@ -0,0 +1,73 @@
+import asyncio
+import socket
+
+import pytest
+
+from asyncsoco import AsyncConnectionPool, AsyncSoCo
+
+
+@pytest.fixture
+def async_soco():
+    """ A factory for AsyncSoCos that share a pool of their own. """
+    pool = AsyncConnectionPool()
+
+    def create(speaker_ip):
+        speaker = AsyncSoCo(speaker_ip)
+        speaker.pool = pool
+        return speaker
+
+    yield create
+
+    pool.close()
+
+
+def test_chunked_responses(fake_speaker, async_soco):
+    fake = fake_speaker()
+    fake.chunked = True
+    fake.state['volume'] = 37
+    speaker = async_soco(fake.ip)
+
+    async def run():
+        # Twice, so the second request reuses the connection the chunked
+        # response was read from.
+        return [await speaker.volume(), await speaker.get_current_track_info()]
+
+    volume, track = asyncio.run(run())
+
+    assert volume == 37
+    assert track['title'] == 'Track 0'
+    assert len(speaker.pool._idle[fake.ip]) == 1
+
+
+def test_retries_a_keep_alive_connection_closed_by_the_speaker(fake_speaker, async_soco):
+    fake = fake_speaker()
+    fake.close_idle = True
+    speaker = async_soco(fake.ip)
+
+    async def run():
+        return [await speaker.volume(), await speaker.volume(50), await speaker.volume()]
+
+    assert asyncio.run(run()) == [20, True, 50]
+    assert fake.requests == 3
+
+
+def test_does_not_retry_a_new_connection(unused_ip, async_soco):
+    with pytest.raises(ConnectionError):
+        asyncio.run(async_soco(unused_ip).volume())
+
+
+def test_closes_connections_of_a_previous_loop(fake_speaker, async_soco):
+    fake = fake_speaker()
+    speaker = async_soco(fake.ip)
+
+    assert asyncio.run(speaker.volume()) == 20
+    reader, writer = speaker.pool._idle[fake.ip][0]
+    sock = writer.get_extra_info('socket').dup()
+
+    try:
+        assert asyncio.run(speaker.volume()) == 20
+        # The first connection was shut down, so reading it hits EOF at once
+        # instead of waiting for the speaker.
+        assert sock.recv(1, socket.MSG_DONTWAIT) == b''
+    finally:
+        sock.close()
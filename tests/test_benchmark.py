@@ -0,0 +1,23 @@
+import json
+
+from benchmark import percentile, run_benchmarks, summarise
+
+
+def test_summarise():
+    result = summarise([0.004, 0.001, 0.003, 0.002], 0.01)
+
+    assert result == {'iterations': 4, 'ops_per_sec': 400.0, 'mean_ms': 2.5, 'p50_ms': 3.0, 'p99_ms': 4.0}
+    assert percentile([1, 2, 3], 0) == 1
+
+
+def test_run_benchmarks_reports_json():
+    report = run_benchmarks(iterations=2, speakers=2, only=['soco', 'fanout', 'parse'])
+
+    assert json.loads(json.dumps(report)) == report
+    assert report['meta']['speakers'] == 2
+
+    results = report['results']
+    assert {'soco.get_volume', 'fanout.async_get_volume', 'parse.fault_decode'} <= set(results)
+    for result in results.values():
+        assert result['iterations'] > 0
+        assert result['p50_ms'] <= result['p99_ms']
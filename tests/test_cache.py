@@ -0,0 +1,59 @@
+import time
+
+from cache import StateCache
+from events import Event
+from soco import SoCo
+
+
+def event(service, variables):
+    return Event('10.0.0.1', service, 'uuid:sub', 1, variables, time.time())
+
+
+def test_values_expire_after_their_ttl():
+    cache = StateCache(ttl=60, ttls={'track_info': 0.05})
+    cache.set('volume', 20)
+    cache.set('track_info', {'title': 'Track 1'})
+
+    assert cache.get('track_info') == {'title': 'Track 1'}
+    time.sleep(0.1)
+    assert cache.get('track_info') is None
+    assert cache.get('volume') == 20
+
+    cache.invalidate('volume')
+    assert cache.get('volume') is None
+
+
+def test_on_event_updates_rendering_control_fields():
+    cache = StateCache(ttl=60)
+
+    cache.on_event(event('RenderingControl', {'Volume': {'Master': '35', 'LF': '100'}, 'Mute': {'Master': '1'},
+                                              'Loudness': {'Master': '0'}, 'Bass': '-2', 'Treble': None}))
+
+    assert cache.get('volume') == 35
+    assert cache.get('mute') is True
+    assert cache.get('loudness') is False
+    assert cache.get('bass') == -2
+    assert cache.get('treble') is None
+
+
+def test_on_event_drops_the_track_info():
+    cache = StateCache(ttl=60)
+    cache.set('track_info', {'title': 'Track 1'})
+    cache.set('volume', 20)
+
+    cache.on_event(event('AVTransport', {'TransportState': 'PAUSED_PLAYBACK'}))
+
+    assert cache.get('track_info') is None
+    assert cache.get('volume') == 20
+
+
+def test_transport_commands_drop_the_track_info(fake_speaker):
+    fake = fake_speaker()
+    speaker = SoCo(fake.ip, cache=StateCache(ttl=60))
+
+    for command in (speaker.play, speaker.pause, speaker.stop):
+        speaker.get_current_track_info()
+        requests = fake.requests
+        assert command() is True
+        speaker.get_current_track_info()
+        assert fake.requests == requests + 2
@@ -0,0 +1,105 @@
+import itertools
+import json
+import time
+
+import pytest
+
+from discovery import Speaker, SpeakerRegistry
+from fakespeaker import FakeSSDP
+
+# A fresh SSDP port for every test, away from the real 1900.
+_ports = itertools.count(19000)
+
+
+@pytest.fixture
+def ssdp(fake_speaker):
+    """ A factory for FakeSSDPs answering for n fake speakers. """
+    started = []
+
+    def start(n, **kwargs):
+        speakers = [fake_speaker(zone_name='Zone %d' % i, uid='RINCON_%012d01400' % i, **kwargs)
+                    for i in range(n)]
+        fake = FakeSSDP(speakers, port=next(_ports)).start()
+        started.append(fake)
+        return fake
+
+    yield start
+
+    for fake in started:
+        fake.stop()
+
+
+def make_registry(tmpdir, ssdp):
+    return SpeakerRegistry(path=str(tmpdir.join('speakers.json')), port=ssdp.port, interface='127.0.0.1')
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.02)
+    return predicate()
+
+
+def test_discover_queries_slow_speakers_concurrently(tmpdir, ssdp):
+    fake = ssdp(4, latency=0.3)
+    registry = make_registry(tmpdir, fake)
+
+    start = time.time()
+    found = registry.discover(timeout=0.5)
+    elapsed = time.time() - start
+
+    assert sorted(speaker.zone_name for speaker in found) == ['Zone 0', 'Zone 1', 'Zone 2', 'Zone 3']
+    assert elapsed < 0.5 + 2 * 0.3
+    assert registry.resolve('zone 2') == fake.speakers[2].ip
+
+
+def test_discover_skips_query_for_known_speakers(tmpdir, ssdp):
+    fake = ssdp(2)
+    make_registry(tmpdir, fake).discover(timeout=0.3)
+
+    registry = make_registry(tmpdir, fake)
+    before = [speaker.requests for speaker in fake.speakers]
+    assert len(registry.discover(timeout=0.3)) == 2
+    assert [speaker.requests for speaker in fake.speakers] == before
+
+    fake.boot_seq[fake.speakers[0].uid] += 1
+    registry.discover(timeout=0.3)
+    assert [speaker.requests for speaker in fake.speakers] == [before[0] + 1, before[1]]
+
+
+def test_notify_adds_and_removes_speakers(tmpdir, ssdp):
+    fake = ssdp(1)
+    speaker = fake.speakers[0]
+    registry = make_registry(tmpdir, fake)
+    registry.start()
+    try:
+        fake.notify(speaker)
+        assert wait_for(lambda: registry.resolve('Zone 0') == speaker.ip)
+
+        fake.notify(speaker, 'ssdp:byebye')
+        assert wait_for(lambda: registry.get(speaker.uid) is None)
+    finally:
+        registry.stop()
+
+
+@pytest.mark.parametrize('content', [
+    'not json',
+    '{"uid": "RINCON_1"}',
+    '[1, 2]',
+    '[{"uid": "RINCON_1"}]',
+])
+def test_load_ignores_unusable_cache(tmpdir, content):
+    path = tmpdir.join('speakers.json')
+    path.write(content)
+
+    assert SpeakerRegistry(path=str(path)).speakers() == []
+
+
+def test_load_ignores_unknown_fields(tmpdir):
+    path = tmpdir.join('speakers.json')
+    path.write(json.dumps([{'uid': 'RINCON_1', 'ip': '10.0.0.2', 'zone_name': 'Kitchen', 'model': 'Play:1'}]))
+
+    registry = SpeakerRegistry(path=str(path))
+
+    assert registry.resolve('kitchen') == '10.0.0.2'
+    assert registry.get('RINCON_1') == Speaker('RINCON_1', '10.0.0.2', 'Kitchen', None, None, None)
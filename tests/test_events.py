@@ -0,0 +1,96 @@
+import threading
+import time
+
+import pytest
+
+import events
+from events import EventListener
+
+
+@pytest.fixture
+def listener():
+    listener = EventListener()
+    yield listener
+    listener.stop()
+
+
+def wait_for(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_initial_event_sent_before_subscribe_returns(fake_speaker, listener):
+    fake = fake_speaker()
+
+    subscription = listener.subscribe(fake.ip, 'RenderingControl')
+
+    event = subscription.events.get(timeout=3)
+    assert event.sid == subscription.sid
+    assert event.seq == 0
+    assert event.variables['Volume'] == {'Master': '20'}
+    assert wait_for(lambda: fake.notifications == [(subscription.sid, 200)])
+
+
+def test_failed_resubscribe_is_retried(fake_speaker, listener, monkeypatch):
+    monkeypatch.setattr(events, 'RESUBSCRIBE_DELAY', 0.05)
+    fake = fake_speaker()
+    subscription = listener.subscribe(fake.ip, 'RenderingControl')
+    first_sid = subscription.sid
+
+    # The speaker rebooted, and isn't ready to take subscriptions yet.
+    fake.subscriptions.clear()
+    fake.refuse_subscriptions = True
+    subscription.renew()
+
+    assert not subscription.is_subscribed
+    assert subscription.error is not None
+    assert wait_for(lambda: subscription.failures >= 2)
+
+    fake.refuse_subscriptions = False
+
+    assert wait_for(lambda: subscription.is_subscribed)
+    assert subscription.error is None
+    assert subscription.failures == 0
+    assert subscription.sid != first_sid
+    assert subscription.sid in fake.subscriptions
+
+
+def test_unsubscribe_stops_retrying(fake_speaker, listener, monkeypatch):
+    monkeypatch.setattr(events, 'RESUBSCRIBE_DELAY', 0.05)
+    fake = fake_speaker()
+    subscription = listener.subscribe(fake.ip, 'RenderingControl')
+
+    fake.subscriptions.clear()
+    fake.refuse_subscriptions = True
+    subscription.renew()
+    subscription.unsubscribe()
+
+    requests = fake.requests
+    time.sleep(0.3)
+    assert fake.requests == requests
+
+
+def test_unsubscribe_does_not_wait_for_a_slow_renewal(fake_speaker, listener):
+    fake = fake_speaker()
+    subscription = listener.subscribe(fake.ip, 'RenderingControl')
+    sid = subscription.sid
+
+    fake.latency = 0.5
+    renewal = threading.Thread(target=subscription.renew)
+    renewal.start()
+    time.sleep(0.1)
+
+    # The SUBSCRIBE is in flight, but the subscription isn't locked.
+    assert subscription._lock.acquire(timeout=0.2)
+    subscription._lock.release()
+    subscription.unsubscribe()
+
+    renewal.join(5)
+    # The renewal that came back after unsubscribing is ignored.
+    assert not subscription.is_subscribed
+    assert subscription._renew_timer is None or not subscription._renew_timer.is_alive()
+    assert subscription.sid == sid
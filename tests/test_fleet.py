@@ -0,0 +1,50 @@
+import concurrent.futures
+
+from actions import InvalidArgsError
+from fleet import SoCoFleet
+
+
+def test_results_per_speaker(fake_speaker, unused_ip):
+    good, faulty = fake_speaker(), fake_speaker()
+    good.state['volume'] = 33
+    faulty.faults['GetVolume'] = 402
+
+    with SoCoFleet([good.ip, faulty.ip, unused_ip]) as fleet:
+        results = fleet.volume()
+
+    assert list(results) == [good.ip, faulty.ip, unused_ip]
+    assert results[good.ip].value == 33 and results[good.ip].error is None
+    assert isinstance(results[faulty.ip].error, InvalidArgsError)
+    assert results[unused_ip].value is None
+    assert isinstance(results[unused_ip].error, Exception)
+    assert all(result.elapsed >= 0 for result in results.values())
+
+
+def test_slow_speakers_time_out(fake_speaker):
+    fast, slow = fake_speaker(), fake_speaker(latency=1.0)
+
+    with SoCoFleet([fast.ip, slow.ip], timeout=0.3) as fleet:
+        results = fleet.pause()
+
+    assert results[fast.ip].value is True
+    assert isinstance(results[slow.ip].error, concurrent.futures.TimeoutError)
+    assert 0.3 <= results[slow.ip].elapsed < 1.0
+
+
+def test_call_timeout_overrides_the_default(fake_speaker):
+    slow = fake_speaker(latency=0.3)
+
+    with SoCoFleet([slow.ip], timeout=0.05) as fleet:
+        assert fleet.volume(timeout=2)[slow.ip].value == 20
+        assert isinstance(fleet.run('volume')[slow.ip].error, concurrent.futures.TimeoutError)
+
+
+def test_elapsed_ignores_wall_clock_steps(fake_speaker, monkeypatch):
+    fake = fake_speaker()
+    clock = iter(range(0, 10 ** 9, 3600))
+    monkeypatch.setattr('time.time', lambda: next(clock))
+
+    with SoCoFleet([fake.ip]) as fleet:
+        result = fleet.volume()[fake.ip]
+
+    assert 0 <= result.elapsed < 5
@@ -0,0 +1,102 @@
+import time
+
+import pytest
+
+from didl import DidlItem
+from library import LibraryIndex
+from soco import SoCo
+
+
+def item(item_id, title):
+    return DidlItem(item_id, 'A:TRACKS', 'object.item.audioItem.musicTrack', title, 'Artist', 'Album', '', 'x-file-cifs://a.mp3')
+
+
+def test_category_asked_for_later_is_fetched(fake_speaker):
+    fake = fake_speaker()
+    fake.state['library_size'] = 20
+    index = LibraryIndex(':memory:')
+    sonos = SoCo(fake.ip)
+
+    assert index.sync(sonos, categories=('tracks',)) == ['tracks']
+    assert index.sync(sonos, categories=('tracks',)) == []
+    assert index.sync(sonos, categories=('tracks', 'albums')) == ['albums']
+    assert index.sync(sonos, categories=('tracks', 'albums')) == []
+
+    fake.state['update_id'] += 1
+    assert index.sync(sonos, categories=('tracks', 'albums')) == ['tracks', 'albums']
+
+
+def test_max_age_skips_the_speaker(fake_speaker):
+    fake = fake_speaker()
+    fake.state['library_size'] = 20
+    index = LibraryIndex(':memory:')
+    sonos = SoCo(fake.ip)
+
+    index.sync(sonos, categories=('tracks',))
+    assert index.checked(fake.household_id) <= time.time()
+
+    requests = fake.requests
+    fake.state['update_id'] += 1
+    assert index.sync(sonos, categories=('tracks',), max_age=60) == []
+    assert fake.requests == requests
+
+    assert index.sync(sonos, categories=('tracks',)) == ['tracks']
+
+
+def test_replaced_item_leaves_no_stale_search_entry():
+    index = LibraryIndex(':memory:')
+    if not index.has_fts:
+        return
+
+    index._replace('household', 'tracks', [item('S:1', 'Old title')], 'A:TRACKS', 1)
+    # The same item listed under another category replaces the first row.
+    index._replace('household', 'playlists', [item('S:1', 'New title')], 'SQ:', 1)
+
+    index._db.execute("INSERT INTO items_fts (items_fts, rank) VALUES ('integrity-check', 1)")
+    assert [found.title for found in index.search('new')] == ['New title']
+    assert index.search('old') == []
+
+
+def test_crawl_runs_without_the_lock(fake_speaker):
+    fake = fake_speaker()
+    fake.state['library_size'] = 300
+    index = LibraryIndex(':memory:')
+    sonos = SoCo(fake.ip)
+    browse = sonos.browse
+    locked = []
+
+    def crawl(*args, **kwargs):
+        for entry in browse(*args, **kwargs):
+            locked.append(index._lock.locked())
+            yield entry
+
+    sonos.browse = crawl
+    index.sync(sonos, categories=('tracks',), page_size=100)
+
+    assert len(locked) == 300
+    assert not any(locked)
+    assert index.count(fake.household_id) == 300
+
+
+def test_failed_crawl_keeps_the_index(fake_speaker):
+    fake = fake_speaker()
+    fake.state['library_size'] = 20
+    index = LibraryIndex(':memory:')
+    sonos = SoCo(fake.ip)
+    index.sync(sonos, categories=('tracks',))
+
+    def crawl(*args, **kwargs):
+        yield item('S:1', 'Partial')
+        raise IOError('speaker went away')
+
+    sonos.browse = crawl
+    fake.state['update_id'] += 1
+    fake.state['library_size'] = 30
+
+    with pytest.raises(IOError):
+        index.sync(sonos, categories=('tracks',))
+
+    assert index.count(fake.household_id) == 20
+    sonos.browse = SoCo(fake.ip).browse
+    assert index.sync(sonos, categories=('tracks',)) == ['tracks']
+    assert index.count(fake.household_id) == 30
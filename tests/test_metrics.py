@@ -0,0 +1,92 @@
+import pytest
+import requests
+
+import metrics
+from metrics import CallRecord, Histogram, Metrics
+from soco import SoCo
+
+
+def record(latency, speaker_ip='10.0.0.1', action='GetVolume', error=None, parse_time=0.0002):
+    return CallRecord(speaker_ip, action, latency, 100, 200, error, parse_time, 0.0)
+
+
+@pytest.fixture
+def installed():
+    collected = Metrics().install()
+    yield collected
+    collected.uninstall()
+    collected.stop()
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+
+    assert list(histogram.cumulative()) == [(0.1, 2), (1.0, 3), ('+Inf', 4)]
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(1.0) == 2.0
+
+
+def test_render():
+    collected = Metrics()
+    collected.on_call(record(0.003))
+    collected.on_call(record(0.3, error=402))
+
+    lines = collected.render().splitlines()
+    labels = '{speaker="10.0.0.1",action="GetVolume"'
+
+    assert 'sonos_requests_total%s} 2' % labels in lines
+    assert 'sonos_request_errors_total%s,code="402"} 1' % labels in lines
+    assert 'sonos_request_bytes_sent_total%s} 200' % labels in lines
+    assert 'sonos_request_latency_seconds_bucket%s,le="0.005"} 1' % labels in lines
+    assert 'sonos_request_latency_seconds_bucket%s,le="0.25"} 1' % labels in lines
+    assert 'sonos_request_latency_seconds_bucket%s,le="0.5"} 2' % labels in lines
+    assert 'sonos_request_latency_seconds_bucket%s,le="+Inf"} 2' % labels in lines
+    assert 'sonos_request_latency_seconds_count%s} 2' % labels in lines
+    assert '# TYPE sonos_request_latency_seconds histogram' in lines
+
+
+def test_render_escapes_labels():
+    collected = Metrics()
+    collected.on_call(record(0.01, error='bad "value"\\\nhere'))
+
+    assert 'code="bad \\"value\\"\\\\\\nhere"} 1' in collected.render()
+
+
+def test_hooks_see_every_request(fake_speaker, installed):
+    fake = fake_speaker()
+    fake.faults['SetVolume'] = 402
+    seen = []
+
+    def failing(record):
+        raise RuntimeError('a broken hook')
+
+    metrics.add_hook(seen.append)
+    metrics.add_hook(failing)
+    try:
+        speaker = SoCo(fake.ip)
+        assert speaker.volume() == 20
+        assert speaker.volume(30) == 402
+    finally:
+        metrics.remove_hook(seen.append)
+        metrics.remove_hook(failing)
+
+    assert [(r.speaker_ip, r.action, r.error) for r in seen] == [(fake.ip, 'GetVolume', None), (fake.ip, 'SetVolume', 402)]
+    assert all(r.latency > 0 and r.bytes_sent > 0 and r.bytes_received > 0 for r in seen)
+
+    rows = dict((row['action'], row) for row in installed.summary())
+    assert rows['GetVolume']['count'] == 1
+    assert rows['SetVolume']['errors'] == {'402': 1}
+
+
+def test_serve_listens_on_localhost(installed):
+    installed.on_call(record(0.01))
+
+    port = installed.serve(port=0)
+
+    assert installed._server.server_address[0] == '127.0.0.1'
+    response = requests.get('http://127.0.0.1:%d/metrics' % port, timeout=5)
+    assert response.status_code == 200
+    assert 'sonos_requests_total' in response.text
+    assert requests.get('http://127.0.0.1:%d/' % port, timeout=5).status_code == 404
@@ -0,0 +1,53 @@
+import pytest
+
+from fakespeaker import STATUS_ZP, make_didl
+from models import NOT_IMPLEMENTED, SpeakerInfo, Track, parse_speaker_info
+from soco import SoCo
+
+
+BASE_URL = 'http://10.0.0.1:1400'
+
+
+def test_track_parses_its_metadata_once_and_only_when_read():
+    track = Track('3', '0:03:30', 'x-file-cifs://server/music/track7.mp3', make_didl(1, start=7), BASE_URL)
+
+    assert track.uri.endswith('track7.mp3') and track['duration'] == '0:03:30'
+    assert track._item is None
+
+    assert track.title == 'Track 7'
+    item = track._item
+    assert track._metadata is None
+    assert (track.artist, track.album) == ('Artist 7', 'Album 7')
+    assert track.album_art.startswith(BASE_URL + '/getaa?s=1&u=')
+    assert track._item is item
+
+
+@pytest.mark.parametrize('metadata', ['', NOT_IMPLEMENTED, '<DIDL-Lite><item>'])
+def test_track_without_usable_metadata(metadata):
+    track = Track('1', '0:00:00', 'x-rincon-stream:RINCON_1', metadata, BASE_URL)
+
+    assert dict(track) == {'playlist_position': '1', 'duration': '0:00:00', 'position': '', 'title': '',
+                           'artist': '', 'album': '', 'album_art': '', 'uri': 'x-rincon-stream:RINCON_1'}
+
+
+def test_speaker_info_is_parsed_from_status_zp():
+    info = parse_speaker_info(STATUS_ZP % ('Kitchen', 'RINCON_1', 'Sonos_abc'))
+
+    assert isinstance(info, SpeakerInfo)
+    assert info['zone_name'] == 'Kitchen'
+    assert info.uid == 'RINCON_1'
+    assert info.household_id == 'Sonos_abc'
+    assert info.get('missing') is None
+    assert len(info) == len(SpeakerInfo.TAGS)
+
+    other = parse_speaker_info(STATUS_ZP % ('Hall', 'RINCON_2', ''.join(['Sonos_', 'abc'])))
+    assert other.household_id is info.household_id
+
+
+def test_get_speaker_info_reports_the_household(fake_speaker):
+    fake = fake_speaker(household_id='Sonos_H1')
+
+    info = SoCo(fake.ip).get_speaker_info()
+
+    assert info['household_id'] == 'Sonos_H1'
+    assert info['uid'] == fake.uid
@@ -0,0 +1,113 @@
+import threading
+import time
+
+import pytest
+
+from ramp import RampScheduler
+
+
+@pytest.fixture
+def scheduler():
+    with RampScheduler(interval=0.01) as scheduler:
+        yield scheduler
+
+
+def test_fade_reaches_the_target(fake_speaker, scheduler):
+    fake = fake_speaker()
+
+    ramp = scheduler.fade(fake.ip, 40, 0.2)
+
+    assert ramp.wait(5)
+    assert ramp.error is None and not ramp.cancelled
+    assert ramp.start_volume == 20
+    assert fake.state['volume'] == 40
+    assert scheduler.ramp(fake.ip) is None
+
+
+def test_slow_speakers_get_only_the_latest_level(fake_speaker, scheduler):
+    fake = fake_speaker(latency=0.1)
+
+    ramp = scheduler.fade(fake.ip, 100, 0.3, start_volume=0)
+
+    assert ramp.wait(5)
+    assert fake.state['volume'] == 100
+    assert scheduler.coalesced > 0
+    # One SetVolume in flight at a time, rather than one per step.
+    assert scheduler.sent <= 0.4 / 0.1 + 2
+
+
+def test_cancel_stops_where_the_ramp_is(fake_speaker, scheduler):
+    fake = fake_speaker()
+
+    ramp = scheduler.fade(fake.ip, 100, 10, start_volume=0)
+    time.sleep(0.2)
+    ramp.cancel()
+
+    assert ramp.done and ramp.cancelled
+    time.sleep(0.1)
+    assert 0 < fake.state['volume'] < 20
+    assert scheduler.ramp(fake.ip) is None
+
+
+def test_retarget(fake_speaker, scheduler):
+    fake = fake_speaker()
+
+    ramp = scheduler.fade(fake.ip, 80, 10, start_volume=20)
+    time.sleep(0.1)
+    ramp.retarget(30, 0.1)
+
+    assert ramp.wait(5)
+    assert ramp.target == 30
+    assert fake.state['volume'] == 30
+
+
+def test_fade_replaces_the_running_ramp(fake_speaker, scheduler):
+    fake = fake_speaker()
+
+    first = scheduler.fade(fake.ip, 100, 10, start_volume=0)
+    time.sleep(0.1)
+    second = scheduler.fade(fake.ip, 10, 0.1)
+
+    assert first.done and first.cancelled
+    assert 0 < second.start_volume < 20
+    assert second.wait(5)
+    assert fake.state['volume'] == 10
+
+
+def test_failed_set_volume_fails_the_ramp(fake_speaker, scheduler):
+    fake = fake_speaker()
+    fake.faults['SetVolume'] = 501
+
+    ramp = scheduler.fade(fake.ip, 40, 0.1, start_volume=20)
+
+    assert ramp.wait(5)
+    assert ramp.error == 501
+    assert not ramp.cancelled
+
+
+def test_failure_is_charged_to_the_ramp_that_sent_it(fake_speaker, scheduler):
+    fake = fake_speaker()
+    sent = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    class Speaker(object):
+        def volume(self, volume):
+            calls.append(volume)
+            if len(calls) == 1:
+                sent.set()
+                release.wait(5)
+                raise IOError('speaker went away')
+            return True
+
+    scheduler._sender(fake.ip).soco = Speaker()
+
+    first = scheduler.fade(fake.ip, 50, 0, start_volume=20)
+    assert sent.wait(5)
+    second = scheduler.fade(fake.ip, 60, 0, start_volume=50)
+    release.set()
+
+    assert second.wait(5)
+    assert first.cancelled
+    assert second.error is None
+    assert calls == [50, 60]
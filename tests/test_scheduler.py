@@ -0,0 +1,100 @@
+import time
+
+import pytest
+import requests
+
+from scheduler import CommandScheduler, DeadlineExceeded, SpeakerUnavailable
+
+
+SPEAKER = '127.0.0.2'
+
+
+def unreachable(timeout):
+    raise requests.ConnectionError('unreachable')
+
+
+def answer(timeout):
+    return 'ok'
+
+
+def open_breaker(scheduler):
+    with pytest.raises(requests.ConnectionError):
+        scheduler.call(SPEAKER, unreachable)
+    assert scheduler.circuit(SPEAKER).state == 'open'
+
+    with pytest.raises(SpeakerUnavailable):
+        scheduler.call(SPEAKER, answer)
+
+
+def wait_for_half_open(scheduler):
+    time.sleep(scheduler.reset_timeout + 0.02)
+    assert scheduler.circuit(SPEAKER).state == 'half-open'
+
+
+def test_trial_success_closes_breaker():
+    scheduler = CommandScheduler(failure_threshold=1, reset_timeout=0.05, retries=0)
+    open_breaker(scheduler)
+    wait_for_half_open(scheduler)
+
+    assert scheduler.call(SPEAKER, answer) == 'ok'
+    assert scheduler.circuit(SPEAKER).state == 'closed'
+
+
+def test_failed_trial_reopens_breaker():
+    scheduler = CommandScheduler(failure_threshold=1, reset_timeout=0.05, retries=0)
+    open_breaker(scheduler)
+    wait_for_half_open(scheduler)
+
+    with pytest.raises(requests.ConnectionError):
+        scheduler.call(SPEAKER, unreachable)
+    assert scheduler.circuit(SPEAKER).state == 'open'
+
+    wait_for_half_open(scheduler)
+    assert scheduler.call(SPEAKER, answer) == 'ok'
+
+
+def test_trial_expiring_in_queue_does_not_wedge_breaker():
+    # One command a second: after the failure, the next slot is a second away,
+    # so a trial with a shorter deadline expires before it is sent.
+    scheduler = CommandScheduler(rate=1, failure_threshold=1, reset_timeout=0.05, retries=0)
+    open_breaker(scheduler)
+    wait_for_half_open(scheduler)
+
+    with pytest.raises(DeadlineExceeded):
+        scheduler.call(SPEAKER, answer, timeout=0.1)
+
+    time.sleep(1.0)
+    assert scheduler.call(SPEAKER, answer) == 'ok'
+    assert scheduler.circuit(SPEAKER).state == 'closed'
+
+
+def test_cancelled_trial_does_not_wedge_breaker():
+    scheduler = CommandScheduler(failure_threshold=1, reset_timeout=0.05, retries=0)
+    open_breaker(scheduler)
+    wait_for_half_open(scheduler)
+
+    # Keep the trial in the queue, as if the worker were busy, and cancel it
+    # before it runs.
+    speaker = scheduler._speaker(SPEAKER)
+    speaker.worker = 'busy'
+    future = scheduler.submit(SPEAKER, answer)
+    assert future.cancel()
+    speaker.worker = None
+
+    assert scheduler.call(SPEAKER, answer) == 'ok'
+    assert scheduler.circuit(SPEAKER).state == 'closed'
+
+
+def test_trial_raising_other_error_does_not_wedge_breaker():
+    scheduler = CommandScheduler(failure_threshold=1, reset_timeout=0.05, retries=0)
+    open_breaker(scheduler)
+    wait_for_half_open(scheduler)
+
+    def broken(timeout):
+        raise ValueError('not a network error')
+
+    with pytest.raises(ValueError):
+        scheduler.call(SPEAKER, broken)
+
+    assert scheduler.call(SPEAKER, answer) == 'ok'
+    assert scheduler.circuit(SPEAKER).state == 'closed'
@@ -0,0 +1,63 @@
+import multiprocessing
+import threading
+import zlib
+
+import pytest
+
+from actions import InvalidArgsError
+from fleet import FleetResult
+from shards import ShardedController, _reply
+
+
+def test_households_stay_together(fake_speaker):
+    first = fake_speaker(household_id='Sonos_A', uid='RINCON_A1')
+    second = fake_speaker(household_id='Sonos_A', uid='RINCON_A2')
+    other = fake_speaker(household_id='Sonos_B', uid='RINCON_B1')
+    first.state['volume'], second.state['volume'], other.state['volume'] = 10, 11, 12
+
+    with ShardedController([first.ip, other.ip, second.ip], processes=2) as controller:
+        assert controller.shard_of(first.ip) == controller.shard_of(second.ip)
+        assert controller.shard_of(other.ip) != controller.shard_of(first.ip)
+
+        results = controller.volume(timeout=30)
+
+    assert dict((ip, result.value) for ip, result in results.items()) == {first.ip: 10, second.ip: 11, other.ip: 12}
+    assert all(result.error is None for result in results.values())
+
+
+@pytest.mark.parametrize('shard_by', ['uid', 'ip'])
+def test_sharding_by_uid_or_ip_is_stable(fake_speaker, shard_by):
+    fakes = [fake_speaker(uid='RINCON_%d' % i) for i in range(3)]
+
+    with ShardedController([fake.ip for fake in fakes], processes=2, shard_by=shard_by) as controller:
+        for fake in fakes:
+            key = fake.uid if shard_by == 'uid' else fake.ip
+            assert controller.shard_of(fake.ip) == zlib.crc32(key.encode('utf-8')) % 2
+
+
+def test_errors_cross_the_process_boundary(fake_speaker, unused_ip):
+    fake = fake_speaker()
+    fake.faults['GetVolume'] = 402
+
+    with ShardedController([fake.ip, unused_ip], processes=2, shard_by='ip') as controller:
+        with pytest.raises(InvalidArgsError) as raised:
+            controller.call(fake.ip, 'volume', timeout=30)
+        assert raised.value.code == 402
+
+        assert controller.call(fake.ip, 'volume', 30, timeout=30) is True
+        assert fake.state['volume'] == 30
+
+        results = controller.run('volume', timeout=30)
+        assert isinstance(results[unused_ip].error, Exception)
+
+
+def test_unpicklable_results_are_replaced():
+    front, worker = multiprocessing.Pipe()
+
+    _reply(worker, threading.Lock(), 7, {'a': FleetResult(1, None, 0.1), 'b': FleetResult(lambda: None, None, 0.1)})
+
+    request_id, results = front.recv()
+    assert request_id == 7
+    assert results['a'] == FleetResult(1, None, 0.1)
+    assert results['b'].value is None
+    assert isinstance(results['b'].error, RuntimeError)
@@ -0,0 +1,49 @@
+from fakespeaker import make_zone_group_state
+import snapshot
+
+
+def test_offline_speaker_does_not_abort_the_snapshot(fake_speaker, unused_ip):
+    first = fake_speaker(uid='RINCON_A01400')
+    second = fake_speaker(uid='RINCON_B01400')
+    first.state.update(volume=35, bass=3, mute=True)
+
+    results = snapshot.snapshot([first.ip, second.ip, unused_ip])
+
+    assert list(results) == [first.ip, second.ip, unused_ip]
+    assert results[first.ip].error is None
+    assert results[first.ip].value.volume == 35
+    assert results[first.ip].value.bass == 3
+    assert results[first.ip].value.mute is True
+    assert results[second.ip].error is None
+    assert results[unused_ip].value is None
+    assert results[unused_ip].error is not None
+
+    assert [state.ip for state in snapshot.captured(results)] == [first.ip, second.ip]
+
+
+def test_restore_a_household(fake_speaker, tmp_path):
+    coordinator = fake_speaker(uid='RINCON_A01400')
+    member = fake_speaker(uid='RINCON_B01400')
+    for fake in (coordinator, member):
+        fake.state['zone_group_state'] = make_zone_group_state([[coordinator, member]])
+    coordinator.state.update(uri='x-rincon-queue:RINCON_A01400#0', track=3, rel_time='0:01:30')
+    member.state['volume'] = 40
+
+    path = str(tmp_path / 'snapshot.json')
+    results = snapshot.snapshot(coordinator.ip)
+    snapshot.save(snapshot.captured(results), path)
+
+    states = dict((state.ip, state) for state in snapshot.load(path))
+    assert states[coordinator.ip].transport.track == 3
+    assert states[member.ip].transport is None
+
+    member.state['volume'] = 5
+    coordinator.state.update(uri='x-rincon-mp3radio://example.com/doorbell.mp3', track=1, rel_time='0:00:00')
+
+    failures = snapshot.restore(snapshot.load(path))
+
+    assert failures == {coordinator.ip: [], member.ip: []}
+    assert member.state['volume'] == 40
+    assert coordinator.state['uri'] == 'x-rincon-queue:RINCON_A01400#0'
+    assert coordinator.state['track'] == 3
+    assert coordinator.state['rel_time'] == '0:01:30'
@@ -0,0 +1,60 @@
+from cache import StateCache
+from soco import SoCo
+
+
+def test_set_playmode(fake_speaker):
+    fake = fake_speaker()
+
+    assert SoCo(fake.ip).set_playmode('shuffle') is True
+    assert fake.state['play_mode'] == 'SHUFFLE'
+
+
+def test_start_playlist(fake_speaker):
+    fake = fake_speaker()
+
+    assert SoCo(fake.ip).start_playlist(2) is True
+    assert fake.state['transport_state'] == 'PLAYING'
+    assert fake.state['volume'] == 20
+
+    assert SoCo(fake.ip).start_playlist(0, volume=35) is True
+    assert fake.state['volume'] == 35
+
+
+def test_volume_zero_is_set_not_read(fake_speaker):
+    fake = fake_speaker()
+    speaker = SoCo(fake.ip, cache=StateCache(ttl=60))
+
+    assert speaker.volume(0) is True
+    assert fake.state['volume'] == 0
+    assert speaker.volume() == 0
+
+
+def test_relative_volume_is_clamped_and_cached(fake_speaker):
+    fake = fake_speaker()
+    speaker = SoCo(fake.ip, cache=StateCache(ttl=60))
+
+    assert speaker.set_relative_volume(-5) == 15
+    assert speaker.set_relative_volume(200) == 100
+    assert fake.state['volume'] == 100
+
+    requests = fake.requests
+    assert speaker.volume() == 100
+    assert fake.requests == requests
+
+
+def test_group_volume_keeps_the_balance(fake_speaker):
+    first, second = fake_speaker(), fake_speaker()
+    first.group = second.group = [first, second]
+    first.state['volume'], second.state['volume'] = 10, 30
+    speaker = SoCo(first.ip, cache=StateCache(ttl=60))
+    assert speaker.volume() == 10
+
+    assert speaker.group_volume() == 20
+    assert speaker.group_volume(40) is True
+    assert (first.state['volume'], second.state['volume']) == (20, 60)
+    # The cached volume of this speaker is dropped rather than left stale.
+    assert speaker.volume() == 20
+
+    assert speaker.set_relative_group_volume(-20) == 20
+    assert (first.state['volume'], second.state['volume']) == (10, 30)
+    assert speaker.volume() == 10
@@ -0,0 +1,198 @@
+import concurrent.futures
+import importlib.machinery
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import types
+
+import pytest
+
+
+SONOSHELL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sonoshell')
+
+
+@pytest.fixture
+def sonoshell():
+    """ A fresh copy of the sonoshell script, loaded as a module. """
+    module = types.ModuleType('sonoshell')
+    module.__file__ = SONOSHELL
+    importlib.machinery.SourceFileLoader('sonoshell', SONOSHELL).exec_module(module)
+
+    yield module
+
+    for metrics in module.metrics:
+        metrics.uninstall()
+
+
+class Output(object):
+    def __init__(self):
+        self.lines = []
+
+    def write(self, text):
+        self.lines.append(text)
+
+
+@pytest.mark.parametrize('command, word, state, value', [
+    ('mute', 'on', 'mute', True),
+    ('set_loudness', 'off', 'loudness', False),
+    ('status_light', 'no', 'led', 'Off'),
+])
+def test_flag_arguments(sonoshell, fake_speaker, command, word, state, value):
+    fake = fake_speaker()
+
+    sonoshell.execute_args([fake.ip, command, word], Output())
+
+    assert fake.state[state] == value
+
+
+def test_flag_arguments_reject_other_words(sonoshell, fake_speaker):
+    fake = fake_speaker()
+
+    with pytest.raises(ValueError):
+        sonoshell.execute_args([fake.ip, 'mute', '2'], Output())
+
+
+def test_concurrent_commands_share_the_lazy_objects(sonoshell, fake_speaker):
+    fake = fake_speaker()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
+        speakers = list(executor.map(lambda i: sonoshell.get_speaker(fake.ip), range(64)))
+        tables = list(executor.map(lambda i: sonoshell.get_commands(), range(64)))
+
+    assert len(set(map(id, speakers))) == 1
+    assert len(sonoshell.topology) == len(sonoshell.scheduler) == len(sonoshell.metrics) == 1
+    assert all(len(table) == len(tables[0]) for table in tables)
+
+
+def test_playartist_queues_and_plays_the_artists_tracks(sonoshell, fake_speaker):
+    from library import LibraryIndex
+
+    fake = fake_speaker()
+    fake.state['library_size'] = 100
+    fake.state['queue'] = []
+    sonoshell.library.append(LibraryIndex(':memory:'))
+    out = Output()
+
+    sonoshell.execute_args([fake.ip, 'playartist', 'artist', '7'], out)
+
+    assert ''.join(out.lines).strip() == 'True'
+    assert fake.state['queue'] == ['x-file-cifs://server/music/track%d.mp3' % i for i in (57, 7)]
+    assert fake.state['transport_state'] == 'PLAYING'
+
+    out = Output()
+    sonoshell.execute_args([fake.ip, 'playartist', 'Nobody'], out)
+    assert ''.join(out.lines).strip() == 'No tracks by Nobody'
+
+
+def test_only_bool_arguments_are_flags(sonoshell, fake_speaker):
+    fake = fake_speaker()
+
+    # volume's False default means "get", so 0 is a volume, not off.
+    sonoshell.execute_args([fake.ip, 'volume', '0'], Output())
+    assert fake.state['volume'] == 0
+
+    out = Output()
+    sonoshell.execute_args([fake.ip, 'get_speaker_info', 'yes'], out)
+    assert fake.uid in ''.join(out.lines)
+
+
+def test_batch_prints_one_json_result_per_line(sonoshell, fake_speaker, capsys):
+    first, second = fake_speaker(), fake_speaker()
+    first.faults['GetBass'] = 402
+
+    sonoshell.run_batch([
+        '# volume first, then read it back',
+        first.ip + ' volume 30',
+        '',
+        second.ip + ' volume',
+        first.ip + ' volume',
+        first.ip + ' bass',
+        first.ip + ' mute maybe',
+        second.ip,
+    ])
+
+    results = dict((result['line'], result) for result in map(json.loads, capsys.readouterr().out.splitlines()))
+
+    assert sorted(results) == [2, 4, 5, 6, 7, 8]
+    assert results[2]['output'] == '30' and results[2]['args'] == ['30']
+    assert results[5]['output'] == '30' and results[5]['error'] is None
+    assert (results[4]['speaker'], results[4]['cmd'], results[4]['output']) == (second.ip, 'volume', '20')
+    assert 'InvalidArgsError' in results[6]['error']
+    assert 'ValueError' in results[7]['error']
+    assert results[8]['error'] == "ValueError('missing command')"
+    assert all(result['latency_ms'] >= 0 for result in results.values())
+
+
+@pytest.fixture
+def socket_path(tmpdir):
+    return str(tmpdir.join('sonoshell.sock'))
+
+
+@pytest.fixture
+def daemon(socket_path):
+    """ A function starting `sonoshell --daemon` on socket_path, stopped after the test. """
+    processes = []
+
+    def start():
+        process = subprocess.Popen([sys.executable, SONOSHELL, '--daemon', socket_path])
+        processes.append(process)
+
+        deadline = time.monotonic() + 10
+        while not can_connect(socket_path):
+            assert process.poll() is None and time.monotonic() < deadline
+            time.sleep(0.05)
+        return process
+
+    yield start
+
+    for process in processes:
+        if process.poll() is None:
+            process.send_signal(signal.SIGINT)
+            process.wait(10)
+
+
+def can_connect(path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        return True
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+
+
+def client(path, *args):
+    return subprocess.check_output([sys.executable, SONOSHELL, '--client', path] + list(args), timeout=30).decode('utf-8')
+
+
+def test_daemon_round_trip(daemon, socket_path, fake_speaker):
+    fake = fake_speaker()
+    process = daemon()
+
+    assert client(socket_path, fake.ip, 'volume', '35').strip() == '35'
+    assert client(socket_path, fake.ip, 'volume').strip() == '35'
+    assert client(socket_path, fake.ip, 'mute', 'maybe').startswith('Error: ValueError(')
+    assert 'GetVolume' in client(socket_path, 'stats')
+
+    process.send_signal(signal.SIGINT)
+    process.wait(10)
+    assert not os.path.exists(socket_path)
+
+
+def test_daemon_replaces_a_stale_socket(daemon, socket_path, fake_speaker):
+    fake = fake_speaker()
+
+    # What a daemon that was killed leaves behind: a socket nobody listens on.
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(socket_path)
+    stale.close()
+    assert os.path.exists(socket_path) and not can_connect(socket_path)
+
+    daemon()
+
+    assert client(socket_path, fake.ip, 'volume').strip() == '20'
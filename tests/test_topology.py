@@ -0,0 +1,79 @@
+from fakespeaker import make_zone_group_state
+from scheduler import CommandScheduler
+from soco import SoCo
+from topology import Topology
+
+
+def test_coordinator_of_group_member(fake_speaker):
+    coordinator = fake_speaker(uid='RINCON_A01400')
+    member = fake_speaker(uid='RINCON_B01400')
+    for fake in (coordinator, member):
+        fake.state['zone_group_state'] = make_zone_group_state([[coordinator, member]])
+
+    topology = Topology()
+
+    assert topology.coordinator_ip(member.ip) == coordinator.ip
+    assert topology.coordinator_ip(coordinator.ip) == coordinator.ip
+
+
+def test_speakers_of_two_households(fake_speaker):
+    first = fake_speaker(uid='RINCON_A01400', household_id='Sonos_ONE')
+    first_member = fake_speaker(uid='RINCON_B01400', household_id='Sonos_ONE')
+    second = fake_speaker(uid='RINCON_C01400', household_id='Sonos_TWO')
+    for fake in (first, first_member):
+        fake.state['zone_group_state'] = make_zone_group_state([[first, first_member]])
+
+    topology = Topology()
+
+    assert topology.coordinator_ip(first_member.ip) == first.ip
+    assert topology.group_of(second.ip).coordinator.uid == 'RINCON_C01400'
+    # The first household is still cached.
+    requests = first.requests
+    assert topology.coordinator_ip(first_member.ip) == first.ip
+    assert first.requests == requests
+
+    assert [group.coordinator.ip for group in topology.groups(second.ip)] == [second.ip]
+    assert len(topology.groups()) == 2
+
+    topology.invalidate(second.ip)
+    assert topology.coordinator_ip(first_member.ip) == first.ip
+    assert first.requests == requests
+
+
+def test_regroup_is_noticed_after_max_age(fake_speaker):
+    first = fake_speaker(uid='RINCON_A01400')
+    second = fake_speaker(uid='RINCON_B01400')
+    for fake in (first, second):
+        fake.state['zone_group_state'] = make_zone_group_state([[first, second]])
+
+    topology = Topology(max_age=0)
+    assert topology.coordinator_ip(second.ip) == first.ip
+
+    for fake in (first, second):
+        fake.state['zone_group_state'] = make_zone_group_state([[second, first]])
+
+    assert topology.coordinator_ip(first.ip) == second.ip
+
+
+def test_offline_speaker_is_not_fetched_on_every_call(unused_ip):
+    scheduler = CommandScheduler(retries=0)
+    topology = Topology(scheduler=scheduler, retry_after=60)
+
+    assert topology.coordinator_ip(unused_ip) == unused_ip
+    assert scheduler.circuit(unused_ip).failures == 1
+
+    assert topology.coordinator_ip(unused_ip) == unused_ip
+    assert scheduler.circuit(unused_ip).failures == 1
+
+
+def test_routed_commands_go_to_the_coordinator(fake_speaker):
+    coordinator = fake_speaker(uid='RINCON_A01400')
+    member = fake_speaker(uid='RINCON_B01400')
+    for fake in (coordinator, member):
+        fake.state['zone_group_state'] = make_zone_group_state([[coordinator, member]])
+
+    sonos = SoCo(member.ip, topology=Topology())
+
+    assert sonos.pause() is True
+    assert coordinator.state['transport_state'] == 'PAUSED_PLAYBACK'
+    assert member.state['transport_state'] == 'STOPPED'
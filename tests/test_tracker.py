@@ -0,0 +1,62 @@
+import time
+
+import pytest
+
+from soco import SoCo
+from tracker import PositionTracker
+
+
+@pytest.mark.parametrize('duration', ['0:00:00', 'NOT_IMPLEMENTED'])
+def test_stream_is_not_resynced_on_every_read(fake_speaker, duration):
+    fake = fake_speaker()
+    fake.state.update(uri='x-rincon-mp3radio://stream.example.com/radio.mp3', track_duration=duration,
+                      transport_state='PLAYING', rel_time='0:12:00')
+
+    tracker = PositionTracker(SoCo(fake.ip))
+    playback = tracker.playback()
+    requests = fake.requests
+
+    assert playback.duration is None
+    assert playback.position == pytest.approx(720.0, abs=0.5)
+
+    for _ in range(5):
+        assert tracker.playback().position >= 720.0
+
+    assert fake.requests == requests
+    assert tracker.syncs == 1
+
+
+def test_track_is_resynced_at_its_end(fake_speaker):
+    fake = fake_speaker()
+    fake.state.update(uri='x-file-cifs://server/music/track0.mp3', track_duration='0:03:30',
+                      transport_state='PLAYING', rel_time='0:01:00')
+
+    tracker = PositionTracker(SoCo(fake.ip), verify_interval=None)
+    start = tracker.playback()
+
+    assert start.duration == 210.0
+    assert tracker.playback(tracker._synced + 60).position == pytest.approx(120.0)
+    assert tracker.syncs == 1
+
+    tracker.playback(tracker._synced + 200)
+    assert tracker.syncs == 2
+
+
+def test_position_is_timed_around_its_own_request():
+    class Speaker(object):
+        def get_position_info(self):
+            time.sleep(0.2)
+            return {'TrackURI': 'x-file-cifs://server/music/track0.mp3', 'Track': '1',
+                    'RelTime': '0:01:00', 'TrackDuration': '0:03:30'}
+
+        def get_transport_info(self):
+            time.sleep(0.5)
+            return {'CurrentTransportState': 'PLAYING'}
+
+    tracker = PositionTracker(Speaker(), verify_interval=None)
+    before = time.monotonic()
+    tracker.sync()
+
+    # Halfway through GetPositionInfo, not after GetTransportInfo.
+    assert tracker._synced - before == pytest.approx(0.1, abs=0.05)
+    assert tracker.playback(tracker._synced + 1).state == 'PLAYING'
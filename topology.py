@@ -0,0 +1,263 @@
+try:
+    import xml.etree.cElementTree as XML
+except ImportError:
+    import xml.etree.ElementTree as XML
+
+import collections
+import threading
+import time
+
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+from soco import SoCo
+
+
+ZoneMember = collections.namedtuple('ZoneMember', ['uid', 'ip', 'zone_name', 'invisible'])
+ZoneMember.__doc__ = """A speaker in a zone group.
+
+uid -- The speaker's UID, e.g. 'RINCON_000E58000000001400'.
+ip -- The speaker's IP address.
+zone_name -- The room the speaker is in.
+invisible -- True for speakers not shown as rooms, e.g. a bonded sub.
+
+"""
+
+ZoneGroup = collections.namedtuple('ZoneGroup', ['group_id', 'coordinator', 'members'])
+ZoneGroup.__doc__ = """A group of speakers playing the same audio.
+
+group_id -- The group's ID.
+coordinator -- The ZoneMember that runs the group's transport and queue.
+members -- Tuple of every ZoneMember, including the coordinator.
+
+"""
+
+
+def parse_zone_group_state(zone_group_state):
+    """ Parse a ZoneGroupState document into a list of ZoneGroups. """
+    groups = []
+
+    if not zone_group_state:
+        return groups
+
+    if not isinstance(zone_group_state, bytes):
+        zone_group_state = zone_group_state.encode('utf-8')
+
+    for group in XML.fromstring(zone_group_state).iter('ZoneGroup'):
+        members = []
+        coordinator = None
+
+        for element in group.iter('ZoneGroupMember'):
+            member = ZoneMember(element.get('UUID'),
+                                urlparse(element.get('Location', '')).hostname,
+                                element.get('ZoneName', ''),
+                                element.get('Invisible') == '1')
+            members.append(member)
+
+            if member.uid == group.get('Coordinator'):
+                coordinator = member
+
+        if coordinator is not None:
+            groups.append(ZoneGroup(group.get('ID'), coordinator, tuple(members)))
+
+    return groups
+
+
+class Topology(object):
+    """The zone groups of Sonos households, and who coordinates each one.
+
+    Transport commands (play, pause, next, the queue, ...) act on a whole
+    group and have to be sent to its coordinator. Pass a Topology to SoCo
+    (SoCo(ip, topology=topology)) and those commands are routed to the
+    coordinator of ip's group, while rendering commands (volume, EQ) still
+    go to ip itself.
+
+    Each household's topology is fetched from one of its speakers the first
+    time one of them is asked about, and then cached, so one Topology can be
+    shared by speakers of several households. subscribe() keeps a household
+    current through ZoneGroupTopology events; without events it's fetched
+    again after max_age seconds (if set) or after a routed command fails.
+    A speaker that couldn't be fetched from, or isn't in the topology it
+    returned, isn't asked again for retry_after seconds.
+
+    Public functions:
+    refresh -- Fetch a household's topology from a speaker.
+    update -- Replace a household's topology with a ZoneGroupState document.
+    groups -- Get every zone group of a household.
+    group_of -- Get the group a speaker is in.
+    coordinator_ip -- Get the IP to send a speaker's transport commands to.
+    invalidate -- Forget a household's topology, so it's fetched again.
+    on_event -- Update the topology from an events.Event.
+    subscribe -- Keep a household's topology current through events.
+
+    """
+
+    def __init__(self, max_age=None, scheduler=None, retry_after=5.0):
+        """ Arguments:
+        max_age -- Seconds after which a household's topology is fetched
+                   again. None to keep it until it's invalidated or updated
+                   by an event.
+        scheduler -- An optional scheduler.CommandScheduler to fetch the
+                     topology through, see SoCo.
+        retry_after -- Seconds before a speaker that couldn't be fetched
+                       from is asked again.
+
+        """
+        self.max_age = max_age
+        self.scheduler = scheduler
+        self.retry_after = retry_after
+
+        # household ID -> (groups, time.monotonic() of the fetch), and
+        # speaker IP -> (household ID, group).
+        self._households = {}
+        self._by_ip = {}
+        self._household_of = {}
+        self._failed = {}
+        self._lock = threading.Lock()
+
+    def refresh(self, speaker_ip):
+        """ Fetch the topology of speaker_ip's household from it. """
+        sonos = SoCo(speaker_ip, scheduler=self.scheduler)
+
+        with self._lock:
+            household = self._household_of.get(speaker_ip)
+
+        if household is None:
+            household = sonos.get_speaker_info()['household_id'] or speaker_ip
+
+        self.update(sonos.get_zone_group_state(), household)
+
+    def update(self, zone_group_state, household=None):
+        """ Replace a household's topology with a ZoneGroupState document.
+
+        Arguments:
+        zone_group_state -- The ZoneGroupState document.
+        household -- The household's ID. Defaults to the household the
+                     document's speakers were in, if any were known.
+
+        """
+        groups = parse_zone_group_state(zone_group_state)
+        by_ip = dict((member.ip, group) for group in groups for member in group.members if member.ip)
+
+        with self._lock:
+            if household is None:
+                household = next((self._by_ip[ip][0] for ip in by_ip if ip in self._by_ip), None)
+
+            self._forget(household)
+            self._households[household] = (groups, time.monotonic())
+
+            for ip, group in by_ip.items():
+                self._by_ip[ip] = (household, group)
+                self._household_of[ip] = household
+                self._failed.pop(ip, None)
+
+    def groups(self, speaker_ip=None):
+        """ Get every zone group of speaker_ip's household, fetching it if needed.
+
+        Without speaker_ip, get the groups of every household known.
+
+        """
+        if speaker_ip is None:
+            with self._lock:
+                return [group for groups, updated in self._households.values() for group in groups]
+
+        self._ensure(speaker_ip)
+
+        with self._lock:
+            entry = self._by_ip.get(speaker_ip)
+            return list(self._households[entry[0]][0]) if entry is not None else []
+
+    def group_of(self, speaker_ip):
+        """ Get the ZoneGroup speaker_ip is in, or None if it isn't known. """
+        self._ensure(speaker_ip)
+
+        with self._lock:
+            entry = self._by_ip.get(speaker_ip)
+            return entry[1] if entry is not None else None
+
+    def coordinator_ip(self, speaker_ip):
+        """ Get the IP of the coordinator of speaker_ip's group.
+
+        Returns:
+        The coordinator's IP, or speaker_ip itself if it coordinates its
+        group, isn't in the topology, or the topology can't be fetched.
+
+        """
+        try:
+            group = self.group_of(speaker_ip)
+        except Exception:
+            return speaker_ip
+
+        if group is None or not group.coordinator.ip:
+            return speaker_ip
+
+        return group.coordinator.ip
+
+    def invalidate(self, speaker_ip=None):
+        """ Forget the topology of speaker_ip's household (or of every
+        household), so it's fetched again when next needed.
+        """
+        with self._lock:
+            if speaker_ip is None:
+                self._households.clear()
+                self._by_ip.clear()
+            elif speaker_ip in self._by_ip:
+                self._forget(self._by_ip[speaker_ip][0])
+
+    def on_event(self, event):
+        """ Update the topology from a ZoneGroupTopology events.Event. """
+        zone_group_state = event.variables.get('ZoneGroupState')
+
+        if zone_group_state:
+            with self._lock:
+                household = self._household_of.get(event.speaker_ip)
+            self.update(zone_group_state, household)
+
+    def subscribe(self, speaker_ip, timeout=1800):
+        """ Keep the topology of speaker_ip's household current through its events.
+
+        Every speaker reports its whole household's topology, so subscribing
+        to one speaker per household is enough.
+
+        Returns:
+        The events.Subscription.
+
+        """
+        import events
+
+        return events.subscribe(speaker_ip, 'ZoneGroupTopology', callback=self.on_event, timeout=timeout)
+
+    def _forget(self, household):
+        """ Drop a household's groups. Call with the lock held. """
+        self._households.pop(household, None)
+        for ip in [ip for ip, entry in self._by_ip.items() if entry[0] == household]:
+            del self._by_ip[ip]
+
+    def _ensure(self, speaker_ip):
+        """ Fetch speaker_ip's household if it isn't known or is too old. """
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._by_ip.get(speaker_ip)
+            if entry is not None:
+                updated = self._households[entry[0]][1]
+                if self.max_age is None or now - updated < self.max_age:
+                    return
+
+            # Offline, or not in its own topology: don't ask on every call.
+            failed = self._failed.get(speaker_ip)
+            if failed is not None and now - failed < self.retry_after:
+                return
+
+        try:
+            self.refresh(speaker_ip)
+        except Exception:
+            with self._lock:
+                self._failed[speaker_ip] = time.monotonic()
+            raise
+
+        with self._lock:
+            if speaker_ip not in self._by_ip:
+                self._failed[speaker_ip] = time.monotonic()
@@ -0,0 +1,199 @@
+import collections
+import threading
+import time
+
+
+Playback = collections.namedtuple('Playback', ['uri', 'playlist_position', 'position', 'duration', 'state'])
+Playback.__doc__ = """Where playback is, as returned by PositionTracker.playback.
+
+uri -- The URI of the current track.
+playlist_position -- The track's position in the queue.
+position -- Seconds into the track, interpolated since the last sync.
+duration -- Length of the track in seconds, or None for streams.
+state -- 'PLAYING', 'PAUSED_PLAYBACK', 'STOPPED' or 'TRANSITIONING'.
+
+"""
+
+
+def parse_time(value):
+    """ Turn 'H:MM:SS' (as in RelTime and TrackDuration) into seconds, or None. """
+    try:
+        hours, minutes, seconds = value.split(':')
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    except (AttributeError, ValueError):
+        # '', 'NOT_IMPLEMENTED', or None.
+        return None
+
+
+def format_time(seconds):
+    """ Turn seconds into 'H:MM:SS'. """
+    seconds = int(seconds)
+    return '%d:%02d:%02d' % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+class PositionTracker(object):
+    """Follows the playback position of a speaker without polling it.
+
+    The position, duration and play state are fetched once, along with a
+    time.monotonic() timestamp, and from then on the position is worked out
+    locally: while playing it advances with the clock. The speaker is only
+    asked again when:
+
+    - an AVTransport event arrives (play, pause, track change, ...), see
+      on_event and subscribe,
+    - seek() is called,
+    - the interpolated position runs past the end of the track,
+    - verify_interval seconds have passed. If the position had drifted less
+      than drift_threshold seconds, the interval doubles (up to
+      max_verify_interval), so a steady clock is checked ever more rarely.
+
+    Public functions:
+    playback -- Get where playback is.
+    position -- Get the position in seconds.
+    sync -- Fetch the position from the speaker.
+    seek -- Seek, and follow the new position.
+    on_event -- Handle an AVTransport events.Event.
+    subscribe -- Resync on the speaker's AVTransport events.
+
+    """
+
+    def __init__(self, soco, drift_threshold=1.0, verify_interval=30.0, max_verify_interval=600.0):
+        """ Arguments:
+        soco -- The SoCo of the speaker (or group coordinator) to follow.
+        drift_threshold -- Seconds the interpolated position may be off by
+                           before verifying more often again.
+        verify_interval -- Seconds after which the position is first checked
+                           against the speaker. None to never check, e.g.
+                           when subscribed to events.
+        max_verify_interval -- The longest the check interval grows to.
+
+        """
+        self.soco = soco
+        self.drift_threshold = drift_threshold
+        self.base_verify_interval = verify_interval
+        self.max_verify_interval = max_verify_interval
+
+        # Number of times the speaker was asked, and how far off the
+        # interpolated position was the last time it was verified.
+        self.syncs = 0
+        self.drift = None
+
+        self._verify_interval = verify_interval
+        self._playback = None
+        self._synced = None
+        self._stale = True
+        self._lock = threading.Lock()
+
+    def playback(self, now=None):
+        """ Get where playback is, as a Playback, syncing first if needed. """
+        if now is None:
+            now = time.monotonic()
+
+        with self._lock:
+            resync = self._needs_sync(now)
+
+        if resync:
+            self.sync()
+            now = time.monotonic()
+
+        with self._lock:
+            return self._interpolate(now)
+
+    def position(self, now=None):
+        """ Get the position in seconds into the current track. """
+        return self.playback(now).position
+
+    def sync(self):
+        """ Fetch the position, duration and play state from the speaker. """
+        # RelTime was read somewhere during the round trip; the midpoint is
+        # the best guess. The play state doesn't age, so it can come after.
+        before = time.monotonic()
+        position = self.soco.get_position_info()
+        synced = (before + time.monotonic()) / 2
+        state = self.soco.get_transport_info().get('CurrentTransportState', '')
+
+        # Streams and line-in have no duration: '0:00:00' or 'NOT_IMPLEMENTED'.
+        playback = Playback(position.get('TrackURI', ''),
+                            position.get('Track', ''),
+                            parse_time(position.get('RelTime')) or 0.0,
+                            parse_time(position.get('TrackDuration')) or None,
+                            state)
+
+        with self._lock:
+            if self._playback is not None and not self._stale and playback.uri == self._playback.uri:
+                # A scheduled check: see how far off we were.
+                self.drift = abs(self._interpolate(synced).position - playback.position)
+                if self._verify_interval is not None:
+                    if self.drift <= self.drift_threshold:
+                        self._verify_interval = min(self._verify_interval * 2, self.max_verify_interval)
+                    else:
+                        self._verify_interval = self.base_verify_interval
+
+            self._playback = playback
+            self._synced = synced
+            self._stale = False
+            self.syncs += 1
+
+        return playback
+
+    def seek(self, seconds):
+        """ Seek to a position in the current track, and follow it from there.
+
+        Returns:
+        Whatever SoCo.seek returned.
+
+        """
+        result = self.soco.seek(format_time(seconds))
+
+        with self._lock:
+            if result is True and self._playback is not None and not self._stale:
+                self._playback = self._playback._replace(position=float(int(seconds)))
+                self._synced = time.monotonic()
+            else:
+                self._stale = True
+
+        return result
+
+    def on_event(self, event):
+        """ Resync on the next read after an AVTransport events.Event.
+
+        Use it as (or call it from) a subscription callback, see subscribe.
+
+        """
+        if event.service == 'AVTransport':
+            with self._lock:
+                self._stale = True
+
+    def subscribe(self, timeout=1800):
+        """ Resync whenever the speaker reports an AVTransport change.
+
+        Returns:
+        The events.Subscription.
+
+        """
+        import events
+
+        return events.subscribe(self.soco.speaker_ip, 'AVTransport', callback=self.on_event, timeout=timeout)
+
+    def _needs_sync(self, now):
+        if self._stale or self._playback is None:
+            return True
+
+        if self._verify_interval is not None and now - self._synced >= self._verify_interval:
+            return True
+
+        # Past the end of the track: the next one has probably started.
+        duration = self._playback.duration
+        return self._playback.state == 'PLAYING' and duration is not None and \
+            self._playback.position + (now - self._synced) > duration
+
+    def _interpolate(self, now):
+        playback = self._playback
+        if playback.state != 'PLAYING':
+            return playback
+
+        position = playback.position + (now - self._synced)
+        if playback.duration is not None:
+            position = min(position, playback.duration)
+
+        return playback._replace(position=position)